@@ -1,9 +1,9 @@
 import streamlit as st
 import importlib.util
 import sys
-import sqlite3
 from PIL import Image
 import os
+from util.database import get_connection, release_connection
 
 # TabulAI - An Interactive Trend Analysis and Visualization Tool for "Artificial Intelligence (AI) Research"
 # Set up the page configuration for Home.py
@@ -13,22 +13,14 @@ st.set_page_config(
 )
 
 
-# Create a database connection to the SQLite database: app_data.db
+# Take a read-only connection to the SQLite database app_data.db from the pool shared by all pages
 def create_connection():
-    conn = None
-    try:
-        conn = sqlite3.connect('data/app_data.db')
-        print(sqlite3.version)
-    except sqlite3.Error as e:
-        print(e)
-    return conn
+    return get_connection()
 
 
-# Function to close the connection
+# Function to give the connection back to the pool
 def close_connection(conn):
-    if conn is not None:
-        conn.close()
-        print('Database connection closed successfully.')
+    release_connection(conn)
 
 
 # Initialize session state
@@ -0,0 +1,94 @@
+"""
+Benchmark of the day numbers of tagged_papers (tagged_papers.day) against the date text column they encode:
+storage size of each representation and latency of a date range filter.
+
+Run from the project root against a built database:
+
+    python benchmarks/bench_compact_columns.py --database data/app_data.db
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from util.encodings import date_to_day  # noqa: E402
+
+# The paper dates stored as text (as imported) and as day numbers, each with the index of the date range filters
+TEXT_SCHEMA = [
+    "CREATE TABLE tagged_papers (id INTEGER PRIMARY KEY, date DATE)",
+    "INSERT INTO tagged_papers SELECT id, date FROM source.tagged_papers",
+    "CREATE INDEX idx_tagged_papers_date ON tagged_papers(date)",
+]
+COMPACT_SCHEMA = [
+    "CREATE TABLE tagged_papers (id INTEGER PRIMARY KEY, day INTEGER)",
+    "INSERT INTO tagged_papers SELECT id, day FROM source.tagged_papers",
+    "CREATE INDEX idx_tagged_papers_day ON tagged_papers(day)",
+]
+
+
+def build_scratch_database(database, directory, name, schema):
+    """Build a scratch database from the source database with the given statements and return its path."""
+    path = os.path.join(directory, f'{name}.db')
+    conn = sqlite3.connect(path)
+    conn.execute("ATTACH DATABASE ? AS source", (database,))
+    for statement in schema:
+        conn.execute(statement)
+    conn.commit()
+    conn.execute("DETACH DATABASE source")
+    conn.execute("VACUUM")
+    conn.close()
+    return path
+
+
+def time_query(conn, query, params, repeat):
+    """Run a query `repeat` times and return the median time in milliseconds and the result."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = conn.execute(query, params).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default='data/app_data.db')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    database = os.path.abspath(args.database)
+
+    conn = sqlite3.connect(database)
+    last_date = conn.execute("SELECT MAX(date) FROM tagged_papers").fetchone()[0]
+    first_date = conn.execute("SELECT date(?, '-1 year')", (last_date,)).fetchone()[0]
+    conn.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = build_scratch_database(database, directory, 'text', TEXT_SCHEMA)
+        compact_path = build_scratch_database(database, directory, 'compact', COMPACT_SCHEMA)
+        text_size = os.path.getsize(text_path)
+        compact_size = os.path.getsize(compact_path)
+        print(f"{'Storage of the paper dates':<40} text {text_size / 2 ** 20:8.1f} MiB   "
+              f"compact {compact_size / 2 ** 20:6.1f} MiB   reduction {1 - compact_size / text_size:6.1%}")
+
+        # Date range, as the pages write it on the date column and on the day numbers
+        text_conn = sqlite3.connect(text_path)
+        text_ms, text_result = time_query(text_conn, "SELECT COUNT(*) FROM tagged_papers WHERE date BETWEEN ? AND ?",
+                                          [first_date, last_date], args.repeat)
+        text_conn.close()
+        compact_conn = sqlite3.connect(compact_path)
+        compact_ms, compact_result = time_query(compact_conn,
+                                                "SELECT COUNT(*) FROM tagged_papers WHERE day BETWEEN ? AND ?",
+                                                [date_to_day(first_date), date_to_day(last_date)], args.repeat)
+        compact_conn.close()
+        print(f"{'Tagged papers in the last year':<40} text {text_ms:9.2f} ms   compact {compact_ms:9.2f} ms   "
+              f"speedup {text_ms / compact_ms:6.1f}x   "
+              f"{'same result' if text_result == compact_result else 'RESULTS DIFFER'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark of the page queries with a new connection per query against the shared pool of read-only connections,
+from several threads at once as when several sessions rerun their pages.
+
+Run from the project root against a built database:
+
+    python benchmarks/bench_connections.py --database data/app_data.db
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from util.database import POOL_SIZE, pool_stats, read_connection  # noqa: E402
+from util.queries import DATE_RANGE, MAX_TOPIC_DEPTH, TOPIC_DESCENDANTS, in_list  # noqa: E402
+
+
+def page_queries(conn, topics):
+    """The queries of a Paper Search rerun before its page: the date range and the descendants of the topics."""
+    conn.execute(DATE_RANGE).fetchone()
+    depth = conn.execute(MAX_TOPIC_DEPTH).fetchone()[0]
+    query = TOPIC_DESCENDANTS.format(placeholders=in_list(topics))
+    return conn.execute(query, list(topics) + [depth]).fetchall()
+
+
+def new_connection_per_rerun(database, topics):
+    conn = sqlite3.connect(database)
+    try:
+        return page_queries(conn, topics)
+    finally:
+        conn.close()
+
+
+def pooled_connection_per_rerun(database, topics):
+    with read_connection(database) as conn:
+        return page_queries(conn, topics)
+
+
+def time_reruns(rerun, database, topics, reruns, threads):
+    """Run `reruns` page reruns on `threads` threads and return the total time in milliseconds."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda _: rerun(database, topics), range(reruns)))
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default='data/app_data.db')
+    parser.add_argument('--reruns', type=int, default=2000)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    topics = [row[0] for row in conn.execute("""
+        SELECT topic FROM topic_descendants GROUP BY topic ORDER BY COUNT(*) DESC LIMIT 3
+    """)]
+    conn.close()
+
+    for threads in [1, POOL_SIZE, 2 * POOL_SIZE]:
+        new_ms = time_reruns(new_connection_per_rerun, args.database, topics, args.reruns, threads)
+        pooled_ms = time_reruns(pooled_connection_per_rerun, args.database, topics, args.reruns, threads)
+        print(f"{args.reruns} reruns on {threads:2} thread(s)   new connection {new_ms:8.1f} ms   "
+              f"pooled {pooled_ms:8.1f} ms   speedup {new_ms / pooled_ms:4.1f}x")
+
+    stats = pool_stats(args.database)
+    print(f"Pool: {stats['opened']} connections opened, {stats['hits']:,} reused, {stats['waits']:,} waits "
+          f"({stats['wait_seconds'] * 1000:.1f} ms in total), {stats['overflows']} overflows, {stats['idle']} idle")
+
+
+if __name__ == '__main__':
+    main()
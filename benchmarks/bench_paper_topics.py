@@ -0,0 +1,158 @@
+"""
+Benchmark of the page queries on the wide topic1..topic5 columns of tagged_papers against the same
+queries on the long-format paper_topics table.
+
+Run from the project root against a built database:
+
+    python benchmarks/bench_paper_topics.py --database data/app_data.db
+"""
+import argparse
+import sqlite3
+import statistics
+import time
+
+
+# TOPIC SEARCH (pages/02_Topic_Search.py)
+TOPIC_SEARCH_WIDE = """
+    SELECT strftime('%Y-%m', tp.date) AS month, COUNT(*)
+    FROM tagged_papers tp
+    JOIN topic_descendants td ON td.descendant IN (tp.topic1, tp.topic2, tp.topic3, tp.topic4, tp.topic5)
+    WHERE tp.date BETWEEN ? AND ?
+        AND td.topic IN (?)
+    GROUP BY month
+    ORDER BY month
+"""
+
+TOPIC_SEARCH_LONG = """
+    SELECT strftime('%Y-%m', pt.date) AS month, COUNT(*)
+    FROM topic_descendants td
+    JOIN topics t ON t.prefLabel = td.descendant
+    JOIN paper_topics pt ON pt.topic_id = t.id
+    WHERE pt.date BETWEEN ? AND ?
+        AND td.topic IN (?)
+    GROUP BY month
+    ORDER BY month
+"""
+
+# PAPER SEARCH (pages/03_Paper_Search.py)
+PAPER_SEARCH_WIDE = """
+    SELECT DISTINCT title, url, strftime('%Y-%m-%d', date) as date
+    FROM tagged_papers
+    WHERE (topic1 IN ({placeholders}) OR
+           topic2 IN ({placeholders}) OR
+           topic3 IN ({placeholders}) OR
+           topic4 IN ({placeholders}) OR
+           topic5 IN ({placeholders}))
+          AND date BETWEEN ? AND ?
+"""
+
+PAPER_SEARCH_LONG = """
+    SELECT title, url, strftime('%Y-%m-%d', date) as date
+    FROM tagged_papers
+    WHERE id IN (
+        SELECT pt.paper_id
+        FROM paper_topics pt
+        WHERE pt.topic_id IN (SELECT id FROM topics WHERE prefLabel IN ({placeholders}))
+          AND pt.date BETWEEN ? AND ?
+    )
+"""
+
+# TOP TRENDS (pages/04_Top_Trends.py)
+TOP_TRENDS_WIDE = """
+    SELECT topic, COUNT(*) AS topic_count
+    FROM (
+        SELECT topic1 AS topic FROM tagged_papers WHERE topic1 IS NOT NULL AND date BETWEEN ?1 AND ?2
+        UNION ALL
+        SELECT topic2 AS topic FROM tagged_papers WHERE topic2 IS NOT NULL AND date BETWEEN ?1 AND ?2
+        UNION ALL
+        SELECT topic3 AS topic FROM tagged_papers WHERE topic3 IS NOT NULL AND date BETWEEN ?1 AND ?2
+        UNION ALL
+        SELECT topic4 AS topic FROM tagged_papers WHERE topic4 IS NOT NULL AND date BETWEEN ?1 AND ?2
+        UNION ALL
+        SELECT topic5 AS topic FROM tagged_papers WHERE topic5 IS NOT NULL AND date BETWEEN ?1 AND ?2
+    ) AS subquery
+    GROUP BY topic
+    ORDER BY topic_count DESC
+    LIMIT ?3
+"""
+
+TOP_TRENDS_LONG = """
+    SELECT t.prefLabel AS topic, COUNT(*) AS topic_count
+    FROM paper_topics pt
+    JOIN topics t ON t.id = pt.topic_id
+    WHERE pt.date BETWEEN ?1 AND ?2
+    GROUP BY pt.topic_id
+    ORDER BY topic_count DESC
+    LIMIT ?3
+"""
+
+
+def time_query(conn, query, params, repeat):
+    """Run a query `repeat` times and return the median time in milliseconds and the last result."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = conn.execute(query, params).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def query_plan(conn, query, params):
+    """Return the EXPLAIN QUERY PLAN of a query as one line per plan step."""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()]
+
+
+def compare(conn, name, wide, long, params_wide, params_long, repeat, show_plans):
+    """Time the wide and long version of a query, check they agree and print the speedup."""
+    wide_ms, wide_result = time_query(conn, wide, params_wide, repeat)
+    long_ms, long_result = time_query(conn, long, params_long, repeat)
+    same = sorted(wide_result, key=repr) == sorted(long_result, key=repr)
+    print(f"{name:<45} wide {wide_ms:9.2f} ms   paper_topics {long_ms:9.2f} ms   "
+          f"speedup {wide_ms / long_ms:6.1f}x   {'same result' if same else 'RESULTS DIFFER'}")
+    if show_plans:
+        for label, query, params in [('wide', wide, params_wide), ('paper_topics', long, params_long)]:
+            print(f"    {label} plan:")
+            for step in query_plan(conn, query, params):
+                print(f"        {step}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default='data/app_data.db')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--topics', type=int, default=3, help="number of (broadest) topics to benchmark")
+    parser.add_argument('--plans', action='store_true', help="also print the query plans")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    start_date, end_date = conn.execute("SELECT MIN(date), MAX(date) FROM tagged_papers").fetchone()
+    last_year = conn.execute("SELECT date(?, '-1 year')", (end_date,)).fetchone()[0]
+
+    # The topics with the most descendants are the slowest to search for
+    broad_topics = [row[0] for row in conn.execute("""
+        SELECT topic FROM topic_descendants GROUP BY topic ORDER BY COUNT(*) DESC LIMIT ?
+    """, (args.topics,))]
+
+    for topic in broad_topics:
+        compare(conn, f"Topic Search: {topic}", TOPIC_SEARCH_WIDE, TOPIC_SEARCH_LONG,
+                (start_date, end_date, topic), (start_date, end_date, topic), args.repeat, args.plans)
+
+        descendants = [row[0] for row in conn.execute(
+            "SELECT DISTINCT descendant FROM topic_descendants WHERE topic = ?", (topic,))] + [topic]
+        placeholders = ','.join(['?'] * len(descendants))
+        compare(conn, f"Paper Search: {topic} ({len(descendants)} topics)",
+                PAPER_SEARCH_WIDE.format(placeholders=placeholders),
+                PAPER_SEARCH_LONG.format(placeholders=placeholders),
+                descendants * 5 + [start_date, end_date], descendants + [start_date, end_date],
+                args.repeat, args.plans)
+
+    for label, window_start in [('full range', start_date), ('last year', last_year)]:
+        compare(conn, f"Top Trends: top 10, {label}", TOP_TRENDS_WIDE, TOP_TRENDS_LONG,
+                (window_start, end_date, 10), (window_start, end_date, 10), args.repeat, args.plans)
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark of the similar papers search: recall@10 and time per query of the IVF index for several numbers of lists
+probed (nprobe), against scoring every paper vector.
+
+Run from the project root after building the paper vectors (python db_manager.py in the data folder):
+
+    python benchmarks/bench_similar.py
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from util.snapshot import array_version  # noqa: E402
+from util.similar import (SIMILAR_LIMIT, brute_force_search, open_vector_index,  # noqa: E402
+                          recall_at_k, search)
+
+
+def time_search(function, index, queries, **kwargs):
+    """Run a search and return its results and the time per query in milliseconds."""
+    start = time.perf_counter()
+    paper_ids, _ = function(index, queries, **kwargs)
+    return paper_ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--snapshot', default='data/snapshot')
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=SIMILAR_LIMIT)
+    args = parser.parse_args()
+
+    index = open_vector_index(args.snapshot, (array_version('vectors', args.snapshot),))
+    matrix = index['matrix']
+    print(f"{len(matrix):,} paper vectors x {matrix.shape[1]} dimensions in {len(index['centroids']):,} lists")
+
+    # The queries are papers of the index, as for "More like this"
+    rows = np.random.default_rng(0).choice(len(matrix), min(args.queries, len(matrix)), replace=False)
+    queries = np.asarray(matrix[np.sort(rows)])
+
+    exact_ids, exact_ms = time_search(brute_force_search, index, queries, k=args.k)
+    print(f"brute force      {exact_ms:7.3f} ms/query")
+    for nprobe in [1, 2, 4, 8, 16, 32, 64]:
+        if nprobe > len(index['centroids']):
+            break
+        batch_ids, batch_ms = time_search(search, index, queries, k=args.k, nprobe=nprobe)
+        start = time.perf_counter()
+        for query in queries[:100]:
+            search(index, query[None, :], k=args.k, nprobe=nprobe)
+        single_ms = (time.perf_counter() - start) * 1000 / len(queries[:100])
+        print(f"nprobe {nprobe:3}       {batch_ms:7.3f} ms/query in a batch   "
+              f"{single_ms:7.3f} ms/query one at a time   recall@{args.k} {recall_at_k(batch_ids, exact_ids):.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark of Top Trends over random date ranges: the TOP_TOPICS query against the cumulative trend counts, checking
+that both give the same counts.
+
+Run from the project root after building the trend counts (python db_manager.py in the data folder):
+
+    python benchmarks/bench_top_trends.py --database data/app_data.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from util.encodings import day_to_date  # noqa: E402
+from util.queries import TOP_TOPICS  # noqa: E402
+from util.snapshot import array_version  # noqa: E402
+from util.trends import open_trend_counts, top_topics  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default='data/app_data.db')
+    parser.add_argument('--snapshot', default='data/snapshot')
+    parser.add_argument('--ranges', type=int, default=200)
+    parser.add_argument('--topics', type=int, default=10)
+    args = parser.parse_args()
+
+    version = (array_version('trends', args.snapshot), array_version('rollup', args.snapshot))
+    trends = open_trend_counts(args.snapshot, version)
+    first_day = trends['first_day']
+    last_day = first_day + len(trends['cumulative']) - 2
+    conn = sqlite3.connect(args.database)
+
+    rng = random.Random(0)
+    sql_seconds = prefix_seconds = 0.0
+    mismatches = 0
+    for _ in range(args.ranges):
+        start_day = rng.randint(first_day, last_day)
+        end_day = rng.randint(start_day, last_day)
+        params = [day_to_date(start_day).isoformat(), day_to_date(end_day).isoformat(), args.topics]
+
+        start_time = time.perf_counter()
+        sql_counts = [count for _, count in conn.execute(TOP_TOPICS, params).fetchall()]
+        sql_seconds += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        prefix_counts = [count for _, count in top_topics(trends, start_day, end_day, args.topics)]
+        prefix_seconds += time.perf_counter() - start_time
+        mismatches += sql_counts != prefix_counts
+
+    conn.close()
+    print(f"{args.ranges} random ranges of {last_day - first_day + 1:,} days, top {args.topics} of "
+          f"{trends['cumulative'].shape[1]:,} topics")
+    print(f"TOP_TOPICS query   {sql_seconds * 1000 / args.ranges:8.3f} ms/range")
+    print(f"Cumulative counts  {prefix_seconds * 1000 / args.ranges:8.3f} ms/range   "
+          f"speedup {sql_seconds / prefix_seconds:5.1f}x   {mismatches} ranges with different counts")
+
+
+if __name__ == '__main__':
+    main()
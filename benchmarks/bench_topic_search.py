@@ -0,0 +1,117 @@
+"""
+Benchmark of the Topic Search chart: one query and one gap-filling step per selected topic against a single
+query for all selected topics and one reindex over a shared index of months.
+
+Run from the project root against a built database:
+
+    python benchmarks/bench_topic_search.py --database data/app_data.db
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from util.encodings import PERIOD_FREQUENCIES, period_start  # noqa: E402
+from util.queries import TOPIC_SERIES_COUNTS, in_list  # noqa: E402
+from util.topic_series import series_frame  # noqa: E402
+
+# Query for one topic at a time, as issued by the page before the series were batched
+TOPIC_PERIOD_COUNTS = """
+    SELECT bucket, SUM(tags)
+    FROM topic_period_counts
+    WHERE topic_id IN (SELECT id FROM topics WHERE prefLabel IN (?))
+        AND period = ?
+        AND bucket BETWEEN ? AND ?
+        AND depth <= ?
+    GROUP BY bucket
+    ORDER BY bucket
+"""
+
+
+def chart_per_topic(conn, topics, period, first_bucket, last_bucket, depth):
+    """Build the chart with a query, a date_range, a merge and a fillna per topic."""
+    fig = px.line()
+    series = {}
+    for topic in topics:
+        data = conn.execute(TOPIC_PERIOD_COUNTS, (topic, period, first_bucket, last_bucket, depth)).fetchall()
+        if not data:
+            continue
+        df = pd.DataFrame(data, columns=['period', 'count'])
+        df['period'] = pd.to_datetime(df['period'], unit='D')
+        df.set_index('period', inplace=True)
+        all_periods = pd.date_range(start=df.index.min(), end=df.index.max(), freq=PERIOD_FREQUENCIES[period])
+        df_all_periods = pd.DataFrame(index=all_periods)
+        df_merged = df_all_periods.merge(df, how='left', left_index=True, right_index=True)
+        df_merged['count'] = df_merged['count'].fillna(0)
+        fig.add_scatter(x=df_merged.index, y=df_merged['count'], mode='lines+markers', name=topic)
+        series[topic] = df_merged['count'].astype(int)
+    return fig, series
+
+
+def chart_batched(conn, topics, period, first_bucket, last_bucket, depth):
+    """Build the chart with one query for all topics, one reindex and one figure from the wide frame."""
+    query = TOPIC_SERIES_COUNTS.format(placeholders=in_list(topics))
+    data = conn.execute(query, list(topics) + [period, first_bucket, last_bucket, depth]).fetchall()
+    df = series_frame(data, topics, period)
+    fig = go.Figure([go.Scatter(x=df.index, y=df[topic], mode='lines+markers', name=topic) for topic in df.columns])
+    return fig, {topic: df[topic] for topic in df.columns}
+
+
+def time_chart(build, repeat, *args):
+    """Build a chart `repeat` times and return the median time in milliseconds and the last series."""
+    timings = []
+    series = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _, series = build(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), series
+
+
+def same_series(per_topic, batched):
+    """The batched series span every topic's periods, so they agree where the per-topic series are defined."""
+    return per_topic.keys() == batched.keys() and all(
+        batched[topic].reindex(series.index).astype(int).equals(series.rename_axis('period'))
+        for topic, series in per_topic.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default='data/app_data.db')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--period', default='month', choices=list(PERIOD_FREQUENCIES))
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    start_date, end_date, depth = conn.execute("""
+        SELECT (SELECT MIN(date) FROM tagged_papers), (SELECT MAX(date) FROM tagged_papers),
+               (SELECT MAX(level) FROM topics) - (SELECT MIN(level) FROM topics)
+    """).fetchone()
+    first_bucket, last_bucket = period_start(start_date, args.period), period_start(end_date, args.period)
+
+    # The topics with the most descendants, the ones a user is most likely to compare
+    broad_topics = [row[0] for row in conn.execute("""
+        SELECT topic FROM topic_descendants GROUP BY topic ORDER BY COUNT(*) DESC LIMIT 5
+    """)]
+
+    for count in range(1, len(broad_topics) + 1):
+        topics = broad_topics[:count]
+        chart_args = (conn, topics, args.period, first_bucket, last_bucket, depth)
+        per_topic_ms, per_topic = time_chart(chart_per_topic, args.repeat, *chart_args)
+        batched_ms, batched = time_chart(chart_batched, args.repeat, *chart_args)
+        print(f"Topic Search, {count} topic(s), full range per {args.period:<8} per topic {per_topic_ms:8.2f} ms   "
+              f"batched {batched_ms:8.2f} ms   speedup {per_topic_ms / batched_ms:5.1f}x   "
+              f"{'same series' if same_series(per_topic, batched) else 'SERIES DIFFER'}")
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
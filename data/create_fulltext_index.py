@@ -0,0 +1,108 @@
+import sqlite3
+import time
+from create_paper_topics import create_connection
+
+# Full-text index of the titles and abstracts of tagged_papers, the papers listed by Paper Search. It is an
+# external-content FTS5 table: it stores only the index and reads the text from tagged_papers by rowid (the id
+# column). Triggers keep it in sync with every insert, update and delete of tagged_papers.
+FULLTEXT_TABLE = 'tagged_papers_fts'
+
+# Ranking of the matches (the rank column): BM25, with a match in the title weighted ten times one in the abstract
+FULLTEXT_RANK = 'bm25(10.0, 1.0)'
+
+FULLTEXT_TRIGGERS = {
+    'tagged_papers_fts_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS tagged_papers_fts_insert AFTER INSERT ON tagged_papers BEGIN
+            INSERT INTO {FULLTEXT_TABLE} (rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+        END
+    """,
+    'tagged_papers_fts_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS tagged_papers_fts_delete AFTER DELETE ON tagged_papers BEGIN
+            INSERT INTO {FULLTEXT_TABLE} ({FULLTEXT_TABLE}, rowid, title, abstract)
+            VALUES ('delete', old.id, old.title, old.abstract);
+        END
+    """,
+    'tagged_papers_fts_update': f"""
+        CREATE TRIGGER IF NOT EXISTS tagged_papers_fts_update AFTER UPDATE OF title, abstract ON tagged_papers BEGIN
+            INSERT INTO {FULLTEXT_TABLE} ({FULLTEXT_TABLE}, rowid, title, abstract)
+            VALUES ('delete', old.id, old.title, old.abstract);
+            INSERT INTO {FULLTEXT_TABLE} (rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+        END
+    """,
+}
+
+
+def fulltext_index_exists(cursor):
+    """ Return whether the full-text table and its triggers exist """
+    cursor.execute("SELECT name FROM sqlite_master WHERE name = ? OR type = 'trigger'", (FULLTEXT_TABLE,))
+    names = {row[0] for row in cursor.fetchall()}
+    return FULLTEXT_TABLE in names and set(FULLTEXT_TRIGGERS) <= names
+
+
+def drop_fulltext_triggers(conn):
+    """
+    Drop the triggers before tagged_papers is reloaded in bulk; build_fulltext_index indexes all rows at once
+    afterwards, which is much faster than updating the index row by row.
+    """
+    try:
+        for name in FULLTEXT_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.commit()
+    except sqlite3.Error as e:
+        print(e)
+
+
+def build_fulltext_index(conn):
+    """
+    Create the full-text table if needed, index every row of tagged_papers and create the sync triggers.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    """
+    start_time = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {FULLTEXT_TABLE} USING fts5(
+                title, abstract,
+                content='tagged_papers', content_rowid='id',
+                tokenize='porter unicode61 remove_diacritics 2'
+            )
+        """)
+        cursor.execute(f"INSERT INTO {FULLTEXT_TABLE} ({FULLTEXT_TABLE}, rank) VALUES ('rank', ?)", (FULLTEXT_RANK,))
+        cursor.execute(f"INSERT INTO {FULLTEXT_TABLE} ({FULLTEXT_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FULLTEXT_TABLE} ({FULLTEXT_TABLE}) VALUES ('optimize')")
+        for trigger_sql in FULLTEXT_TRIGGERS.values():
+            cursor.execute(trigger_sql)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(e)
+        return
+    print(f"Finished building the full-text index of tagged_papers in {time.perf_counter() - start_time:.2f}s.")
+
+
+def refresh_fulltext_index(conn):
+    """
+    Make sure the full-text index is up to date after an incremental ingest. The triggers have already indexed
+    the changed rows, so the index is only built if it didn't exist (or had no triggers) during the ingest.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    """
+    if not fulltext_index_exists(conn.cursor()):
+        build_fulltext_index(conn)
+
+
+def main():
+    database_path = 'app_data.db'
+    conn = create_connection(database_path)
+    if conn is not None:
+        build_fulltext_index(conn)
+        conn.close()
+    else:
+        print("Error! cannot create the database connection.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import sqlite3
+
+
+def create_connection(db_file):
+    """ Create a database connection to the SQLite database specified by db_file """
+    conn = None
+    try:
+        conn = sqlite3.connect(db_file)
+        return conn
+    except sqlite3.Error as e:
+        print(e)
+    return conn
+
+
+# Number of topic columns (topic1..topic5) in tagged_papers
+TOPIC_COLUMNS = 5
+
+# Julian day number of 1970-01-01, the epoch of tagged_papers.day and of the day numbers of the derived tables
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+
+
+def day_expression(column):
+    """ SQL expression for the day number (days since 1970-01-01) of a DATE column; the time of day is ignored """
+    return f"CAST(julianday(date({column})) - {UNIX_EPOCH_JULIAN_DAY} AS INTEGER)"
+
+
+def create_topic_ids_table(cursor):
+    """ Map each topic label to the id of its topics row (the lowest id if a label occurs more than once) """
+    cursor.execute("DROP TABLE IF EXISTS temp.topic_ids")
+    cursor.execute("""
+        CREATE TEMP TABLE topic_ids AS
+        SELECT prefLabel, MIN(id) AS id FROM topics GROUP BY prefLabel
+    """)
+    cursor.execute("CREATE UNIQUE INDEX temp.idx_topic_ids_prefLabel ON topic_ids(prefLabel)")
+
+
+def encode_days(cursor, paper_filter=""):
+    """
+    Fill tagged_papers.day, the day number of each paper's date, read by the topic postings.
+
+    Parameters:
+    cursor (sqlite3.Cursor): Cursor of the database connection
+    paper_filter (str): Optional SQL condition on tagged_papers restricting the rows to encode
+    """
+    cursor.execute(f"""
+        UPDATE tagged_papers SET day = {day_expression('date')}
+        {'WHERE ' + paper_filter if paper_filter else ''}
+    """)
+
+
+def insert_paper_topics(cursor, paper_filter=""):
+    """
+    Insert the (paper, rank, topic) rows of tagged_papers into paper_topics.
+
+    Parameters:
+    cursor (sqlite3.Cursor): Cursor of the database connection, with the temp.topic_ids table created
+    paper_filter (str): Optional SQL condition on tagged_papers (alias tp) restricting the papers to insert
+    """
+    for rank in range(1, TOPIC_COLUMNS + 1):
+        cursor.execute(f"""
+            INSERT INTO paper_topics (paper_id, rank, topic_id, date)
+            SELECT tp.id, {rank}, ti.id, tp.date
+            FROM tagged_papers tp
+            JOIN topic_ids ti ON ti.prefLabel = tp.topic{rank}
+            {'WHERE ' + paper_filter if paper_filter else ''}
+        """)
+
+
+def build_paper_topics(conn):
+    """
+    Rebuild the paper_topics table from the topic1..topic5 columns of tagged_papers, and the day numbers of the papers.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+
+    Returns:
+    int: Number of rows in paper_topics
+    """
+    try:
+        cursor = conn.cursor()
+        create_topic_ids_table(cursor)
+        cursor.execute("DELETE FROM paper_topics")
+        insert_paper_topics(cursor)
+        encode_days(cursor)
+        conn.commit()
+
+        cursor.execute("SELECT COUNT(*) FROM paper_topics")
+        rows = cursor.fetchone()[0]
+        # Labels that don't match any topic can't be searched for, so they are worth knowing about
+        unmatched = ' UNION ALL '.join(
+            f"SELECT topic{rank} AS label FROM tagged_papers WHERE topic{rank} IS NOT NULL"
+            for rank in range(1, TOPIC_COLUMNS + 1))
+        cursor.execute(f"""
+            SELECT COUNT(*) FROM ({unmatched}) l
+            WHERE NOT EXISTS (SELECT 1 FROM topic_ids ti WHERE ti.prefLabel = l.label)
+        """)
+        unmatched_count = cursor.fetchone()[0]
+        print(f"Finished populating the paper_topics table: {rows:,} rows, "
+              f"{unmatched_count:,} topic labels without a matching topic.")
+        return rows
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(e)
+        return None
+
+
+def refresh_paper_topics(conn, urls):
+    """
+    Refresh the paper_topics rows of the given papers after they were inserted or updated in tagged_papers.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    urls (list): URLs of the changed tagged_papers rows
+    """
+    if not urls:
+        return
+    try:
+        cursor = conn.cursor()
+        create_topic_ids_table(cursor)
+        cursor.execute("DROP TABLE IF EXISTS temp.changed_papers")
+        cursor.execute("CREATE TEMP TABLE changed_papers (url TEXT PRIMARY KEY)")
+        cursor.executemany("INSERT OR IGNORE INTO changed_papers (url) VALUES (?)", [(url,) for url in urls])
+        cursor.execute("""
+            DELETE FROM paper_topics
+            WHERE paper_id IN (SELECT id FROM tagged_papers WHERE url IN (SELECT url FROM changed_papers))
+        """)
+        insert_paper_topics(cursor, "tp.url IN (SELECT url FROM changed_papers)")
+        encode_days(cursor, "url IN (SELECT url FROM changed_papers)")
+        conn.commit()
+        print(f"Refreshed the paper_topics rows of {len(urls):,} papers.")
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(e)
+
+
+def main():
+    database_path = 'app_data.db'
+    conn = create_connection(database_path)
+    if conn is not None:
+        build_paper_topics(conn)
+        conn.close()
+    else:
+        print("Error! cannot create the database connection.")
+
+
+if __name__ == "__main__":
+    main()
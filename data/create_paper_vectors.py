@@ -0,0 +1,376 @@
+import sqlite3
+import os
+import re
+import time
+from collections import Counter
+import numpy as np
+from snapshot_arrays import SNAPSHOT_DIR, create_connection, save_arrays
+
+# PAPER VECTORS for the "similar papers" search of Paper Search, computed from the titles and abstracts of
+# tagged_papers without any network access or model download:
+# 1. TF-IDF over the VOCABULARY_SIZE most common words (sublinear term frequency, rows of unit length)
+# 2. Latent semantic analysis: a randomized SVD of a sample of the TF-IDF rows gives VECTOR_DIMENSIONS components,
+#    and every paper is projected onto them, so that papers using related words end up close
+# 3. An IVF index: spherical k-means splits the vectors into lists around centroids. A query only scores the
+#    vectors of the lists whose centroids are closest to it.
+#
+# Arrays written to the snapshot directory as vectors_<name>.npy:
+# - matrix: float32 unit vectors of the papers (rows x VECTOR_DIMENSIONS), ordered by IVF list so that every list
+#   is a contiguous slice of the memory-mapped file
+# - paper_ids: the paper id of each row; rows: the row of each paper id, -1 if the paper has no vector
+# - centroids: unit vectors of the IVF lists; list_indptr: the rows of list l are list_indptr[l]:list_indptr[l + 1]
+# - terms, idf, components: the vocabulary, its IDF weights and the LSA components, to vectorize free-text queries
+# - token_pattern, stop_words: the settings of tokenize, so that queries are split into words like the papers were
+VECTOR_ARRAYS = ['matrix', 'paper_ids', 'rows', 'centroids', 'list_indptr', 'terms', 'idf', 'components',
+                 'token_pattern', 'stop_words']
+
+VOCABULARY_SIZE = 50_000
+VECTOR_DIMENSIONS = 128
+SVD_SAMPLE_PAPERS = 50_000
+SVD_OVERSAMPLING = 10
+SVD_POWER_ITERATIONS = 2
+KMEANS_SAMPLE_PAPERS = 100_000
+KMEANS_ITERATIONS = 10
+CHUNK_PAPERS = 2_000
+SEED = 0
+
+# Words of at least two characters, starting with a letter
+TOKEN_PATTERN = r"[a-z][a-z0-9]+"
+
+# Words too common in abstracts to tell papers apart
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'for', 'from', 'has', 'have', 'in', 'is', 'it', 'its',
+    'of', 'on', 'or', 'our', 'that', 'the', 'their', 'these', 'this', 'to', 'we', 'which', 'with',
+}
+
+
+def tokenize(text, token_pattern=TOKEN_PATTERN, stop_words=STOP_WORDS):
+    """ Split a title or abstract into lowercase words, without stop words and single characters """
+    return [word for word in re.findall(token_pattern, (text or '').lower()) if word not in stop_words]
+
+
+def tokenizer_arrays():
+    """ The settings of tokenize as the token_pattern and stop_words arrays of the index """
+    return {'token_pattern': np.array([TOKEN_PATTERN]), 'stop_words': np.array(sorted(STOP_WORDS))}
+
+
+def read_papers(cursor, step=1):
+    """ Yield (id, words of the title and abstract) of every `step`-th tagged paper, by id """
+    cursor.execute("SELECT id, title, abstract FROM tagged_papers ORDER BY id")
+    for position, (paper_id, title, abstract) in enumerate(cursor):
+        if position % step == 0:
+            yield paper_id, tokenize(title) + tokenize(abstract)
+
+
+def build_vocabulary(cursor):
+    """
+    Count the papers using each word and keep the VOCABULARY_SIZE most common ones used by at least two papers.
+    Words used by most papers are not dropped, their IDF weight is low.
+
+    Returns:
+    tuple: (terms, their IDF weights, number of papers)
+    """
+    document_frequency = Counter()
+    papers = 0
+    for _, words in read_papers(cursor):
+        document_frequency.update(set(words))
+        papers += 1
+    terms = [term for term, count in document_frequency.most_common(VOCABULARY_SIZE) if count >= 2]
+    counts = np.array([document_frequency[term] for term in terms], dtype=np.float64)
+    idf = np.log((1 + papers) / (1 + counts)) + 1
+    return np.array(terms), idf.astype(np.float32), papers
+
+
+def tfidf_rows(documents, term_index, idf):
+    """
+    Build the TF-IDF rows of some documents as a sparse matrix in CSR form.
+
+    Parameters:
+    documents (list): Lists of words
+    term_index (dict): Column of each vocabulary term
+    idf (np.ndarray): IDF weight of each column
+
+    Returns:
+    tuple: (indptr, indices, data) of the rows, each of unit length
+    """
+    indptr = [0]
+    indices = []
+    counts = []
+    for words in documents:
+        columns, column_counts = np.unique([term_index[word] for word in words if word in term_index],
+                                           return_counts=True)
+        indices.append(columns.astype(np.int64))
+        counts.append(column_counts)
+        indptr.append(indptr[-1] + len(columns))
+    indptr = np.array(indptr, dtype=np.int64)
+    indices = np.concatenate(indices) if indices else np.empty(0, dtype=np.int64)
+    data = (1 + np.log(np.concatenate(counts) if counts else np.empty(0))) * idf[indices]
+    row_norms = np.sqrt(row_sums(indptr, data ** 2))
+    row_norms[row_norms == 0] = 1
+    return indptr, indices, (data / np.repeat(row_norms, np.diff(indptr))).astype(np.float32)
+
+
+def row_sums(indptr, values):
+    """ Sum the values of the entries of each CSR row (rows without entries sum to 0) """
+    lengths = np.diff(indptr)
+    sums = np.zeros((len(lengths),) + values.shape[1:], dtype=values.dtype)
+    if values.size:
+        # reduceat sums up to the next start, so only the starts of rows with entries are passed
+        sums[lengths > 0] = np.add.reduceat(values, indptr[:-1][lengths > 0])
+    return sums
+
+
+def row_chunks(rows):
+    """ Yield (first row, CSR rows) of chunks of CHUNK_PAPERS rows, to bound the memory of the products below """
+    indptr, indices, data = rows
+    for start in range(0, len(indptr) - 1, CHUNK_PAPERS):
+        chunk_indptr = indptr[start:start + CHUNK_PAPERS + 1]
+        first, last = chunk_indptr[0], chunk_indptr[-1]
+        yield start, (chunk_indptr - first, indices[first:last], data[first:last])
+
+
+def sparse_dot(rows, dense):
+    """ Multiply CSR rows by a dense matrix """
+    product = np.zeros((len(rows[0]) - 1, dense.shape[1]), dtype=np.float32)
+    for start, (indptr, indices, data) in row_chunks(rows):
+        product[start:start + len(indptr) - 1] = row_sums(indptr, data[:, None] * dense[indices])
+    return product
+
+
+def sparse_transpose_dot(rows, dense, columns):
+    """ Multiply the transpose of CSR rows by a dense matrix with one row per CSR row """
+    product = np.zeros((columns, dense.shape[1]), dtype=np.float32)
+    for start, (indptr, indices, data) in row_chunks(rows):
+        entry_rows = start + np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        # Entries sorted by column, so that the contributions to each column are summed with one reduceat
+        order = np.argsort(indices, kind='stable')
+        sorted_columns = indices[order]
+        contributions = data[order, None] * dense[entry_rows[order]]
+        unique_columns, starts = np.unique(sorted_columns, return_index=True)
+        if len(unique_columns):
+            product[unique_columns] += np.add.reduceat(contributions, starts)
+    return product
+
+
+def compute_components(rows, columns, dimensions, rng):
+    """
+    Compute the LSA components of TF-IDF rows with a randomized SVD (Halko, Martinsson and Tropp).
+
+    Parameters:
+    rows (tuple): CSR rows of a sample of the papers
+    columns (int): Number of vocabulary terms
+    dimensions (int): Number of components
+    rng (np.random.Generator): Random number generator
+
+    Returns:
+    np.ndarray: The components, one column per dimension (columns x dimensions)
+    """
+    sketch = rng.standard_normal((columns, dimensions + SVD_OVERSAMPLING)).astype(np.float32)
+    basis = np.linalg.qr(sparse_dot(rows, sketch))[0]
+    for _ in range(SVD_POWER_ITERATIONS):
+        basis = np.linalg.qr(sparse_transpose_dot(rows, basis, columns))[0]
+        basis = np.linalg.qr(sparse_dot(rows, basis))[0]
+    projected = sparse_transpose_dot(rows, basis, columns).T
+    _, _, right = np.linalg.svd(projected, full_matrices=False)
+    return np.ascontiguousarray(right[:dimensions].T, dtype=np.float32)
+
+
+def normalize_rows(vectors):
+    """ Scale every row to unit length; rows of zeros stay zero """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def train_centroids(vectors, lists, rng):
+    """
+    Spherical k-means: centroids of unit length maximizing the cosine similarity of the vectors to their centroid.
+
+    Parameters:
+    vectors (np.ndarray): Unit vectors of a sample of the papers
+    lists (int): Number of centroids
+    rng (np.random.Generator): Random number generator
+
+    Returns:
+    np.ndarray: The centroids (lists x dimensions)
+    """
+    centroids = vectors[rng.choice(len(vectors), lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = assign_lists(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        # An empty list keeps its centroid
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+def assign_lists(vectors, centroids):
+    """ Return the closest centroid of every vector, in chunks """
+    return np.concatenate([np.argmax(vectors[start:start + CHUNK_PAPERS] @ centroids.T, axis=1)
+                           for start in range(0, len(vectors), CHUNK_PAPERS)] or [np.empty(0, dtype=np.int64)])
+
+
+def write_paper_vectors(conn, directory=SNAPSHOT_DIR):
+    """
+    Vectorize the titles and abstracts of tagged_papers, build the IVF index and write the arrays to the snapshot
+    directory. The matrix is streamed to disk as a memory-mapped file, so only a chunk of vectors is in memory.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    directory (str): Directory the .npy files are written to
+    """
+    start_time = time.perf_counter()
+    rng = np.random.default_rng(SEED)
+    os.makedirs(directory, exist_ok=True)
+    try:
+        cursor = conn.cursor()
+        terms, idf, papers = build_vocabulary(cursor)
+        if papers == 0 or len(terms) == 0:
+            print("No tagged papers to vectorize.")
+            return
+        term_index = {term: column for column, term in enumerate(terms)}
+        dimensions = min(VECTOR_DIMENSIONS, len(terms))
+
+        sample = [words for _, words in read_papers(cursor, step=max(papers // SVD_SAMPLE_PAPERS, 1))]
+        components = compute_components(tfidf_rows(sample, term_index, idf), len(terms), dimensions, rng)
+
+        # Vectors in id order, to a scratch file that is reordered by IVF list below
+        scratch_path = os.path.join(directory, "vectors_unordered.npy.tmp")
+        unordered = np.lib.format.open_memmap(scratch_path, mode='w+', dtype=np.float32, shape=(papers, dimensions))
+        paper_ids = np.empty(papers, dtype=np.int64)
+        chunk_ids, chunk_documents, row = [], [], 0
+        for paper_id, words in read_papers(cursor):
+            chunk_ids.append(paper_id)
+            chunk_documents.append(words)
+            if len(chunk_ids) == CHUNK_PAPERS or row + len(chunk_ids) == papers:
+                vectors = sparse_dot(tfidf_rows(chunk_documents, term_index, idf), components)
+                unordered[row:row + len(chunk_ids)] = normalize_rows(vectors)
+                paper_ids[row:row + len(chunk_ids)] = chunk_ids
+                row += len(chunk_ids)
+                chunk_ids, chunk_documents = [], []
+    except sqlite3.Error as e:
+        print(e)
+        return
+
+    # IVF lists: about 4 * sqrt(papers) lists, trained on a sample
+    lists = int(min(max(4 * np.sqrt(papers), 1), papers))
+    sample_rows = np.sort(rng.choice(papers, min(papers, KMEANS_SAMPLE_PAPERS), replace=False))
+    centroids = train_centroids(np.asarray(unordered[sample_rows]), lists, rng)
+    assignment = assign_lists(unordered, centroids)
+    order = np.argsort(assignment, kind='stable')
+    list_indptr = np.zeros(lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignment, minlength=lists), out=list_indptr[1:])
+
+    matrix_path = os.path.join(directory, "vectors_matrix.npy")
+    matrix = np.lib.format.open_memmap(f"{matrix_path}.tmp", mode='w+', dtype=np.float32, shape=(papers, dimensions))
+    for start in range(0, papers, CHUNK_PAPERS):
+        matrix[start:start + CHUNK_PAPERS] = unordered[order[start:start + CHUNK_PAPERS]]
+    matrix.flush()
+    del matrix, unordered
+    os.remove(scratch_path)
+
+    ordered_ids = paper_ids[order]
+    rows = np.full(int(ordered_ids.max()) + 1, -1, dtype=np.int32)
+    rows[ordered_ids] = np.arange(papers, dtype=np.int32)
+    save_arrays(directory, 'vectors', {
+        'paper_ids': ordered_ids.astype(np.int32), 'rows': rows, 'centroids': centroids, 'list_indptr': list_indptr,
+        'terms': terms, 'idf': idf, 'components': components, **tokenizer_arrays()}, written=['matrix'])
+    print(f"Paper vectors written: {papers:,} papers x {dimensions} dimensions over {len(terms):,} terms, "
+          f"{lists:,} IVF lists in {time.perf_counter() - start_time:.2f}s.")
+
+
+def update_paper_vectors(conn, urls, directory=SNAPSHOT_DIR):
+    """
+    Vectorize the tagged papers changed by an incremental ingest and add them to their IVF lists, replacing the
+    previous vectors of updated papers. The vocabulary, IDF weights, components and centroids of the last full build
+    are kept, so nothing is trained again; words that are not in the vocabulary yet are ignored until the next full
+    build. Builds the whole index if it hasn't been built or was built with a different tokenizer.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    urls (list): URLs of the changed tagged_papers rows
+    directory (str): Directory of the .npy files
+    """
+    paths = {name: os.path.join(directory, f"vectors_{name}.npy") for name in VECTOR_ARRAYS}
+    if not all(os.path.isfile(path) for path in paths.values()):
+        write_paper_vectors(conn, directory)
+        return
+    index = {name: np.load(path, mmap_mode='r' if name == 'matrix' else None) for name, path in paths.items()}
+    if any(not np.array_equal(index[name], array) for name, array in tokenizer_arrays().items()):
+        write_paper_vectors(conn, directory)
+        return
+    if not urls:
+        return
+    start_time = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DROP TABLE IF EXISTS temp.changed_papers")
+        cursor.execute("CREATE TEMP TABLE changed_papers (url TEXT PRIMARY KEY)")
+        cursor.executemany("INSERT OR IGNORE INTO changed_papers (url) VALUES (?)", [(url,) for url in urls])
+        cursor.execute("""
+            SELECT id, title, abstract FROM tagged_papers
+            WHERE url IN (SELECT url FROM changed_papers)
+            ORDER BY id
+        """)
+        changed = [(paper_id, tokenize(title) + tokenize(abstract)) for paper_id, title, abstract in cursor.fetchall()]
+        cursor.execute("DROP TABLE temp.changed_papers")
+    except sqlite3.Error as e:
+        print(e)
+        return
+    if not changed:
+        return
+
+    term_index = {term: column for column, term in enumerate(index['terms'].tolist())}
+    changed_ids = np.array([paper_id for paper_id, _ in changed], dtype=np.int64)
+    vectors = normalize_rows(sparse_dot(tfidf_rows([words for _, words in changed], term_index, index['idf']),
+                                        index['components'])).astype(np.float32)
+    assignment = assign_lists(vectors, index['centroids'])
+
+    # The rows of the new matrix are the old rows of the unchanged papers and then the changed papers, ordered by
+    # list; the sort is stable, so the old rows stay in file order and are copied sequentially
+    keep = ~np.isin(index['paper_ids'], changed_ids)
+    lists = len(index['centroids'])
+    old_lists = np.repeat(np.arange(lists), np.diff(index['list_indptr']))
+    source_lists = np.concatenate([old_lists[keep], assignment])
+    order = np.argsort(source_lists, kind='stable')
+    # Sources >= 0 are rows of the old matrix, sources < 0 rows of the new vectors
+    sources = np.concatenate([np.flatnonzero(keep), -1 - np.arange(len(vectors))])[order]
+    list_indptr = np.zeros(lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(source_lists, minlength=lists), out=list_indptr[1:])
+
+    old_matrix = index['matrix']
+    matrix_path = paths['matrix']
+    matrix = np.lib.format.open_memmap(f"{matrix_path}.tmp", mode='w+', dtype=np.float32,
+                                       shape=(len(sources), old_matrix.shape[1]))
+    for start in range(0, len(sources), CHUNK_PAPERS):
+        chunk = sources[start:start + CHUNK_PAPERS]
+        old = chunk >= 0
+        chunk_rows = np.empty((len(chunk), old_matrix.shape[1]), dtype=np.float32)
+        chunk_rows[old] = old_matrix[chunk[old]]
+        chunk_rows[~old] = vectors[-1 - chunk[~old]]
+        matrix[start:start + len(chunk)] = chunk_rows
+    matrix.flush()
+    del matrix, old_matrix
+
+    paper_ids = np.concatenate([index['paper_ids'][keep], changed_ids])[order]
+    rows = np.full(int(paper_ids.max()) + 1, -1, dtype=np.int32)
+    rows[paper_ids] = np.arange(len(paper_ids), dtype=np.int32)
+    save_arrays(directory, 'vectors', {'paper_ids': paper_ids.astype(np.int32), 'rows': rows,
+                                       'list_indptr': list_indptr}, written=['matrix'])
+    print(f"Paper vectors updated: {len(changed):,} papers added to their IVF lists, {len(paper_ids):,} papers in "
+          f"{time.perf_counter() - start_time:.2f}s.")
+
+
+def main():
+    database_path = 'app_data.db'
+    conn = create_connection(database_path)
+    if conn is not None:
+        write_paper_vectors(conn)
+        conn.close()
+    else:
+        print("Error! cannot create the database connection.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import sqlite3
+import json
+import time
+from snapshot_arrays import create_connection
+
+# TABLE STATISTICS for the Datasets pages, stored as JSON values in the table_stats table and rebuilt whenever
+# db_manager.py changes the database, so the pages render from one small query instead of reading the tables:
+# - row_count: number of rows
+# - columns: the column names, without internal bookkeeping columns
+# - distinct_<column>: number of distinct values of the column in DISTINCT_COLUMNS
+# - distribution_<column>: [value, rows] pairs of the non-null values of the column in DISTRIBUTION_COLUMNS
+# - sample: the first SAMPLE_ROWS rows, in the order of the columns
+STATS_TABLES = ['papers', 'topics', 'tagged_papers']
+EXCLUDED_COLUMNS = {'row_hash'}
+DISTINCT_COLUMNS = {'papers': ['categories'], 'topics': ['level'], 'tagged_papers': ['title']}
+DISTRIBUTION_COLUMNS = {'papers': ['categories'], 'topics': ['level']}
+SAMPLE_ROWS = {'papers': 10, 'topics': 10, 'tagged_papers': 5}
+
+
+def create_table_stats_table(cursor):
+    """ Create the table_stats table: one JSON value per table and statistic """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS table_stats (
+            table_name TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (table_name, name)
+        ) WITHOUT ROWID;
+    """)
+
+
+def compute_table_stats(cursor, table_name):
+    """
+    Compute the statistics of a table.
+
+    Parameters:
+    cursor (sqlite3.Cursor): Cursor of the database connection
+    table_name (str): One of STATS_TABLES
+
+    Returns:
+    dict: The statistics by name, see the list above
+    """
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    columns = [row[1] for row in cursor.fetchall() if row[1] not in EXCLUDED_COLUMNS]
+    stats = {'columns': columns}
+
+    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+    stats['row_count'] = cursor.fetchone()[0]
+    for column in DISTINCT_COLUMNS.get(table_name, []):
+        cursor.execute(f"SELECT COUNT(DISTINCT {column}) FROM {table_name}")
+        stats[f'distinct_{column}'] = cursor.fetchone()[0]
+    for column in DISTRIBUTION_COLUMNS.get(table_name, []):
+        cursor.execute(f"SELECT {column}, COUNT(*) FROM {table_name} WHERE {column} IS NOT NULL "
+                       f"GROUP BY {column} ORDER BY {column}")
+        stats[f'distribution_{column}'] = [list(row) for row in cursor.fetchall()]
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table_name} LIMIT ?", (SAMPLE_ROWS[table_name],))
+    stats['sample'] = [list(row) for row in cursor.fetchall()]
+    return stats
+
+
+def write_table_stats(conn):
+    """
+    Recompute the statistics of every table in STATS_TABLES and replace the rows of table_stats in one
+    transaction, so the pages never read a mix of old and new statistics.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    """
+    start_time = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        create_table_stats_table(cursor)
+        rows = [(table_name, name, json.dumps(value))
+                for table_name in STATS_TABLES
+                for name, value in compute_table_stats(cursor, table_name).items()]
+        cursor.execute("DELETE FROM table_stats")
+        cursor.executemany("INSERT INTO table_stats (table_name, name, value) VALUES (?, ?, ?)", rows)
+        conn.commit()
+    except sqlite3.Error as e:
+        print(e)
+        conn.rollback()
+        return
+    print(f"Table statistics written: {len(rows)} statistics of {len(STATS_TABLES)} tables in "
+          f"{time.perf_counter() - start_time:.2f}s.")
+
+
+def main():
+    database_path = 'app_data.db'
+    conn = create_connection(database_path)
+    if conn is not None:
+        write_table_stats(conn)
+        conn.close()
+    else:
+        print("Error! cannot create the database connection.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import sqlite3
+import time
+import numpy as np
+from snapshot_arrays import SNAPSHOT_DIR, create_connection, save_arrays
+from create_paper_topics import TOPIC_COLUMNS
+
+# Arrays of the topic co-occurrence matrix, written next to the columnar snapshot as .npy files so that the
+# app can memory-map them. The matrix is stored in CSR form with one row per (year, topic):
+# - cooccurrence_years: the years of the tagged papers, in order
+# - cooccurrence_indptr: the entries of row year_index * (max topic id + 1) + topic id are
+#   indptr[row]:indptr[row + 1] of the two arrays below
+# - cooccurrence_indices: the topic id of the other topic of each entry, sorted within a row
+# - cooccurrence_counts: the number of papers tagged with both topics in the year
+# The diagonal entry of a topic is the number of papers tagged with it in the year.
+COOCCURRENCE_ARRAYS = ['years', 'indptr', 'indices', 'counts']
+
+
+def load_paper_topics(cursor):
+    """
+    Load the topics of every tagged paper as one row of topic ids per paper.
+
+    Returns:
+    tuple: (topic ids of shape (papers, TOPIC_COLUMNS) with -1 for no topic, year of each paper)
+    """
+    cursor.execute("""
+        SELECT pt.paper_id, pt.rank, pt.topic_id, CAST(strftime('%Y', pt.date) AS INTEGER)
+        FROM paper_topics pt
+        WHERE pt.date IS NOT NULL
+    """)
+    rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 4)
+    paper_ids, paper_index = np.unique(rows[:, 0], return_inverse=True)
+    topics = np.full((len(paper_ids), TOPIC_COLUMNS), -1, dtype=np.int64)
+    topics[paper_index, rows[:, 1] - 1] = rows[:, 2]
+    years = np.zeros(len(paper_ids), dtype=np.int64)
+    years[paper_index] = rows[:, 3]
+    return topics, years
+
+
+def compute_cooccurrence(topics, years, topic_count):
+    """
+    Count the papers of every pair of topics per year in one vectorized pass over the topic columns.
+
+    Parameters:
+    topics (np.ndarray): Topic ids of each paper, see load_paper_topics
+    years (np.ndarray): Year of each paper
+    topic_count (int): Number of rows per year, larger than every topic id
+
+    Returns:
+    dict: The COOCCURRENCE_ARRAYS of the matrix
+    """
+    # A topic given twice for the same paper is counted once
+    topics = np.sort(topics, axis=1)
+    topics[:, 1:][topics[:, 1:] == topics[:, :-1]] = -1
+
+    year_values, year_index = np.unique(years, return_inverse=True)
+    # Every ordered pair of topic columns, the diagonal included, encoded as one integer per (year, topic, topic)
+    keys = []
+    for first in range(TOPIC_COLUMNS):
+        for second in range(TOPIC_COLUMNS):
+            both = (topics[:, first] >= 0) & (topics[:, second] >= 0)
+            if first != second:
+                both &= topics[:, first] != topics[:, second]
+            row = year_index[both] * topic_count + topics[both, first]
+            keys.append(row * topic_count + topics[both, second])
+    keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+
+    rows, indices = np.divmod(keys, topic_count)
+    indptr = np.zeros(len(year_values) * topic_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(year_values) * topic_count), out=indptr[1:])
+    return {
+        'years': year_values.astype(np.int32),
+        'indptr': indptr,
+        'indices': indices.astype(np.int32),
+        'counts': counts.astype(np.int32),
+    }
+
+
+def write_cooccurrence(conn, directory=SNAPSHOT_DIR):
+    """
+    Compute the topic co-occurrence matrix from paper_topics and write its arrays to the snapshot directory.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    directory (str): Directory the .npy files are written to
+    """
+    start_time = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        topics, years = load_paper_topics(cursor)
+        cursor.execute("SELECT MAX(id) FROM topics")
+        topic_count = (cursor.fetchone()[0] or 0) + 1
+    except sqlite3.Error as e:
+        print(e)
+        return
+
+    matrix = compute_cooccurrence(topics, years, topic_count)
+    save_arrays(directory, 'cooccurrence', {name: matrix[name] for name in COOCCURRENCE_ARRAYS})
+    size = sum(array.nbytes for array in matrix.values())
+    print(f"Topic co-occurrence matrix written: {len(matrix['counts']):,} entries for {len(matrix['years'])} years, "
+          f"{size / 2 ** 20:.1f} MiB in {time.perf_counter() - start_time:.2f}s.")
+
+
+def main():
+    database_path = 'app_data.db'
+    conn = create_connection(database_path)
+    if conn is not None:
+        write_cooccurrence(conn)
+        conn.close()
+    else:
+        print("Error! cannot create the database connection.")
+
+
+if __name__ == "__main__":
+    main()
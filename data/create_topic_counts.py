@@ -0,0 +1,236 @@
+import sqlite3
+import time
+from create_paper_topics import UNIX_EPOCH_JULIAN_DAY, create_connection, create_topic_ids_table, day_expression
+
+
+def date_of_day(day):
+    """ SQL expression for the date of a day number """
+    return f"date({day} * 86400, 'unixepoch')"
+
+
+def bucket_expression(day, modifiers):
+    """ SQL expression for the day number of the date of a day number moved by date() modifiers """
+    return f"CAST(julianday({date_of_day(day)}, {modifiers}) - {UNIX_EPOCH_JULIAN_DAY} AS INTEGER)"
+
+
+# SQL expression for the first day of the period containing a day number, by period (the periods of Topic Search,
+# util.encodings.PERIOD_FREQUENCIES). Weeks start on Monday (1970-01-01 was a Thursday) and quarters in January,
+# April, July and October.
+PERIOD_BUCKETS = {
+    'week': lambda day: f"{day} - ({day} + 3) % 7",
+    'month': lambda day: bucket_expression(day, "'start of month'"),
+    'quarter': lambda day: bucket_expression(
+        day, f"'start of month', "
+             f"'-' || ((CAST(strftime('%m', {date_of_day(day)}) AS INTEGER) - 1) % 3) || ' months'"),
+    'year': lambda day: bucket_expression(day, "'start of year'"),
+}
+
+
+def create_topic_counts_table(cursor):
+    """
+    Create the topic_period_counts table: the number of topic tags (paper_topics rows) per topic and period, rolled
+    up to every ancestor of the tagged topic and kept apart by the depth of the tagged topic below the ancestor.
+
+    Summing the rows of a topic with depth <= N gives the counts of the topic and its subtopics down to N levels,
+    the same as counting its paper_topics rows through topic_descendants. A paper tagged with two subtopics of a
+    topic counts twice for the topic, so the counts are tags rather than distinct papers.
+    """
+    # Tables built before the tags column was named are dropped and built again
+    cursor.execute("PRAGMA table_info(topic_period_counts)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if columns and 'tags' not in columns:
+        cursor.execute("DROP TABLE topic_period_counts")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS topic_period_counts (
+            topic_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            depth INTEGER NOT NULL,
+            tags INTEGER NOT NULL,
+            PRIMARY KEY (topic_id, period, bucket, depth)
+        ) WITHOUT ROWID;
+    """)
+
+
+def create_closure_ids_table(cursor):
+    """ Translate the label pairs of topic_descendants to topic ids, the ids used by paper_topics """
+    create_topic_ids_table(cursor)
+    cursor.execute("DROP TABLE IF EXISTS temp.closure_ids")
+    cursor.execute("""
+        CREATE TEMP TABLE closure_ids AS
+        SELECT a.id AS topic_id, d.id AS descendant_id, td.depth
+        FROM topic_descendants td
+        JOIN topic_ids a ON a.prefLabel = td.topic
+        JOIN topic_ids d ON d.prefLabel = td.descendant
+    """)
+    cursor.execute("CREATE INDEX temp.idx_closure_ids_descendant ON closure_ids(descendant_id)")
+
+
+def create_day_counts_table(cursor, paper_filter=""):
+    """ Count the paper_topics rows per topic id and day number into temp.day_counts """
+    cursor.execute("DROP TABLE IF EXISTS temp.day_counts")
+    cursor.execute(f"""
+        CREATE TEMP TABLE day_counts AS
+        SELECT pt.topic_id, {day_expression('pt.date')} AS day, COUNT(*) AS tags
+        FROM paper_topics pt
+        {'WHERE ' + paper_filter if paper_filter else ''}
+        GROUP BY pt.topic_id, day
+    """)
+
+
+def add_topic_counts(cursor, paper_filter="", sign=1, topic_filter=""):
+    """
+    Add the paper_topics rows of some papers to topic_period_counts (or subtract them, with sign=-1).
+
+    Parameters:
+    cursor (sqlite3.Cursor): Cursor of the database connection, with the temp.closure_ids table created
+    paper_filter (str): Optional SQL condition on paper_topics (alias pt) restricting the papers counted
+    sign (int): 1 to add the counts, -1 to subtract them
+    topic_filter (str): Optional SQL condition on closure_ids (alias c) restricting the topics whose rows change
+    """
+    create_day_counts_table(cursor, paper_filter)
+    for period, bucket in PERIOD_BUCKETS.items():
+        cursor.execute(f"""
+            INSERT INTO topic_period_counts (topic_id, period, bucket, depth, tags)
+            SELECT c.topic_id, '{period}', {bucket('dc.day')} AS bucket, c.depth, {sign} * SUM(dc.tags)
+            FROM day_counts dc
+            JOIN closure_ids c ON c.descendant_id = dc.topic_id
+            WHERE dc.day IS NOT NULL {'AND ' + topic_filter if topic_filter else ''}
+            GROUP BY c.topic_id, bucket, c.depth
+            ON CONFLICT(topic_id, period, bucket, depth) DO UPDATE SET tags = tags + excluded.tags
+        """)
+    if sign < 0:
+        cursor.execute("DELETE FROM topic_period_counts WHERE tags = 0")
+
+
+def build_topic_counts(conn):
+    """
+    Rebuild the topic_period_counts table from paper_topics and topic_descendants.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+
+    Returns:
+    int: Number of rows in topic_period_counts
+    """
+    start_time = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        create_topic_counts_table(cursor)
+        create_closure_ids_table(cursor)
+        cursor.execute("DELETE FROM topic_period_counts")
+        add_topic_counts(cursor)
+        conn.commit()
+        cursor.execute("SELECT COUNT(*) FROM topic_period_counts")
+        rows = cursor.fetchone()[0]
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(e)
+        return None
+    print(f"Finished populating the topic_period_counts table: {rows:,} rows "
+          f"in {time.perf_counter() - start_time:.2f}s.")
+    return rows
+
+
+def update_topic_counts(conn, urls, sign):
+    """
+    Add the current paper_topics rows of the given papers to topic_period_counts, or subtract them.
+
+    To refresh the counts of changed papers, their rows are subtracted before their paper_topics rows are
+    refreshed and added again afterwards, so only the counts of their topics and periods are touched.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    urls (list): URLs of the changed tagged_papers rows
+    sign (int): 1 to add the counts, -1 to subtract them
+    """
+    if not urls:
+        return
+    try:
+        cursor = conn.cursor()
+        create_topic_counts_table(cursor)
+        create_closure_ids_table(cursor)
+        cursor.execute("DROP TABLE IF EXISTS temp.counted_papers")
+        cursor.execute("CREATE TEMP TABLE counted_papers (url TEXT PRIMARY KEY)")
+        cursor.executemany("INSERT OR IGNORE INTO counted_papers (url) VALUES (?)", [(url,) for url in urls])
+        add_topic_counts(cursor, "pt.paper_id IN (SELECT id FROM tagged_papers WHERE url IN "
+                                 "(SELECT url FROM counted_papers))", sign)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(e)
+
+
+def save_count_inputs(conn):
+    """
+    Keep the closure pairs and the day counts of every topic in temp tables before the topics change, so that
+    refresh_topic_counts can tell which topics the change touched. Must be called on the connection that calls
+    refresh_topic_counts.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    """
+    try:
+        cursor = conn.cursor()
+        create_closure_ids_table(cursor)
+        create_day_counts_table(cursor)
+        for table_name in ['closure_ids', 'day_counts']:
+            cursor.execute(f"DROP TABLE IF EXISTS temp.old_{table_name}")
+            cursor.execute(f"CREATE TEMP TABLE old_{table_name} AS SELECT * FROM {table_name}")
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(e)
+
+
+def refresh_topic_counts(conn):
+    """
+    Update topic_period_counts after a change of the topics and paper_topics, compared with the state kept by
+    save_count_inputs. Only the rows of the topics whose closure pairs changed, or with a descendant whose day
+    counts changed, are computed again; the rows of every other topic are left as they are.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    """
+    start_time = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        create_topic_counts_table(cursor)
+        create_closure_ids_table(cursor)
+        create_day_counts_table(cursor)
+        cursor.execute("DROP TABLE IF EXISTS temp.changed_topics")
+        cursor.execute("""
+            CREATE TEMP TABLE changed_topics AS
+            SELECT topic_id FROM (SELECT * FROM closure_ids EXCEPT SELECT * FROM old_closure_ids)
+            UNION SELECT topic_id FROM (SELECT * FROM old_closure_ids EXCEPT SELECT * FROM closure_ids)
+            UNION SELECT c.topic_id FROM closure_ids c WHERE c.descendant_id IN (
+                SELECT topic_id FROM (SELECT * FROM day_counts EXCEPT SELECT * FROM old_day_counts)
+                UNION SELECT topic_id FROM (SELECT * FROM old_day_counts EXCEPT SELECT * FROM day_counts)
+            )
+        """)
+        cursor.execute("DELETE FROM topic_period_counts WHERE topic_id IN (SELECT topic_id FROM changed_topics)")
+        add_topic_counts(cursor, topic_filter="c.topic_id IN (SELECT topic_id FROM changed_topics)")
+        cursor.execute("SELECT COUNT(*) FROM changed_topics")
+        changed = cursor.fetchone()[0]
+        for table_name in ['old_closure_ids', 'old_day_counts']:
+            cursor.execute(f"DROP TABLE temp.{table_name}")
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(e)
+        return
+    print(f"Refreshed the topic_period_counts rows of {changed:,} topics in {time.perf_counter() - start_time:.2f}s.")
+
+
+def main():
+    database_path = 'app_data.db'
+    conn = create_connection(database_path)
+    if conn is not None:
+        build_topic_counts(conn)
+        conn.close()
+    else:
+        print("Error! cannot create the database connection.")
+
+
+if __name__ == "__main__":
+    main()
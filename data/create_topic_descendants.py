@@ -1,6 +1,5 @@
 import sqlite3
-import csv
-import os
+import time
 
 
 def create_connection(db_file):
@@ -14,47 +13,273 @@ def create_connection(db_file):
     return conn
 
 
-def find_and_store_descendants(cursor, conn, topic):
-    cursor.execute("SELECT s FROM topics WHERE prefLabel = ?", (topic,))
-    topic_url = cursor.fetchone()
-    if topic_url:
-        cursor.execute("SELECT prefLabel FROM topics WHERE broader = ?", (topic_url[0],))
-        children = cursor.fetchall()
-        for child in children:
-            child_topic = child[0]
-            # Check if the pair already exists
-            cursor.execute("SELECT COUNT(*) FROM topic_descendants WHERE topic = ? AND descendant = ?", (topic, child_topic))
-            if cursor.fetchone()[0] == 0:  # If no entry exists, insert new pair
-                cursor.execute("INSERT INTO topic_descendants (topic, descendant) VALUES (?, ?)", (topic, child_topic))
-            find_and_store_descendants(cursor, conn, child_topic)
+def create_descendants_table(cursor):
+    """ Create the topic_descendants table, replacing a table from before the depth column was added """
+    cursor.execute("PRAGMA table_info(topic_descendants)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if columns and 'depth' not in columns:
+        cursor.execute("DROP TABLE topic_descendants")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS topic_descendants (
+            topic TEXT NOT NULL,
+            descendant TEXT NOT NULL,
+            depth INTEGER NOT NULL,
+            PRIMARY KEY (topic, descendant)
+        ) WITHOUT ROWID;
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_topic_descendants_descendant ON topic_descendants(descendant);")
 
 
-def main():
-    # Direct path specification for clarity
-    database_path = '/Users/ahmetokur/Desktop/bachelor_app/data/app_data.db'
-    conn = create_connection(database_path)
-    if conn is not None:
+def load_topic_tree(cursor):
+    """
+    Load the topic hierarchy with a single query.
+
+    Returns:
+    tuple: (label of each topic by s, children of each topic by s, topics whose broader topic is not in the table)
+    """
+    cursor.execute("SELECT s, prefLabel, broader FROM topics")
+    rows = cursor.fetchall()
+    labels = {s: label for s, label, _ in rows}
+    children = {s: [] for s in labels}
+    roots = []
+    for s, _, broader in rows:
+        if broader in children and broader != s:
+            children[broader].append(s)
+        else:
+            roots.append(s)
+    return labels, children, roots
+
+
+def compute_closure(labels, children, roots):
+    """
+    Compute the transitive closure of the topic hierarchy in one depth-first pass over the tree.
+
+    Every topic is paired with itself (depth 0) and with each of its ancestors on the path from its root,
+    so the work is proportional to the size of the closure. Pairs are by label; if a label occurs more
+    than once in the tree, the smallest depth is kept.
+
+    Parameters:
+    labels (dict): Label of each topic by s
+    children (dict): Children of each topic by s
+    roots (list): Topics to start from
+
+    Returns:
+    dict: Depth by (topic label, descendant label)
+    """
+    closure = {}
+    visited = set()
+    # Topics on a cycle of broader links are not reachable from a root; each cycle is entered at one of its topics
+    for root in roots + list(labels):
+        if root in visited:
+            continue
+        visited.add(root)
+        path = []  # labels of the ancestors of the current topic, root first
+        stack = [(root, 0)]
+        while stack:
+            s, depth = stack.pop()
+            del path[depth:]
+            path.append(labels[s])
+            for ancestor_depth, ancestor in enumerate(path):
+                pair = (ancestor, labels[s])
+                distance = depth - ancestor_depth
+                if closure.get(pair, distance) >= distance:
+                    closure[pair] = distance
+            for child in children[s]:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append((child, depth + 1))
+    return closure
+
+
+def build_topic_descendants(conn):
+    """
+    Rebuild the topic_descendants table with the full transitive closure of the topic hierarchy.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+
+    Returns:
+    int: Number of (topic, descendant) pairs
+    """
+    start_time = time.perf_counter()
+    try:
         cursor = conn.cursor()
+        create_descendants_table(cursor)
+        closure = compute_closure(*load_topic_tree(cursor))
+        cursor.execute("DELETE FROM topic_descendants")
+        cursor.executemany("INSERT INTO topic_descendants (topic, descendant, depth) VALUES (?, ?, ?)",
+                           ((topic, descendant, depth) for (topic, descendant), depth in closure.items()))
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(e)
+        return None
+    print(f"Finished populating the topic_descendants table: {len(closure):,} pairs "
+          f"in {time.perf_counter() - start_time:.2f}s.")
+    return len(closure)
+
+
+def add_topic(cursor, label):
+    """ Add a new topic to the closure as a root, paired only with itself """
+    cursor.execute("INSERT INTO topic_descendants (topic, descendant, depth) VALUES (?, ?, 0)", (label, label))
+
+
+def rename_topic(cursor, old_label, new_label):
+    """ Replace the label of a topic in all of its pairs """
+    cursor.execute("UPDATE topic_descendants SET topic = ? WHERE topic = ?", (new_label, old_label))
+    cursor.execute("UPDATE topic_descendants SET descendant = ? WHERE descendant = ?", (new_label, old_label))
+
+
+def move_subtree(cursor, label, parent_label):
+    """
+    Move a topic and its subtree below a new broader topic, touching only the pairs between the old and new
+    ancestors of the topic and its descendants.
+
+    Parameters:
+    cursor (sqlite3.Cursor): Cursor on the database
+    label (str): Label of the topic to move
+    parent_label (str): Label of the new broader topic, or None to make the topic a root
 
+    Returns:
+    bool: False if the move would make the topic its own ancestor (nothing is changed)
+    """
+    if parent_label is not None:
+        cursor.execute("SELECT 1 FROM topic_descendants WHERE topic = ? AND descendant = ?", (label, parent_label))
+        if cursor.fetchone():
+            return False
+    # Detach: drop the pairs from the old ancestors of the topic to every topic in its subtree
+    cursor.execute("""
+        DELETE FROM topic_descendants
+        WHERE descendant IN (SELECT descendant FROM topic_descendants WHERE topic = ?)
+            AND topic IN (SELECT topic FROM topic_descendants WHERE descendant = ? AND topic != ?)
+    """, (label, label, label))
+    # Attach: pair every ancestor of the new broader topic (itself included) with every topic in the subtree
+    if parent_label is not None:
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS topic_descendants (
-                topic TEXT NOT NULL,
-                descendant TEXT NOT NULL,
-                PRIMARY KEY (topic, descendant)
-            );
-        """)
-        conn.commit()
+            INSERT INTO topic_descendants (topic, descendant, depth)
+            SELECT a.topic, d.descendant, a.depth + 1 + d.depth
+            FROM topic_descendants a, topic_descendants d
+            WHERE a.descendant = ? AND d.topic = ?
+        """, (parent_label, label))
+    return True
+
+
+def get_topic_labels(cursor, s_values):
+    """ Return the label of each of the given topics (by s) that is in the topics table """
+    s_values = list(s_values)
+    cursor.execute(f"SELECT s, prefLabel FROM topics WHERE s IN ({','.join(['?'] * len(s_values))})", s_values)
+    return dict(cursor.fetchall())
+
+
+def apply_topic_changes(cursor, changes):
+    """
+    Apply the changes of an ingest batch to the topics table to the closure, see update_topic_descendants.
+
+    Returns:
+    bool: False if a change cannot be applied incrementally
+    """
+    changed = [s for s, _, _ in changes]
+    cursor.execute(f"SELECT s, prefLabel, broader FROM topics WHERE s IN ({','.join(['?'] * len(changed))})",
+                   changed)
+    current = {s: (label, broader) for s, label, broader in cursor.fetchall()}
+    inserted = [s for s, op, _ in changes if op == 'insert' and s in current]
+    updated = [(s, old_values) for s, op, old_values in changes if op == 'update' and s in current]
 
-        cursor.execute("SELECT prefLabel FROM topics")
-        topics = cursor.fetchall()
+    # Pairs are by label, so labels shared by several topics are left to the full rebuild
+    labels = [label for label, _ in current.values()] + [old['prefLabel'] for _, old in updated]
+    cursor.execute(f"""
+        SELECT 1 FROM topics WHERE prefLabel IN ({','.join(['?'] * len(labels))})
+        GROUP BY prefLabel HAVING COUNT(*) > 1
+    """, labels)
+    if cursor.fetchone():
+        return False
 
-        for topic_tuple in topics:
-            topic = topic_tuple[0]
-            find_and_store_descendants(cursor, conn, topic)
-            conn.commit()
+    for s, old_values in updated:
+        if old_values['prefLabel'] != current[s][0]:
+            rename_topic(cursor, old_values['prefLabel'], current[s][0])
+    for s in inserted:
+        add_topic(cursor, current[s][0])
 
+    # Link the new and re-parented topics below their broader topic, and the topics that were already
+    # below a new topic (they were roots until now) below it
+    moved = inserted + [s for s, old_values in updated if old_values['broader'] != current[s][1]]
+    parents = get_topic_labels(cursor, {current[s][1] for s in moved if current[s][1] is not None})
+    for s in moved:
+        parent = current[s][1]
+        if not move_subtree(cursor, current[s][0], parents.get(parent) if parent != s else None):
+            return False
+    for s in inserted:
+        cursor.execute("SELECT prefLabel FROM topics WHERE broader = ? AND s != ?", (s, s))
+        for (child_label,) in cursor.fetchall():
+            if not move_subtree(cursor, child_label, current[s][0]):
+                return False
+    return True
+
+
+def update_topic_descendants(conn, changes):
+    """
+    Update the topic_descendants table with the changes of an ingest batch to the topics table.
+
+    Only the pairs of the topics that were added, renamed or moved to another broader topic (and of their
+    ancestors and descendants) are touched. Changes the closure cannot follow incrementally (a label shared
+    by several topics, a broader link that closes a cycle) fall back to a full rebuild.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    changes (list): (s, op, old_values) tuples of the topics changeset, see db_manager.get_changeset
+
+    Returns:
+    bool: True if the closure was updated incrementally, False if it was rebuilt
+    """
+    if not changes:
+        return True
+    start_time = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        create_descendants_table(cursor)
+        applied = apply_topic_changes(cursor, changes)
+    except sqlite3.Error as e:
+        print(e)
+        applied = False
+    if not applied:
+        conn.rollback()
+        print("The topic changes cannot be applied incrementally, rebuilding topic_descendants.")
+        build_topic_descendants(conn)
+        return False
+    conn.commit()
+    print(f"Updated topic_descendants for {len(changes):,} changed topics "
+          f"in {time.perf_counter() - start_time:.2f}s.")
+    return True
+
+
+def check_topic_descendants(conn):
+    """
+    Compare the topic_descendants table with a full rebuild of the closure computed in memory.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+
+    Returns:
+    list: (topic, descendant, stored depth, expected depth) for every pair that differs, with None for
+          a pair missing on either side
+    """
+    cursor = conn.cursor()
+    expected = compute_closure(*load_topic_tree(cursor))
+    cursor.execute("SELECT topic, descendant, depth FROM topic_descendants")
+    stored = {(topic, descendant): depth for topic, descendant, depth in cursor.fetchall()}
+    differences = [(topic, descendant, stored.get((topic, descendant)), depth)
+                   for (topic, descendant), depth in expected.items() if stored.get((topic, descendant)) != depth]
+    differences += [(topic, descendant, depth, None)
+                    for (topic, descendant), depth in stored.items() if (topic, descendant) not in expected]
+    return differences
+
+
+def main():
+    database_path = 'app_data.db'
+    conn = create_connection(database_path)
+    if conn is not None:
+        build_topic_descendants(conn)
         conn.close()  # Ensure the connection is closed after operations
-        print("Finished populating the topic_descendants table.")
     else:
         print("Error! cannot create the database connection.")
 
@@ -0,0 +1,107 @@
+import sqlite3
+import time
+from create_topic_descendants import create_connection, load_topic_tree
+
+
+def compute_intervals(children, roots):
+    """
+    Number the topic hierarchy in pre-order with a nested-set interval for every topic.
+
+    A topic gets lo = its position in a depth-first pre-order walk and hi = the largest lo in its subtree,
+    so the descendants of a topic (and the topic itself) are exactly the topics with lo BETWEEN lo AND hi.
+    Top-level topics are at tree level 1, like the level column of the topic list.
+
+    Parameters:
+    children (dict): Children of each topic by s
+    roots (list): Topics to start from
+
+    Returns:
+    dict: (lo, hi, tree_level) by s
+    """
+    intervals = {}
+    counter = 0
+    # Topics on a cycle of broader links are not reachable from a root; each cycle is entered at one of its topics
+    for root in roots + list(children):
+        if root in intervals:
+            continue
+        # Each stack entry is (s, tree level, whether the subtree of s has been numbered)
+        stack = [(root, 1, False)]
+        while stack:
+            s, tree_level, finished = stack.pop()
+            if finished:
+                lo, _, _ = intervals[s]
+                intervals[s] = (lo, counter, tree_level)
+                continue
+            counter += 1
+            intervals[s] = (counter, None, tree_level)
+            stack.append((s, tree_level, True))
+            # Children are pushed in reverse so that they are numbered in their original order
+            for child in reversed(children[s]):
+                if child not in intervals:
+                    intervals[child] = None  # claimed, so a topic reached twice is only numbered once
+                    stack.append((child, tree_level + 1, False))
+    return intervals
+
+
+def build_topic_intervals(conn):
+    """
+    Store the nested-set interval (lo, hi) and the tree level of every topic in the topics table.
+
+    The numbering is computed in memory from the whole tree, but only the rows whose numbers changed are
+    written, so after a change to the topics only the topics that moved in the pre-order are updated.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+
+    Returns:
+    int: Number of topics whose numbers were updated
+    """
+    start_time = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        _, children, roots = load_topic_tree(cursor)
+        intervals = compute_intervals(children, roots)
+        cursor.execute("SELECT s, lo, hi, tree_level FROM topics")
+        stored = {s: (lo, hi, tree_level) for s, lo, hi, tree_level in cursor.fetchall()}
+        changed = [(lo, hi, tree_level, s) for s, (lo, hi, tree_level) in intervals.items()
+                   if stored.get(s) != (lo, hi, tree_level)]
+        cursor.executemany("UPDATE topics SET lo = ?, hi = ?, tree_level = ? WHERE s = ?", changed)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(e)
+        return None
+    print(f"Finished numbering the topic intervals: {len(changed):,} of {len(intervals):,} topics updated "
+          f"in {time.perf_counter() - start_time:.2f}s.")
+    return len(changed)
+
+
+def check_topic_intervals(conn):
+    """
+    Compare the stored intervals and tree levels with a full renumbering of the topic tree.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+
+    Returns:
+    list: s of every topic whose (lo, hi, tree_level) differ from the full renumbering
+    """
+    cursor = conn.cursor()
+    _, children, roots = load_topic_tree(cursor)
+    intervals = compute_intervals(children, roots)
+    cursor.execute("SELECT s, lo, hi, tree_level FROM topics")
+    return [s for s, lo, hi, tree_level in cursor.fetchall() if intervals.get(s) != (lo, hi, tree_level)]
+
+
+def main():
+    database_path = 'app_data.db'
+    conn = create_connection(database_path)
+    if conn is not None:
+        build_topic_intervals(conn)
+        conn.close()
+    else:
+        print("Error! cannot create the database connection.")
+
+
+if __name__ == "__main__":
+    main()
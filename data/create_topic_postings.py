@@ -0,0 +1,78 @@
+import sqlite3
+import time
+import numpy as np
+from snapshot_arrays import SNAPSHOT_DIR, create_connection, save_arrays
+
+# Arrays of the inverted topic index, written next to the columnar snapshot as .npy files so that the app can
+# memory-map them:
+# - postings_indptr: the papers of topic id t are papers[indptr[t]:indptr[t + 1]]
+# - postings_papers: the ids of the tagged papers of each topic, sorted within a topic
+# - postings_days: the day number of each paper (tagged_papers.day), indexed by paper id, NO_DAY if it has no date
+POSTING_ARRAYS = ['indptr', 'papers', 'days']
+NO_DAY = np.iinfo(np.int32).min
+
+
+def compute_postings(pairs, topic_count):
+    """
+    Build the posting lists of the topics from their (topic id, paper id) pairs.
+
+    Parameters:
+    pairs (np.ndarray): (topic id, paper id) rows of paper_topics, in any order and possibly repeated
+    topic_count (int): Number of posting lists, larger than every topic id
+
+    Returns:
+    tuple: (indptr, papers) arrays, see POSTING_ARRAYS
+    """
+    paper_count = int(pairs[:, 1].max()) + 1 if len(pairs) else 1
+    # One sort of the pairs encoded as integers orders the papers within each topic and drops duplicates
+    keys = np.unique(pairs[:, 0] * paper_count + pairs[:, 1])
+    topics, papers = np.divmod(keys, paper_count)
+    indptr = np.zeros(topic_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(topics, minlength=topic_count), out=indptr[1:])
+    return indptr, papers.astype(np.int32)
+
+
+def write_postings(conn, directory=SNAPSHOT_DIR):
+    """
+    Compute the posting list of every topic from paper_topics and write the arrays to the snapshot directory.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    directory (str): Directory the .npy files are written to
+    """
+    start_time = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT topic_id, paper_id FROM paper_topics")
+        pairs = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+        cursor.execute("SELECT MAX(id) FROM topics")
+        topic_count = (cursor.fetchone()[0] or 0) + 1
+        cursor.execute("SELECT id, COALESCE(day, ?) FROM tagged_papers", (int(NO_DAY),))
+        paper_days = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+    except sqlite3.Error as e:
+        print(e)
+        return
+
+    indptr, papers = compute_postings(pairs, topic_count)
+    days = np.full(int(paper_days[:, 0].max(initial=0)) + 1, NO_DAY, dtype=np.int32)
+    days[paper_days[:, 0]] = paper_days[:, 1]
+
+    arrays = {'indptr': indptr, 'papers': papers, 'days': days}
+    save_arrays(directory, 'postings', arrays)
+    size = sum(array.nbytes for array in arrays.values())
+    print(f"Topic posting lists written: {len(papers):,} postings for {topic_count:,} topics, "
+          f"{size / 2 ** 20:.1f} MiB in {time.perf_counter() - start_time:.2f}s.")
+
+
+def main():
+    database_path = 'app_data.db'
+    conn = create_connection(database_path)
+    if conn is not None:
+        write_postings(conn)
+        conn.close()
+    else:
+        print("Error! cannot create the database connection.")
+
+
+if __name__ == "__main__":
+    main()
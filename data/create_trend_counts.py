@@ -0,0 +1,181 @@
+import sqlite3
+import time
+import numpy as np
+from snapshot_arrays import SNAPSHOT_DIR, create_connection, save_arrays
+from create_paper_topics import day_expression
+
+# Cumulative daily tag counts for Top Trends, written next to the columnar snapshot as .npy files so that the app
+# can memory-map them:
+# - trends_cumulative: cumulative[i, c] is the number of paper_topics rows of the topic in column c dated before
+#   day first_day + i, so the count of any range of days [s, e] is cumulative[e + 1 - first_day] minus
+#   cumulative[s - first_day], two rows read for all topics. Rows are days, so both rows are contiguous.
+# - trends_topic_ids: the topic id of each column (only topics with tagged papers get a column)
+# - trends_first_day: the day number of the first row
+TREND_ARRAYS = ['cumulative', 'topic_ids', 'first_day']
+
+# Cumulative daily counts rolled up to the topics of each level, on the same days as the trend counts:
+# - rollup_cumulative: the same as trends_cumulative for the topics of every level, counting each paper tagged with
+#   the topic or any of its descendants once
+# - rollup_topic_ids: the topic id of each column
+# - rollup_levels: the topics.level of each column; the columns are ordered by level
+ROLLUP_ARRAYS = ['cumulative', 'topic_ids', 'levels']
+
+
+def compute_cumulative_counts(rows, first_day=None, last_day=None):
+    """
+    Build the cumulative daily counts from the number of tags per topic and day.
+
+    Parameters:
+    rows (np.ndarray): (topic id, day number, count) rows, one per topic and day
+    first_day (int): Day number of the first row, or None for the first day of the rows
+    last_day (int): Day number of the last row, or None for the last day of the rows
+
+    Returns:
+    tuple: (cumulative, topic_ids, first_day) arrays, see TREND_ARRAYS
+    """
+    if first_day is None:
+        first_day = int(rows[:, 1].min()) if len(rows) else 0
+    if last_day is None:
+        last_day = int(rows[:, 1].max()) if len(rows) else first_day - 1
+    topic_ids, columns = np.unique(rows[:, 0], return_inverse=True)
+    day_count = last_day - first_day + 1
+    daily = np.zeros((day_count + 1, len(topic_ids)), dtype=np.int32)
+    # Row 0 stays zero: the count before the first day
+    np.add.at(daily, (rows[:, 1] - first_day + 1, columns), rows[:, 2])
+    cumulative = np.cumsum(daily, axis=0, dtype=np.int32)
+    return cumulative, topic_ids.astype(np.int32), np.array([first_day], dtype=np.int64)
+
+
+def ancestor_pairs(cursor, level):
+    """
+    Return the (ancestor id, descendant id) pairs of the topics of a level, each topic being its own descendant.
+
+    Parameters:
+    cursor (sqlite3.Cursor): Cursor of the database connection
+    level (int): topics.level of the ancestors
+
+    Returns:
+    np.ndarray: Pairs ordered by descendant id
+    """
+    # The descendants of a topic are the topics whose lo lies in its interval (see create_topic_intervals.py)
+    cursor.execute("""
+        SELECT a.id, d.id
+        FROM topics a
+        JOIN topics d ON d.lo BETWEEN a.lo AND a.hi
+        WHERE a.level = ?
+    """, (level,))
+    pairs = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+    return pairs[np.argsort(pairs[:, 1], kind='stable')]
+
+
+def compute_rollup_rows(tags, pairs):
+    """
+    Count the papers of the topics of a level per day, each paper once per topic however many of the topic's
+    descendants it is tagged with.
+
+    Parameters:
+    tags (np.ndarray): (topic id, paper id, day number) rows of paper_topics
+    pairs (np.ndarray): Pairs from ancestor_pairs
+
+    Returns:
+    np.ndarray: (ancestor id, day number, count) rows, see compute_cumulative_counts
+    """
+    # Every tag is repeated once per ancestor of its topic (once in a tree) and tags without one are dropped
+    starts = np.searchsorted(pairs[:, 1], tags[:, 0], side='left')
+    ends = np.searchsorted(pairs[:, 1], tags[:, 0], side='right')
+    repeats = ends - starts
+    tag_rows = np.repeat(np.arange(len(tags)), repeats)
+    offsets = np.arange(len(tag_rows)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    ancestors = pairs[starts[tag_rows] + offsets, 0]
+
+    # One sort of the (ancestor, paper) pairs encoded as integers drops the papers counted twice for an ancestor
+    paper_count = int(tags[:, 1].max()) + 1 if len(tags) else 1
+    keys, first_rows = np.unique(ancestors * paper_count + tags[tag_rows, 1], return_index=True)
+    days = tags[tag_rows[first_rows], 2]
+
+    # Then the papers are counted per ancestor and day the same way
+    day_offset = int(days.min()) if len(days) else 0
+    day_count = int(days.max()) - day_offset + 1 if len(days) else 1
+    day_keys, counts = np.unique((keys // paper_count) * day_count + (days - day_offset), return_counts=True)
+    ancestor_ids, day_numbers = np.divmod(day_keys, day_count)
+    return np.column_stack([ancestor_ids, day_numbers + day_offset, counts])
+
+
+def compute_rollups(cursor, tags, first_day, last_day):
+    """
+    Build the cumulative daily counts rolled up to the topics of every level.
+
+    Parameters:
+    cursor (sqlite3.Cursor): Cursor of the database connection
+    tags (np.ndarray): (topic id, paper id, day number) rows of paper_topics
+    first_day (int): Day number of the first row of the counts
+    last_day (int): Day number of the last row of the counts
+
+    Returns:
+    dict: The ROLLUP_ARRAYS
+    """
+    cursor.execute("SELECT DISTINCT level FROM topics WHERE level IS NOT NULL ORDER BY level")
+    matrices, topic_ids, levels = [], [], []
+    for (level,) in cursor.fetchall():
+        rows = compute_rollup_rows(tags, ancestor_pairs(cursor, level))
+        cumulative, level_topic_ids, _ = compute_cumulative_counts(rows, first_day, last_day)
+        matrices.append(cumulative)
+        topic_ids.append(level_topic_ids)
+        levels.append(np.full(len(level_topic_ids), level, dtype=np.int32))
+    if not matrices:
+        return {'cumulative': np.zeros((last_day - first_day + 2, 0), dtype=np.int32),
+                'topic_ids': np.empty(0, dtype=np.int32), 'levels': np.empty(0, dtype=np.int32)}
+    return {'cumulative': np.hstack(matrices), 'topic_ids': np.concatenate(topic_ids),
+            'levels': np.concatenate(levels)}
+
+
+def write_trend_counts(conn, directory=SNAPSHOT_DIR):
+    """
+    Count the tags of every topic per day from paper_topics and write the cumulative counts to the snapshot
+    directory.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to the database
+    directory (str): Directory the .npy files are written to
+    """
+    start_time = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        # Grouped on idx_paper_topics_date_topic, without reading the table
+        cursor.execute(f"""
+            SELECT topic_id, {day_expression('date')}, COUNT(*)
+            FROM paper_topics
+            WHERE date IS NOT NULL
+            GROUP BY date, topic_id
+        """)
+        rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 3)
+        cumulative, topic_ids, first_day = compute_cumulative_counts(rows)
+        last_day = int(first_day[0]) + len(cumulative) - 2
+
+        cursor.execute(f"SELECT topic_id, paper_id, {day_expression('date')} FROM paper_topics WHERE date IS NOT NULL")
+        tags = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 3)
+        rollups = compute_rollups(cursor, tags, int(first_day[0]), last_day)
+    except sqlite3.Error as e:
+        print(e)
+        return
+
+    save_arrays(directory, 'trends', {'cumulative': cumulative, 'topic_ids': topic_ids, 'first_day': first_day})
+    save_arrays(directory, 'rollup', rollups)
+    size = cumulative.nbytes + rollups['cumulative'].nbytes
+    print(f"Trend counts written: {cumulative.shape[0] - 1:,} days x {cumulative.shape[1]:,} topics and "
+          f"{rollups['cumulative'].shape[1]:,} rolled-up topics, {size / 2 ** 20:.1f} MiB in "
+          f"{time.perf_counter() - start_time:.2f}s.")
+
+
+def main():
+    database_path = 'app_data.db'
+    conn = create_connection(database_path)
+    if conn is not None:
+        write_trend_counts(conn)
+        conn.close()
+    else:
+        print("Error! cannot create the database connection.")
+
+
+if __name__ == "__main__":
+    main()
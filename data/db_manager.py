@@ -1,6 +1,64 @@
 import pandas as pd
 import sqlite3
 import os
+import sys
+import time
+import argparse
+import tracemalloc
+import json
+import create_paper_topics
+import create_topic_descendants
+import create_topic_intervals
+import create_topic_counts
+import create_topic_cooccurrence
+import create_topic_postings
+import create_fulltext_index
+import create_paper_vectors
+import create_trend_counts
+import create_table_stats
+
+# Number of CSV rows read into memory at a time while importing
+DEFAULT_CHUNKSIZE = 50_000
+
+# PRAGMAs used while rebuilding the database from scratch. The build can always be rerun from the CSV files,
+# so durability is traded for speed: the rollback journal is kept in memory, fsyncs are skipped
+# and a large page cache keeps the B-trees of the tables being filled in memory.
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = MEMORY;",
+    "PRAGMA synchronous = OFF;",
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA cache_size = -262144;",  # negative value is in KiB, i.e. 256 MiB
+]
+
+# PRAGMAs used by an incremental ingest or a migration, which change the database the app is reading and can't
+# simply be rerun: the database stays in WAL, so readers aren't blocked, and commits are only synced at
+# checkpoints, which keeps them durable against a crash of the process.
+INGEST_PRAGMAS = [
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA cache_size = -262144;",
+]
+
+# PRAGMAs left on the database when the build is done. WAL is stored in the database file, so the app's read-only
+# connections (util/database.py) keep reading while a later incremental ingest writes.
+SERVING_PRAGMAS = [
+    "PRAGMA journal_mode = WAL;",
+]
+
+# Natural key of each table, used to match the rows of a delta CSV against the rows already in the database
+UPSERT_KEYS = {
+    'papers': 'url',
+    'topics': 's',
+    'tagged_papers': 'url',
+}
+
+# Columns whose previous values are stored with an update in the changeset, so that derived tables can
+# retract what the old row contributed (e.g. the counts of a paper's previous topics or date)
+CHANGESET_OLD_VALUES = {
+    'papers': ['submission_date', 'categories'],
+    'topics': ['prefLabel', 'broader', 'level'],
+    'tagged_papers': ['date', 'topic1', 'topic2', 'topic3', 'topic4', 'topic5'],
+}
 
 
 # Function to create a database connection
@@ -24,7 +82,8 @@ def create_tables(conn):
                         categories TEXT,
                         abstract TEXT,
                         submission_date DATE,
-                        authors_parsed TEXT
+                        authors_parsed TEXT,
+                        row_hash INTEGER
                     );"""
 
     topics_sql = """CREATE TABLE IF NOT EXISTS topics (
@@ -34,11 +93,16 @@ def create_tables(conn):
                         altLabel TEXT,
                         description TEXT,
                         broader TEXT,
-                        level INTEGER
+                        level INTEGER,
+                        row_hash INTEGER,
+                        lo INTEGER,
+                        hi INTEGER,
+                        tree_level INTEGER
                     );"""
 
     tagged_papers_sql = """CREATE TABLE IF NOT EXISTS tagged_papers (
-                               url TEXT,
+                               id INTEGER PRIMARY KEY AUTOINCREMENT,
+                               url TEXT UNIQUE,
                                date DATE,
                                title TEXT,
                                abstract TEXT,
@@ -47,15 +111,87 @@ def create_tables(conn):
                                topic3 TEXT,
                                topic4 TEXT,
                                topic5 TEXT,
+                               row_hash INTEGER,
+                               day INTEGER,
                                FOREIGN KEY (url) REFERENCES papers (url)
                            );"""
 
+    # Long format of the topic1..topic5 columns of tagged_papers: one row per (paper, rank) with the
+    # integer id of the topic. The paper's date is repeated so that (topic_id, date) lookups are covered.
+    paper_topics_sql = """CREATE TABLE IF NOT EXISTS paper_topics (
+                              paper_id INTEGER NOT NULL,
+                              rank INTEGER NOT NULL,
+                              topic_id INTEGER NOT NULL,
+                              date DATE,
+                              PRIMARY KEY (paper_id, rank),
+                              FOREIGN KEY (paper_id) REFERENCES tagged_papers (id),
+                              FOREIGN KEY (topic_id) REFERENCES topics (id)
+                          ) WITHOUT ROWID;"""
+
+    # Incremental ingests are recorded as batches, each with the keys of the rows it inserted or updated
+    ingest_batches_sql = """CREATE TABLE IF NOT EXISTS ingest_batches (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                started_at TEXT,
+                                finished_at TEXT
+                            );"""
+
+    ingest_changes_sql = """CREATE TABLE IF NOT EXISTS ingest_changes (
+                                batch_id INTEGER NOT NULL,
+                                table_name TEXT NOT NULL,
+                                key TEXT NOT NULL,
+                                op TEXT NOT NULL,
+                                old_values TEXT,
+                                FOREIGN KEY (batch_id) REFERENCES ingest_batches (id)
+                            );"""
+
     # Execute to create table statements
     try:
         c = conn.cursor()
-        c.execute(papers_sql)
-        c.execute(topics_sql)
-        c.execute(tagged_papers_sql)
+        for table_name, table_sql in [('papers', papers_sql), ('topics', topics_sql),
+                                      ('tagged_papers', tagged_papers_sql)]:
+            # Tables without an id column were created by to_sql and are recreated with this schema
+            legacy_columns = get_table_columns(conn, table_name)
+            if legacy_columns and 'id' not in legacy_columns:
+                migrate_legacy_table(conn, table_name, table_sql)
+            else:
+                c.execute(table_sql)
+        c.execute(paper_topics_sql)
+        c.execute(ingest_batches_sql)
+        c.execute(ingest_changes_sql)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_ingest_changes_batch ON ingest_changes(batch_id, table_name);")
+        conn.commit()
+    except sqlite3.Error as e:
+        print(e)
+
+    # Databases built before the row hashes were introduced get the column added
+    for table_name in UPSERT_KEYS:
+        add_missing_column(conn, table_name, 'row_hash', 'INTEGER')
+    # ... and the same for the day numbers of the papers
+    add_missing_column(conn, 'tagged_papers', 'day', 'INTEGER')
+    # ... and the nested-set intervals of the topic hierarchy
+    for column_name in ['lo', 'hi', 'tree_level']:
+        add_missing_column(conn, 'topics', column_name, 'INTEGER')
+
+
+# Function to recreate a table built by to_sql with its schema from create_tables, keeping its rows
+def migrate_legacy_table(conn, table_name, table_sql):
+    c = conn.cursor()
+    c.execute(f"ALTER TABLE {table_name} RENAME TO {table_name}_legacy")
+    c.execute(table_sql)
+    columns = [column for column in get_table_columns(conn, f"{table_name}_legacy")
+               if column in get_table_columns(conn, table_name)]
+    c.execute(f"INSERT OR IGNORE INTO {table_name} ({', '.join(columns)}) "
+              f"SELECT {', '.join(columns)} FROM {table_name}_legacy")
+    c.execute(f"DROP TABLE {table_name}_legacy")
+    print(f"Migrated {table_name} to the current schema.")
+
+
+# Function to add a column to an existing table if it is not there yet
+def add_missing_column(conn, table_name, column_name, column_type):
+    if column_name in get_table_columns(conn, table_name):
+        return
+    try:
+        conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
         conn.commit()
     except sqlite3.Error as e:
         print(e)
@@ -70,47 +206,465 @@ def create_indexes(conn):
         c.execute("CREATE INDEX IF NOT EXISTS idx_topics_prefLabel ON topics(prefLabel);")
         c.execute("CREATE INDEX IF NOT EXISTS idx_topics_broader ON topics(broader);")
         c.execute("CREATE INDEX IF NOT EXISTS idx_topics_level ON topics(level);")
+        # Covers the descendant range scans (lo BETWEEN ? AND ?) of the search pages and the sunburst subtrees
+        c.execute("CREATE INDEX IF NOT EXISTS idx_topics_lo ON topics(lo, tree_level, prefLabel);")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_tagged_papers_date ON tagged_papers(date);")
+        # paper_topics is WITHOUT ROWID, so both indexes also carry (paper_id, rank) and cover the page queries
+        c.execute("CREATE INDEX IF NOT EXISTS idx_paper_topics_topic_date ON paper_topics(topic_id, date);")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_paper_topics_date_topic ON paper_topics(date, topic_id);")
         conn.commit()
         print("Indexes created successfully.")
     except sqlite3.Error as e:
         print(e)
 
 
+# Function to apply the bulk-load PRAGMAs to the build connection
+def apply_bulk_load_pragmas(conn):
+    try:
+        c = conn.cursor()
+        for pragma in BULK_LOAD_PRAGMAS:
+            c.execute(pragma)
+    except sqlite3.Error as e:
+        print(e)
+
+
+# Function to apply the ingest PRAGMAs to the connection of an incremental ingest or a migration
+def apply_ingest_pragmas(conn):
+    try:
+        c = conn.cursor()
+        for pragma in INGEST_PRAGMAS:
+            c.execute(pragma)
+    except sqlite3.Error as e:
+        print(e)
+
+
+# Function to apply the serving PRAGMAs once the build is done
+def apply_serving_pragmas(conn):
+    try:
+        c = conn.cursor()
+        for pragma in SERVING_PRAGMAS:
+            c.execute(pragma)
+    except sqlite3.Error as e:
+        print(e)
+
+
+# Function to get the column names of a table, in schema order
+def get_table_columns(conn, table_name):
+    c = conn.cursor()
+    c.execute(f"PRAGMA table_info({table_name})")
+    return [row[1] for row in c.fetchall()]
+
+
+# Function to read a CSV file in chunks. Everything is read as text (the column affinities of the tables convert
+# numbers back on insert), so the row hashes don't depend on the dtypes pandas happens to infer for each chunk.
+def read_csv_chunks(csv_file_path, chunksize):
+    return pd.read_csv(csv_file_path, chunksize=chunksize, dtype=str)
+
+
+# Function to add the content hash of each row of a chunk as the row_hash column
+def add_row_hash(chunk):
+    hashes = pd.util.hash_pandas_object(chunk, index=False)
+    return chunk.assign(row_hash=hashes.to_numpy().view('int64'))
+
+
+# Function to turn a chunk of a CSV file into rows that sqlite3 can bind (NaN -> NULL, numpy -> Python types)
+def chunk_to_rows(chunk):
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    return chunk.itertuples(index=False, name=None)
+
+
+# Function to pick the CSV columns that exist in the table (row_hash is always computed, never imported)
+def get_import_columns(chunk, table_name, table_columns):
+    columns = [column for column in chunk.columns if column in table_columns and column != 'row_hash']
+    skipped = [column for column in chunk.columns if column not in columns]
+    if skipped:
+        print(f"Columns not in table {table_name}, skipping: {', '.join(skipped)}")
+    return columns
+
+
 # Function to import CSV data into the database
-def import_csv_to_db(csv_file_path, table_name, conn):
-    df = pd.read_csv(csv_file_path)
+def import_csv_to_db(csv_file_path, table_name, conn, chunksize=DEFAULT_CHUNKSIZE, trace_memory=False):
+    """
+    Streams a CSV file into a table created by create_tables, replacing its current rows.
+
+    The file is read in chunks of `chunksize` rows, so memory use is bounded by the chunk size and not
+    by the size of the file. All chunks are inserted in a single transaction. Only the CSV columns that
+    exist in the table are imported. A key in UPSERT_KEYS that occurs more than once keeps the values of its
+    last row, as in upsert_csv_to_db.
+
+    Args:
+    csv_file_path (str): Path to the CSV file.
+    table_name (str): Name of the (pre-created) table to fill.
+    conn (sqlite3.Connection): Connection to the database.
+    chunksize (int): Number of CSV rows held in memory at a time.
+    trace_memory (bool): Measure the peak memory allocated by Python during the import with tracemalloc, which
+                         slows the import down.
+
+    Returns:
+    dict: Number of rows read and inserted, elapsed seconds, rows/sec and peak memory in bytes (None unless
+          trace_memory is set), or None if the import failed.
+    """
+    key = UPSERT_KEYS[table_name]
+    table_columns = get_table_columns(conn, table_name)
+    tracing = trace_memory and tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    elif trace_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    rows_read = 0
+    peak_memory = None
     try:
-        df.to_sql(table_name, conn, if_exists='replace', index=False)
-        print(f"Data imported successfully into {table_name}.")
+        c = conn.cursor()
+        # Databases built with to_sql lost their UNIQUE constraints, which ON CONFLICT needs
+        if not has_unique_index(conn, table_name, key):
+            c.execute(f"CREATE UNIQUE INDEX idx_{table_name}_{key}_unique ON {table_name}({key})")
+        c.execute(f"DELETE FROM {table_name}")
+        insert_sql = None
+        for chunk in read_csv_chunks(csv_file_path, chunksize):
+            if insert_sql is None:
+                columns = get_import_columns(chunk, table_name, table_columns)
+                update_list = ', '.join(f"{column} = excluded.{column}" for column in columns + ['row_hash']
+                                        if column != key)
+                insert_sql = (f"INSERT INTO {table_name} ({', '.join(columns)}, row_hash) "
+                              f"VALUES ({', '.join(['?'] * (len(columns) + 1))}) "
+                              f"ON CONFLICT ({key}) DO UPDATE SET {update_list}")
+            c.executemany(insert_sql, chunk_to_rows(add_row_hash(chunk[columns])))
+            rows_read += len(chunk)
+        conn.commit()
+        c.execute(f"SELECT COUNT(*) FROM {table_name}")
+        rows_inserted = c.fetchone()[0]
     except sqlite3.Error as e:
+        conn.rollback()
         print(e)
+        return None
+    finally:
+        if trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            if not tracing:
+                tracemalloc.stop()
+
+    elapsed = time.perf_counter() - start_time
+    stats = {
+        'rows_read': rows_read,
+        'rows_inserted': rows_inserted,
+        'seconds': elapsed,
+        'rows_per_sec': rows_read / elapsed if elapsed > 0 else float('inf'),
+        'peak_memory': peak_memory,
+    }
+    print(f"Data imported successfully into {table_name}: {rows_inserted:,} of {rows_read:,} rows "
+          f"in {elapsed:.1f}s ({stats['rows_per_sec']:,.0f} rows/sec"
+          + (f", peak memory {peak_memory / 2 ** 20:.1f} MiB)." if peak_memory is not None else ")."))
+    if rows_read > rows_inserted:
+        print(f"{rows_read - rows_inserted:,} rows of {csv_file_path} repeated an earlier key; the last one was used.")
+    return stats
+
+
+# Function to check whether a column is covered by a UNIQUE constraint or index of its own
+def has_unique_index(conn, table_name, column_name):
+    c = conn.cursor()
+    c.execute(f"PRAGMA index_list({table_name})")
+    for index in c.fetchall():
+        index_name, unique = index[1], index[2]
+        if unique:
+            c.execute(f"PRAGMA index_info('{index_name}')")
+            if [row[2] for row in c.fetchall()] == [column_name]:
+                return True
+    return False
+
+
+# Function to start a new incremental ingest batch
+def start_ingest_batch(conn):
+    c = conn.cursor()
+    c.execute("INSERT INTO ingest_batches (started_at) VALUES (datetime('now'))")
+    conn.commit()
+    return c.lastrowid
+
+
+# Function to mark an incremental ingest batch as finished
+def finish_ingest_batch(conn, batch_id):
+    conn.execute("UPDATE ingest_batches SET finished_at = datetime('now') WHERE id = ?", (batch_id,))
+    conn.commit()
+
+
+# Function to upsert a delta CSV into a table, recording what changed in ingest_changes
+def upsert_csv_to_db(csv_file_path, table_name, conn, batch_id, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Inserts the new rows of a CSV file into a table and updates the rows whose content changed.
+
+    Rows are matched on the table's key in UPSERT_KEYS. The chunks of the file are first collected in a staging
+    table keyed on it, so a key that occurs more than once in the file is upserted once with its last row. Each
+    incoming row is hashed and compared with the row_hash stored in the table, so unchanged rows are skipped
+    without touching the table. Every inserted
+    or updated key is recorded in ingest_changes under `batch_id`; updates also store the previous values
+    of the CHANGESET_OLD_VALUES columns as JSON.
+
+    Args:
+    csv_file_path (str): Path to the delta CSV file, with the same columns as the full CSV.
+    table_name (str): Name of the table to upsert into.
+    conn (sqlite3.Connection): Connection to the database.
+    batch_id (int): Id of the ingest batch from start_ingest_batch.
+    chunksize (int): Number of CSV rows held in memory at a time.
+
+    Returns:
+    dict: Number of rows read, of distinct keys staged, and of keys inserted, updated and unchanged, or None if
+          the upsert failed.
+    """
+    key = UPSERT_KEYS[table_name]
+    table_columns = get_table_columns(conn, table_name)
+    column_types = {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+    old_values_sql = ', '.join(f"'{column}', t.{column}" for column in CHANGESET_OLD_VALUES[table_name])
+    rows_read = 0
+    try:
+        c = conn.cursor()
+        # Databases built with to_sql lost their UNIQUE constraints, which ON CONFLICT needs
+        if not has_unique_index(conn, table_name, key):
+            c.execute(f"CREATE UNIQUE INDEX idx_{table_name}_{key}_unique ON {table_name}({key})")
+        c.execute("SELECT COALESCE(MAX(rowid), 0) FROM ingest_changes")
+        last_change = c.fetchone()[0]
+        columns = None
+        for chunk in read_csv_chunks(csv_file_path, chunksize):
+            if columns is None:
+                columns = get_import_columns(chunk, table_name, table_columns) + ['row_hash']
+                column_list = ', '.join(columns)
+                # Same column types as the table, and the key as primary key so a later row of a key replaces the
+                # earlier one, also when they are in different chunks
+                column_defs = ', '.join(f"{column} {column_types[column]}" + (" PRIMARY KEY" if column == key else "")
+                                        for column in columns)
+                c.execute("DROP TABLE IF EXISTS temp.ingest_staging")
+                c.execute(f"CREATE TEMP TABLE ingest_staging ({column_defs})")
+            rows_read += len(chunk)
+            chunk = add_row_hash(chunk[columns[:-1]])
+            c.executemany(f"INSERT OR REPLACE INTO temp.ingest_staging ({column_list}) "
+                          f"VALUES ({', '.join(['?'] * len(columns))})", chunk_to_rows(chunk))
+
+        rows_staged = 0
+        if columns is not None:
+            c.execute("SELECT COUNT(*) FROM temp.ingest_staging")
+            rows_staged = c.fetchone()[0]
+
+            # Record the changeset before the upsert overwrites the old values
+            c.execute(f"""
+                INSERT INTO ingest_changes (batch_id, table_name, key, op, old_values)
+                SELECT ?, ?, s.{key},
+                       CASE WHEN t.{key} IS NULL THEN 'insert' ELSE 'update' END,
+                       CASE WHEN t.{key} IS NULL THEN NULL ELSE json_object({old_values_sql}) END
+                FROM temp.ingest_staging s
+                LEFT JOIN {table_name} t ON t.{key} = s.{key}
+                WHERE t.{key} IS NULL OR t.row_hash IS NOT s.row_hash
+            """, (batch_id, table_name))
+
+            # WHERE true is needed to parse ON CONFLICT after INSERT ... SELECT
+            update_list = ', '.join(f"{column} = excluded.{column}" for column in columns if column != key)
+            c.execute(f"""
+                INSERT INTO {table_name} ({column_list})
+                SELECT {column_list} FROM temp.ingest_staging WHERE true
+                ON CONFLICT ({key}) DO UPDATE SET {update_list}
+                WHERE {table_name}.row_hash IS NOT excluded.row_hash
+            """)
+
+        c.execute("DROP TABLE IF EXISTS temp.ingest_staging")
+        conn.commit()
+        c.execute("""
+            SELECT op, COUNT(*) FROM ingest_changes
+            WHERE batch_id = ? AND table_name = ? AND rowid > ?
+            GROUP BY op
+        """, (batch_id, table_name, last_change))
+        counts = dict(c.fetchall())
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(e)
+        return None
+
+    stats = {
+        'rows_read': rows_read,
+        'rows_staged': rows_staged,
+        'inserted': counts.get('insert', 0),
+        'updated': counts.get('update', 0),
+    }
+    stats['unchanged'] = rows_staged - (stats['inserted'] + stats['updated'])
+    print(f"Data upserted successfully into {table_name}: {stats['inserted']:,} inserted, "
+          f"{stats['updated']:,} updated, {stats['unchanged']:,} unchanged.")
+    if rows_read > rows_staged:
+        print(f"{rows_read - rows_staged:,} rows of {csv_file_path} repeated an earlier key; the last one was used.")
+    return stats
+
+
+# Function to read the changeset of an ingest batch
+def get_changeset(conn, batch_id, table_name):
+    """
+    Returns the rows of `table_name` inserted or updated by an ingest batch.
+
+    Derived tables use this to refresh only what the batch touched instead of being rebuilt.
+
+    Args:
+    conn (sqlite3.Connection): Connection to the database.
+    batch_id (int): Id of the ingest batch.
+    table_name (str): Name of the source table.
+
+    Returns:
+    list: (key, op, old_values) tuples, where op is 'insert' or 'update' and old_values is a dict of the
+          CHANGESET_OLD_VALUES columns before the update (None for inserts).
+    """
+    c = conn.cursor()
+    c.execute("""
+        SELECT key, op, old_values FROM ingest_changes
+        WHERE batch_id = ? AND table_name = ?
+    """, (batch_id, table_name))
+    return [(key, op, json.loads(old_values) if old_values is not None else None)
+            for key, op, old_values in c.fetchall()]
+
+
+# Function to (re)build the tables derived from the imported ones
+def build_derived_tables(conn):
+    create_topic_descendants.build_topic_descendants(conn)
+    create_topic_intervals.build_topic_intervals(conn)
+    create_paper_topics.build_paper_topics(conn)
+    create_topic_counts.build_topic_counts(conn)
+    create_fulltext_index.build_fulltext_index(conn)
+
+
+# Function to refresh the derived tables with the changes of an incremental ingest batch
+def refresh_derived_tables(conn, batch_id):
+    tagged_paper_urls = [key for key, _, _ in get_changeset(conn, batch_id, 'tagged_papers')]
+
+    topic_changes = get_changeset(conn, batch_id, 'topics')
+    labels_changed = False
+    if topic_changes:
+        # The closure pairs and day counts before the change tell which rows of the count cube it touches
+        create_topic_counts.save_count_inputs(conn)
+        # Only the closure pairs and intervals of the changed topics are updated
+        create_topic_descendants.update_topic_descendants(conn, topic_changes)
+        create_topic_intervals.build_topic_intervals(conn)
+        labels = create_topic_descendants.get_topic_labels(conn.cursor(), [s for s, _, _ in topic_changes])
+        labels_changed = any(op == 'insert' or old_values['prefLabel'] != labels.get(s)
+                             for s, op, old_values in topic_changes)
+
+    if labels_changed:
+        # New or renamed labels can remap any paper's topics, so paper_topics is rebuilt
+        create_paper_topics.build_paper_topics(conn)
+    else:
+        # The counts of the changed papers are taken out before their paper_topics rows change
+        if not topic_changes:
+            create_topic_counts.update_topic_counts(conn, tagged_paper_urls, -1)
+        create_paper_topics.refresh_paper_topics(conn, tagged_paper_urls)
+
+    if topic_changes:
+        # Only the count rows of the topics whose descendants or whose descendants' counts changed are recomputed
+        create_topic_counts.refresh_topic_counts(conn)
+    else:
+        create_topic_counts.update_topic_counts(conn, tagged_paper_urls, 1)
+
+    # The triggers on tagged_papers have kept the full-text index in sync during the upsert
+    create_fulltext_index.refresh_fulltext_index(conn)
+
+
+# Function to compare the incrementally maintained topic tables with a full rebuild
+def check_derived_tables(conn):
+    """
+    Checks topic_descendants and the topic intervals against a full rebuild computed in memory.
+
+    Args:
+    conn (sqlite3.Connection): Connection to the database.
+
+    Returns:
+    bool: True if both match the full rebuild.
+    """
+    differences = create_topic_descendants.check_topic_descendants(conn)
+    for topic, descendant, stored, expected in differences[:20]:
+        print(f"topic_descendants {topic} -> {descendant}: depth {stored}, full rebuild {expected}")
+    print(f"topic_descendants: {len(differences):,} pairs differ from a full rebuild.")
+
+    renumbered = create_topic_intervals.check_topic_intervals(conn)
+    for s in renumbered[:20]:
+        print(f"topics {s}: lo, hi or tree_level differ from a full rebuild")
+    print(f"topics: {len(renumbered):,} intervals differ from a full rebuild.")
+    return not differences and not renumbered
 
 
 # Main function to create and populate the database
 def main():
+    parser = argparse.ArgumentParser(description="Create and populate the TabulAI database from the CSV files.")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help=f"CSV rows held in memory at a time while importing (default: {DEFAULT_CHUNKSIZE})")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="report the peak memory of each CSV import (tracemalloc, slows the import down)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="upsert the CSV files into the existing database instead of rebuilding it")
+    parser.add_argument('--migrate', action='store_true',
+                        help="only bring an existing database to the current schema and build the derived tables")
+    parser.add_argument('--check', action='store_true',
+                        help="only check the topic closure and intervals against a full rebuild")
+    parser.add_argument('--papers-csv', default='kaggle_dump_full.csv', help="CSV file for the papers table")
+    parser.add_argument('--topics-csv', default='topic_tree_with_levels.csv', help="CSV file for the topics table")
+    parser.add_argument('--tagged-papers-csv', default='tagged_papers_full.csv',
+                        help="CSV file for the tagged_papers table")
+    args = parser.parse_args()
+
     database = 'app_data.db'
     conn = create_connection(database)
-    if conn is not None:
+    if conn is not None and args.check:
+        consistent = check_derived_tables(conn)
+        conn.close()
+        sys.exit(0 if consistent else 1)
+    elif conn is not None:
+        if args.incremental or args.migrate:
+            apply_ingest_pragmas(conn)
+        else:
+            apply_bulk_load_pragmas(conn)
         create_tables(conn)
 
         # List of CSV files to populate the database tables
         csv_files = [
-            ('kaggle_dump_full.csv', 'papers'),
-            ('topic_tree_with_levels.csv', 'topics'),
-            ('tagged_papers_full.csv', 'tagged_papers')
+            (args.papers_csv, 'papers'),
+            (args.topics_csv, 'topics'),
+            (args.tagged_papers_csv, 'tagged_papers')
         ]
 
+        batch_id = start_ingest_batch(conn) if args.incremental else None
+        if not args.incremental and not args.migrate:
+            # The full-text index is rebuilt in one pass after the import instead of row by row
+            create_fulltext_index.drop_fulltext_triggers(conn)
+
         # Checking each CSV file exists in the location before importing
-        for csv_file_path, table_name in csv_files:
+        for csv_file_path, table_name in ([] if args.migrate else csv_files):
             if not os.path.isfile(csv_file_path):
                 print(f"The file {csv_file_path} does not exist. Skipping import for {table_name}.")
+            elif args.incremental:
+                # Only insert or update the rows that are new or changed
+                upsert_csv_to_db(csv_file_path, table_name, conn, batch_id, chunksize=args.chunksize)
             else:
                 # If the file exists, import it into the corresponding table
-                import_csv_to_db(csv_file_path, table_name, conn)
+                import_csv_to_db(csv_file_path, table_name, conn, chunksize=args.chunksize,
+                                 trace_memory=args.trace_memory)
+
+        if batch_id is not None:
+            finish_ingest_batch(conn, batch_id)
+            print(f"Changes of this ingest are recorded in ingest_changes as batch {batch_id}.")
+            refresh_derived_tables(conn, batch_id)
+        else:
+            build_derived_tables(conn)
 
         # Create indexes after tables are populated
         create_indexes(conn)
 
+        # Memory-mapped arrays of the pages (see snapshot_arrays.py)
+        create_topic_cooccurrence.write_cooccurrence(conn)
+        create_topic_postings.write_postings(conn)
+        create_trend_counts.write_trend_counts(conn)
+        if batch_id is not None:
+            # Only the changed papers are vectorized, with the vocabulary and IVF lists of the last full build
+            tagged_paper_urls = [key for key, _, _ in get_changeset(conn, batch_id, 'tagged_papers')]
+            create_paper_vectors.update_paper_vectors(conn, tagged_paper_urls)
+        else:
+            create_paper_vectors.write_paper_vectors(conn)
+
+        # Row counts, distributions and sample rows of the Datasets pages
+        create_table_stats.write_table_stats(conn)
+
+        # Leave the database ready to be read by the app while it is updated
+        apply_serving_pragmas(conn)
+
         # Close the connection to the database
         conn.close()
     else:
@@ -0,0 +1,182 @@
+import os
+import re
+import json
+import time
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+
+import db_manager
+
+# arXiv categories of the papers table (see util/dataset1_arxiv.py)
+ARXIV_CATEGORIES = {'cs.CV', 'cs.CL', 'cs.LG', 'cs.RO', 'cs.AI', 'cs.NE', 'stat.ML', 'cs.MA'}
+
+# Columns of the papers table written by this stage, in the order of kaggle_dump_full.csv
+PAPER_COLUMNS = ['url', 'title', 'categories', 'abstract', 'submission_date', 'authors_parsed']
+
+# Size of the byte ranges of the snapshot handed to the worker processes
+DEFAULT_RANGE_BYTES = 32 * 2 ** 20
+
+# The categories field is matched on the raw line, so the JSON of the (many) papers outside the chosen
+# categories is never parsed
+CATEGORIES_FIELD = re.compile(rb'"categories"\s*:\s*"([^"]*)"')
+
+
+def split_ranges(path, range_bytes):
+    """
+    Split a file into byte ranges of about `range_bytes`. The ranges don't need to fall on line boundaries:
+    a line belongs to the range in which it starts (see filter_range).
+    """
+    size = os.path.getsize(path)
+    return [(start, min(start + range_bytes, size)) for start in range(0, size, range_bytes)]
+
+
+def submission_date(record):
+    """ Date of the first version of a paper as YYYY-MM-DD, falling back to the update date """
+    try:
+        created = record['versions'][0]['created']
+        return datetime.datetime.strptime(created, '%a, %d %b %Y %H:%M:%S %Z').strftime('%Y-%m-%d')
+    except (KeyError, IndexError, ValueError):
+        return record.get('update_date')
+
+
+def filter_range(path, start, end, categories, since=None, until=None):
+    """
+    Parse the lines of one byte range of the arXiv JSON-lines snapshot and keep the matching papers.
+
+    Parameters:
+    path (str): Path of the snapshot file
+    start (int): First byte of the range
+    end (int): Byte after the range; the line starting before `end` is read to its end
+    categories (set): arXiv categories to keep; a paper is kept if it has at least one of them
+    since (str): Keep papers submitted on or after this date (YYYY-MM-DD), or None
+    until (str): Keep papers submitted on or before this date (YYYY-MM-DD), or None
+
+    Returns:
+    tuple: (rows in PAPER_COLUMNS order, number of lines read)
+    """
+    rows = []
+    lines = 0
+    with open(path, 'rb') as f:
+        if start > 0:
+            # Skip the rest of the line that started in the previous range
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            lines += 1
+            match = CATEGORIES_FIELD.search(line)
+            if match is None or categories.isdisjoint(match.group(1).decode().split()):
+                continue
+
+            record = json.loads(line)
+            date = submission_date(record)
+            if (since and date < since) or (until and date > until):
+                continue
+            rows.append((
+                f"https://arxiv.org/abs/{record['id']}",
+                ' '.join(record['title'].split()),
+                record['categories'],
+                ' '.join(record['abstract'].split()),
+                date,
+                json.dumps(record.get('authors_parsed', [])),
+            ))
+    return rows, lines
+
+
+def insert_papers(conn, rows, output_csv=None):
+    """ Insert a batch of filtered papers (and append it to the output CSV, if any) """
+    chunk = pd.DataFrame(rows, columns=PAPER_COLUMNS, dtype=str)
+    if output_csv is not None:
+        chunk.to_csv(output_csv, mode='a', header=not os.path.exists(output_csv), index=False)
+    conn.executemany(
+        f"INSERT OR IGNORE INTO papers ({', '.join(PAPER_COLUMNS)}, row_hash) "
+        f"VALUES ({', '.join(['?'] * (len(PAPER_COLUMNS) + 1))})",
+        db_manager.chunk_to_rows(db_manager.add_row_hash(chunk)))
+
+
+def filter_snapshot(path, conn, categories=ARXIV_CATEGORIES, since=None, until=None, workers=None,
+                    range_bytes=DEFAULT_RANGE_BYTES, output_csv=None):
+    """
+    Stream the arXiv snapshot through a pool of worker processes and write the matching papers to the
+    papers table.
+
+    Each worker parses one byte range at a time. At most two ranges per worker are in flight, so memory
+    stays bounded however large the snapshot is. Rows are inserted in a single transaction as the
+    ranges complete; papers whose url is already in the table are skipped.
+
+    Parameters:
+    path (str): Path of the arXiv JSON-lines snapshot (arxiv-metadata-oai-snapshot.json)
+    conn (sqlite3.Connection): Connection to the database
+    categories (set): arXiv categories to keep
+    since (str): Keep papers submitted on or after this date (YYYY-MM-DD), or None
+    until (str): Keep papers submitted on or before this date (YYYY-MM-DD), or None
+    workers (int): Number of worker processes (default: number of CPUs)
+    range_bytes (int): Size of the byte ranges handed to the workers
+    output_csv (str): Also append the filtered papers to this CSV file, or None
+
+    Returns:
+    dict: Number of lines read and papers kept, elapsed seconds and MB/s
+    """
+    ranges = split_ranges(path, range_bytes)
+    workers = workers or os.cpu_count()
+    start_time = time.perf_counter()
+    lines_read = 0
+    papers_kept = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < 2 * workers:
+                start, end = ranges[next_range]
+                pending.add(executor.submit(filter_range, path, start, end, categories, since, until))
+                next_range += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                rows, lines = future.result()
+                lines_read += lines
+                papers_kept += len(rows)
+                if rows:
+                    insert_papers(conn, rows, output_csv)
+    conn.commit()
+
+    elapsed = time.perf_counter() - start_time
+    megabytes = os.path.getsize(path) / 2 ** 20
+    stats = {'lines_read': lines_read, 'papers_kept': papers_kept, 'seconds': elapsed,
+             'mb_per_sec': megabytes / elapsed if elapsed > 0 else float('inf')}
+    print(f"Filtered {lines_read:,} papers to {papers_kept:,} with {workers} workers in {elapsed:.1f}s "
+          f"({stats['mb_per_sec']:,.1f} MB/s).")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filter the Kaggle arXiv metadata snapshot into the papers table.")
+    parser.add_argument('snapshot', help="path of arxiv-metadata-oai-snapshot.json")
+    parser.add_argument('--since', help="keep papers submitted on or after this date (YYYY-MM-DD)")
+    parser.add_argument('--until', help="keep papers submitted on or before this date (YYYY-MM-DD)")
+    parser.add_argument('--categories', nargs='+', default=sorted(ARXIV_CATEGORIES),
+                        help="arXiv categories to keep (default: the categories of the app)")
+    parser.add_argument('--workers', type=int, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('--range-mb', type=int, default=DEFAULT_RANGE_BYTES // 2 ** 20,
+                        help="size of the byte ranges handed to the workers, in MB")
+    parser.add_argument('--output-csv', help="also write the filtered papers to this CSV file")
+    args = parser.parse_args()
+
+    conn = db_manager.create_connection('app_data.db')
+    if conn is not None:
+        db_manager.apply_bulk_load_pragmas(conn)
+        db_manager.create_tables(conn)
+        filter_snapshot(args.snapshot, conn, set(args.categories), args.since, args.until, args.workers,
+                        args.range_mb * 2 ** 20, args.output_csv)
+        conn.close()
+    else:
+        print("Error! Cannot create the database connection.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import sqlite3
+import os
+import time
+import numpy as np
+
+# Directory of the memory-mapped arrays the app reads (co-occurrence, postings, trend counts, paper vectors), next
+# to app_data.db. Each group of arrays is written by save_arrays with a version stamp, <prefix>_version.npy.
+SNAPSHOT_DIR = 'snapshot'
+
+
+def create_connection(db_file):
+    """ Create a database connection to the SQLite database specified by db_file """
+    conn = None
+    try:
+        conn = sqlite3.connect(db_file)
+        return conn
+    except sqlite3.Error as e:
+        print(e)
+    return conn
+
+
+def save_arrays(directory, prefix, arrays, written=()):
+    """
+    Write a group of arrays as <prefix>_<name>.npy and stamp it with a new <prefix>_version.npy.
+
+    All files are written next to their targets first. The old stamp is removed before they are renamed over the
+    targets and the new one is written last, so the app (see util/snapshot.py) never caches a mix of old and new
+    arrays of the group.
+
+    Parameters:
+    directory (str): Directory of the .npy files
+    prefix (str): Name of the group, e.g. 'trends'
+    arrays (dict): Arrays by name
+    written (list): Names of arrays the caller has already written to <prefix>_<name>.npy.tmp, e.g. a memory-mapped
+                    matrix too large to hold in memory
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        with open(os.path.join(directory, f"{prefix}_{name}.npy.tmp"), 'wb') as file:
+            np.save(file, array)
+
+    stamp_path = os.path.join(directory, f"{prefix}_version.npy")
+    if os.path.isfile(stamp_path):
+        os.remove(stamp_path)
+    for name in list(written) + list(arrays):
+        path = os.path.join(directory, f"{prefix}_{name}.npy")
+        os.replace(f"{path}.tmp", path)
+    with open(f"{stamp_path}.tmp", 'wb') as file:
+        np.save(file, np.array([time.time_ns()], dtype=np.int64))
+    os.replace(f"{stamp_path}.tmp", stamp_path)
@@ -43,7 +43,8 @@ def main():
         - **Dataset 2**: AI Topic List derived from [DBPedia](https://www.dbpedia.org/)
         - **Dataset 3**: (The result) Tagged Papers with AI topics utilizing vector embeddings by [Kagi](https://kagi.com/)
 
-        _**Note**_: You can download the entire dataset by clicking on the top-right CSV-button of each table.
+        _**Note**_: You can download the entire dataset as CSV, compressed CSV or Parquet with the export button 
+        below each table.
         """)
 
     pages = {
@@ -1,21 +1,25 @@
 import streamlit as st
 import pandas as pd
-import datetime
-import plotly.express as px
+import plotly.graph_objects as go
+import pyarrow as pa
 from Home import create_connection, close_connection
+from util.queries import TOPIC_SERIES_COUNTS, in_list
+from util.metadata import database_version, get_metadata
+from util.autocomplete import topic_multiselect
+from util.encodings import PERIOD_FREQUENCIES, period_start
+from util.topic_series import series_frame
+from util.cooccurrence import get_cooccurrence, related_topics
+from util.export import export_button, list_chunks
 
 # Establish connection and get cursor
 conn = create_connection()
 cursor = conn.cursor()
 
-# Fetch topics and date range
-cursor.execute("SELECT prefLabel FROM topics")
-topics = [topic[0] for topic in cursor.fetchall()]
-
-cursor.execute("SELECT date(min(date)), date(max(date)) FROM tagged_papers")
-start_date_str, end_date_str = cursor.fetchone()
-start_date = datetime.datetime.strptime(start_date_str, "%Y-%m-%d")
-end_date = datetime.datetime.strptime(end_date_str, "%Y-%m-%d")
+# Topics and date range, cached for all sessions
+metadata = get_metadata()
+start_date = metadata['start_date']
+end_date = metadata['end_date']
+max_topic_depth = metadata['max_topic_depth']
 
 
 # TITLE/HELP TEXT
@@ -30,11 +34,11 @@ st.markdown(
 
 # WIDGET
 
-selected_topics = st.sidebar.multiselect(
+# The topics matching the search box are looked up on the server, so only those are sent to the browser
+selected_topics = topic_multiselect(
     'Select one or more topics to explore',
-    topics,
-    help='Start typing to see matching topics',
-    key='selected_topic',
+    'topic_search_topics',
+    help='Pick topics from the matches of the search box',
     max_selections=5,
     placeholder='Choose a topic',
 )
@@ -42,7 +46,7 @@ selected_topics = st.sidebar.multiselect(
 
 # VISUALIZATION
 
-def get_data_for_topic(selected_topics, start_date_str, end_date_str):
+def get_data_for_topics(selected_topics, start_date_str, end_date_str, subtopic_depth, period):
     """
     SQL query to fetch data from database
 
@@ -50,26 +54,21 @@ def get_data_for_topic(selected_topics, start_date_str, end_date_str):
     selected_topics (list): Values of the user input from the topic multiselect widget
     start_date_str (str): Start date from slider converted to string
     end_date_str (str): End date from slider converted to string
+    subtopic_depth (int): Number of levels of subtopics counted with each topic
+    period (str): Period the papers are counted by ('week', 'month', 'quarter' or 'year')
 
     Returns:
-    data: Values returned by the SQL query
+    data: (topic, bucket, count) rows returned by the SQL query, for all selected topics
     
     """
     
-    # Join with the topic_descendants table to fetch data for selected topics and their descendants
-    placeholders = ','.join(['?' for _ in selected_topics])
-    query = f"""
-        SELECT strftime('%Y-%m', tp.date) AS month, COUNT(*)
-        FROM tagged_papers tp
-        JOIN topic_descendants td ON td.descendant IN (tp.topic1, tp.topic2, tp.topic3, tp.topic4, tp.topic5)
-        WHERE tp.date BETWEEN ? AND ?
-            AND td.topic IN ({placeholders})
-        GROUP BY month
-        ORDER BY month
-    """
+    # Read the counts of all selected topics from the count cube in one query; they are already rolled up
+    # from their subtopics. The date range covers the whole periods of the start and end dates
+    query = TOPIC_SERIES_COUNTS.format(placeholders=in_list(selected_topics))
 
-    # Parameters include the start date, end date, and selected topics
-    params = [start_date_str, end_date_str] + list(selected_topics)
+    # Parameters include the selected topics, period, first and last bucket, and subtopic depth
+    params = list(selected_topics) + [period, period_start(start_date_str, period),
+                                      period_start(end_date_str, period), subtopic_depth]
 
     print("Query:", query)
     print("Parameters:", params)
@@ -93,30 +92,67 @@ if selected_topics:
     start_date_str = start_date.strftime('%Y-%m-%d')
     end_date_str = end_date.strftime('%Y-%m-%d')
 
+    subtopic_depth = st.sidebar.slider(
+        'How many levels of subtopics should be counted?',
+        min_value=0,
+        max_value=max(max_topic_depth, 1),
+        value=max_topic_depth,
+        help='0 only counts papers tagged with the selected topics, 1 also counts their direct subtopics, and so on',
+        key='subtopic_depth',
+    )
+
+    period = st.sidebar.selectbox(
+        'Count the papers per',
+        list(PERIOD_FREQUENCIES),
+        index=1,
+        key='period',
+    )
+
     # Visualization placeholder
     placeholder = st.empty()
-    fig = px.line()
 
-    # Fetch and plot data for each selected topic
+    # Fetch the data of all selected topics at once, one column per topic
+    data = get_data_for_topics(selected_topics, start_date_str, end_date_str, subtopic_depth, period)
+    df = series_frame(data, selected_topics, period)
     for topic in selected_topics:
-        data = get_data_for_topic([topic], start_date_str, end_date_str)  # Make sure to pass list of one topic
-        if not data:
+        if topic not in df.columns:
             st.info(f"No data available for topic: {topic}")
-        else:
-            df = pd.DataFrame(data, columns=['month', 'count'])
-            df['month'] = pd.to_datetime(df['month'], format="%Y-%m")
-            df.set_index('month', inplace=True)
-            all_months = pd.date_range(start=df.index.min().replace(day=1), end=df.index.max().replace(day=1),
-                                       freq='MS')
-            df_all_months = pd.DataFrame(index=all_months)
-            df_merged = df_all_months.merge(df, how='left', left_index=True, right_index=True)
-            df_merged['count'].fillna(0, inplace=True)
-            fig.add_scatter(x=df_merged.index, y=df_merged['count'], mode='lines+markers', name=topic)
+
+    # Plot all series in one figure, a trace per column
+    fig = go.Figure([go.Scatter(x=df.index, y=df[topic], mode='lines+markers', name=topic) for topic in df.columns])
 
     # Update and show plot
     fig.update_layout(title='Tracking the trends of your selected topics...')
     placeholder.plotly_chart(fig)
 
+    # Export of the series shown, one row per period and a column per topic
+    if not df.empty:
+        series_rows = [(bucket.strftime('%Y-%m-%d'),) + tuple(counts) for bucket, *counts in df.itertuples()]
+        export_button(
+            'Export the series',
+            (database_version(), tuple(selected_topics), start_date_str, end_date_str, subtopic_depth, period),
+            'topic_search_series',
+            [('period', pa.string())] + [(topic, pa.int64()) for topic in df.columns],
+            lambda conn: list_chunks(series_rows),
+            len(series_rows),
+        )
+
+    # RELATED TOPICS: the topics most often tagged together with each selected topic in the years of the range
+    cooccurrence = get_cooccurrence()
+    if cooccurrence is not None:
+        st.subheader('Related topics')
+        st.markdown(f'Topics most often tagged on the same papers from {start_date.year} to {end_date.year}.')
+        for column, topic in zip(st.columns(len(selected_topics)), selected_topics):
+            papers, related = related_topics(cooccurrence, topic, start_date.year, end_date.year)
+            column.markdown(f'**{topic}** ({papers:,} papers)')
+            if related:
+                column.dataframe(
+                    pd.DataFrame(related, columns=['Topic', 'Papers', 'Share']),
+                    column_config={"Share": st.column_config.ProgressColumn(format='%.2f', min_value=0, max_value=1)},
+                    use_container_width=True,
+                    hide_index=True,
+                )
+
 # Close connection
 close_connection(conn)
 
@@ -1,89 +1,427 @@
+import html
+import sqlite3
 import streamlit as st
-import datetime
 import pandas as pd
+import pyarrow as pa
 from Home import create_connection, close_connection
+from util.queries import (TOPIC_DESCENDANTS, PAPERS_FOR_TOPICS_COUNT, PAPERS_FOR_TOPICS_PAGE,
+                          PAPERS_FOR_TOPICS_PAGE_BY_DATE, PAPERS_BY_ID, PAPERS_MATCHING_KEYWORDS,
+                          PAPERS_MATCHING_KEYWORDS_FOR_TOPICS, PAPERS_MATCHING_KEYWORDS_BY_ID,
+                          in_list, match_expression)
+from util.metadata import database_version, get_metadata
+from util.autocomplete import topic_multiselect
+from util.encodings import date_to_day
+from util.postings import get_postings, match_papers, newest_first, page_after
+from util.export import EXPORT_CHUNK_ROWS, cursor_chunks, export_button
+from util.similar import get_vector_index, paper_vectors, similar_papers, vectorize_texts
 
 st.header('PAPER SEARCH')
 st.subheader('Search for papers submitted to arXiv.org using various search criteria.')
-st.markdown('Use the sidebar to filter papers by topics and date range.')
+st.markdown('Use the sidebar to filter papers by topics, keywords and date range, or to find papers similar to a '
+            'description.')
+
+# Number of best matching papers shown for a keyword search
+KEYWORD_RESULTS = 100
+
+# Page sizes of the results and the cursor the first page starts after: the end date and an id above every paper
+PAGE_SIZES = [25, 50, 100]
+LAST_ID = 2 ** 63 - 1
+
+# Above this share of all tagged papers, pages are read from the date index (PAPERS_FOR_TOPICS_PAGE_BY_DATE): a page
+# of 100 papers then reads at most 100 / 0.01 = 10,000 papers. Below it, the matching papers are looked up by topic.
+BROAD_RESULT_SHARE = 0.01
+
+# Columns of the exported results
+PAPER_EXPORT_COLUMNS = [('id', pa.int64()), ('title', pa.string()), ('url', pa.string()),
+                        ('submission_date', pa.string())]
+
+# Number of most similar papers shown for a description or a paper
+SIMILAR_RESULTS = 20
+
+# How several selected topics are combined; 'all' and excluded topics are answered with the inverted topic index
+MATCH_MODES = ['any of these topics', 'all of these topics']
 
 conn = create_connection()
 cursor = conn.cursor()
 
-# Fetch topics and date range
-cursor.execute("SELECT prefLabel FROM topics")
-topics = cursor.fetchall()
-topic_list = [topic[0] for topic in topics]
-
-cursor.execute("SELECT MIN(date), MAX(date) FROM tagged_papers")
-min_date, max_date = cursor.fetchone()
-start_date = datetime.datetime.strptime(min_date, "%Y-%m-%d")
-end_date = datetime.datetime.strptime(max_date, "%Y-%m-%d")
+# Topics and date range, cached for all sessions
+metadata = get_metadata()
+start_date = metadata['start_date']
+end_date = metadata['end_date']
+max_topic_depth = metadata['max_topic_depth']
 
 
 # WIDGET
 
-selected_topic = st.sidebar.multiselect(
+# The topics matching the search box are looked up on the server, so only those are sent to the browser
+selected_topic = topic_multiselect(
     'Select topics',
-    topic_list,
-    help='Start typing to see matching topics',
-    key='selected_topic',
+    'paper_search_topics',
+    help='Pick topics from the matches of the search box',
     placeholder='Choose a topic',
 )
 
+keywords = st.sidebar.text_input(
+    'Search titles and abstracts',
+    key='paper_search_keywords',
+    placeholder='e.g. graph neural network',
+    help='Finds the papers containing all the words, best matches first. Use "quotes" for a phrase '
+         'and a trailing * for words starting with a prefix',
+)
+keyword_query = match_expression(keywords)
+
+similar_text = st.sidebar.text_area(
+    'Find papers similar to',
+    key='paper_search_similar',
+    placeholder='Paste an abstract or describe the paper you are looking for',
+    help='Finds the papers whose title and abstract are closest in meaning to the text, most similar first',
+)
+
 
-def get_data_for_papers(descendants, start_date_str, end_date_str):
+@st.cache_data(max_entries=64)
+def count_papers(descendants, start_date_str, end_date_str, version):
     """
-    SQL query to fetch data from database
+    SQL query to count the papers found, once per filter and database version
 
     Parameters:
-    descendants (list): List of topics that are subtopics of the topic input by the user in the multiselect widget
+    descendants (tuple): Topics and subtopics of the topics selected by the user in the multiselect widget
     start_date_str (str): Start date from slider converted to string
     end_date_str (str): End date from slider converted to string
+    version (tuple): Stamp from database_version (part of the cache key)
+
+    Returns:
+    int: Number of papers tagged with any of the topics in the date range
+    """
+    conn = create_connection()
+    query = PAPERS_FOR_TOPICS_COUNT.format(placeholders=in_list(descendants))
+    count = conn.execute(query, list(descendants) + [start_date_str, end_date_str]).fetchone()[0]
+    close_connection(conn)
+    return count
+
+
+def papers_query(descendants, start_date_str, cursor, limit, broad):
+    """
+    Build the SQL query of the papers found after a cursor, newest first
+
+    Parameters:
+    descendants (list): Topics and subtopics of the topics selected by the user in the multiselect widget
+    start_date_str (str): Start date from slider converted to string
+    cursor (tuple): Date and id of the last paper of the previous page, the papers start after it
+    limit (int): Number of papers, or -1 for all of them
+    broad (bool): Whether the papers found are a large share of all papers, see BROAD_RESULT_SHARE
+
+    Returns:
+    tuple: The query and its parameters
+    """
+    cursor_date, cursor_id = cursor
+    if broad:
+        query = PAPERS_FOR_TOPICS_PAGE_BY_DATE.format(placeholders=in_list(descendants))
+        return query, descendants + [start_date_str, cursor_date, cursor_id, limit]
+    query = PAPERS_FOR_TOPICS_PAGE.format(placeholders=in_list(descendants))
+    return query, descendants + [start_date_str, cursor_date, cursor_date, cursor_id, limit]
+
+
+def get_page_of_papers(descendants, start_date_str, cursor, page_size, broad):
+    """
+    SQL query to fetch one page of the papers found, newest first
+
+    Parameters:
+    descendants (list): Topics and subtopics of the topics selected by the user in the multiselect widget
+    start_date_str (str): Start date from slider converted to string
+    cursor (tuple): Date and id of the last paper of the previous page, the page starts after it
+    page_size (int): Number of papers per page
+    broad (bool): Whether the papers found are a large share of all papers, see BROAD_RESULT_SHARE
 
     Returns:
-    data: Values returned by the SQL query
-    len(data): Length of the data list
-    
+    data: (id, title, URL, submission date, date) of the papers of the page, plus the first paper of the next
+          page if there is one
     """
-    
     conn = create_connection()
-    cursor = conn.cursor()
-
-    # Prepare the query with the correct number of placeholders for descendants
-    # Since we are checking five topic columns, we need to repeat the list of placeholders for each topic column.
-    placeholders = ','.join(['?'] * len(descendants))
-    all_placeholders = ', '.join([placeholders] * 5)  # Repeat placeholders for each of the five topic columns
-    query = f"""
-    SELECT DISTINCT title, url, strftime('%Y-%m-%d', date) as date
-    FROM tagged_papers
-    WHERE (topic1 IN ({placeholders}) OR
-           topic2 IN ({placeholders}) OR
-           topic3 IN ({placeholders}) OR
-           topic4 IN ({placeholders}) OR
-           topic5 IN ({placeholders}))
-          AND date BETWEEN ? AND ?
-    """
-
-    # Parameters include the descendants repeated for each topic column and the date range
-    params = descendants * 5 + [start_date_str, end_date_str]  # Repeat the list of descendants for each topic column
-
-    # Execute the query
-    cursor.execute(query, tuple(params))
-    data = cursor.fetchall()
+    # One more paper than the page holds tells whether there is a next page
+    data = conn.execute(*papers_query(descendants, start_date_str, cursor, page_size + 1, broad)).fetchall()
+    close_connection(conn)
+    return data
+
+
+def export_papers(conn, descendants, start_date_str, first_cursor, broad):
+    """ Yield all the papers found, newest first, in chunks of (id, title, URL, submission date) rows """
+    for rows in cursor_chunks(conn.execute(*papers_query(descendants, start_date_str, first_cursor, -1, broad))):
+        yield [row[:4] for row in rows]
+
 
+def get_page_of_found_papers(paper_ids, paper_days, cursor, page_size):
+    """
+    SQL query to fetch one page of the papers found with the inverted topic index, newest first
+
+    Parameters:
+    paper_ids (np.ndarray): Papers found, ordered by newest_first
+    paper_days (np.ndarray): Their day numbers
+    cursor (tuple): Date and id of the last paper of the previous page, the page starts after it
+    page_size (int): Number of papers per page
+
+    Returns:
+    data: The same rows as get_page_of_papers
+    """
+    cursor_date, cursor_id = cursor
+    page_ids = page_after(paper_ids, paper_days, date_to_day(cursor_date), cursor_id, page_size + 1)
+    if not page_ids:
+        return []
+    conn = create_connection()
+    rows = {row[0]: row for row in conn.execute(PAPERS_BY_ID.format(placeholders=in_list(page_ids)), page_ids)}
     close_connection(conn)
+    return [rows[paper_id] for paper_id in page_ids if paper_id in rows]
 
-    return data, len(data)
 
+def export_found_papers(conn, paper_ids):
+    """ Yield the papers found with the inverted topic index in their order, in chunks of the same rows """
+    for start in range(0, len(paper_ids), EXPORT_CHUNK_ROWS):
+        chunk_ids = paper_ids[start:start + EXPORT_CHUNK_ROWS].tolist()
+        rows = {row[0]: row[:4] for row in conn.execute(PAPERS_BY_ID.format(placeholders=in_list(chunk_ids)),
+                                                        chunk_ids)}
+        yield [rows[paper_id] for paper_id in chunk_ids if paper_id in rows]
 
+
+def get_page_cursors(filters, first_cursor):
+    """
+    Return the cursors of the pages visited since the filters last changed, kept in session state so that
+    Previous goes back a page and Next starts after the last paper shown
+
+    Parameters:
+    filters (tuple): Everything the results depend on; the navigation starts over when it changes
+    first_cursor (tuple): Cursor of the first page
+
+    Returns:
+    list: Cursors of the first page up to the current one
+    """
+    if st.session_state.get('paper_search_filters') != filters:
+        st.session_state['paper_search_filters'] = filters
+        st.session_state['paper_search_cursors'] = [first_cursor]
+    return st.session_state['paper_search_cursors']
+
+
+def next_page():
+    """Start the next page after the last paper shown"""
+    st.session_state['paper_search_cursors'].append(st.session_state['paper_search_next_cursor'])
+
+
+def previous_page():
+    """Go back to the cursor of the previous page"""
+    st.session_state['paper_search_cursors'].pop()
+
+
+def get_papers_matching_keywords(keyword_query, descendants, start_date_str, end_date_str, paper_ids=None):
+    """
+    SQL query to fetch the papers matching the keywords from the full-text index, best matches first
+
+    Parameters:
+    keyword_query (str): FTS5 query built from the keywords typed by the user
+    descendants (list): Topics and subtopics the papers must be tagged with, or an empty list for any topic
+    start_date_str (str): Start date from slider converted to string
+    end_date_str (str): End date from slider converted to string
+    paper_ids (np.ndarray): Papers found with the inverted topic index, used instead of the descendants and dates
+
+    Returns:
+    data: Title, URL, date and abstract snippet of the papers, with the matches marked, or None if the
+          database has no full-text index
+    """
+    conn = create_connection()
+    try:
+        if paper_ids is not None:
+            # The best matches among the papers found, a chunk of ids at a time, merged by their rank
+            data = []
+            for start in range(0, len(paper_ids), EXPORT_CHUNK_ROWS):
+                chunk_ids = paper_ids[start:start + EXPORT_CHUNK_ROWS].tolist()
+                query = PAPERS_MATCHING_KEYWORDS_BY_ID.format(placeholders=in_list(chunk_ids))
+                data += conn.execute(query, [keyword_query] + chunk_ids + [KEYWORD_RESULTS]).fetchall()
+            data.sort(key=lambda row: row[-1])
+            return [row[:-1] for row in data[:KEYWORD_RESULTS]]
+        elif descendants:
+            query = PAPERS_MATCHING_KEYWORDS_FOR_TOPICS.format(placeholders=in_list(descendants))
+            params = [keyword_query] + descendants + [start_date_str, end_date_str, KEYWORD_RESULTS]
+        else:
+            query = PAPERS_MATCHING_KEYWORDS
+            params = [keyword_query, start_date_str, end_date_str, KEYWORD_RESULTS]
+        return conn.execute(query, params).fetchall()
+    except sqlite3.OperationalError as e:
+        print(e)
+        return None
+    finally:
+        close_connection(conn)
+
+
+def mark_matches(text):
+    """Escape a title or snippet for HTML and highlight the matches the query wrapped in char(2) and char(3)"""
+    return html.escape(text or '').replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+
+def show_keyword_results(data):
+    """Show the papers matching the keywords with their highlighted title and abstract snippet"""
+    st.write('Best matching papers:', str(len(data)))
+    for title, url, date, snippet in data:
+        st.markdown(
+            f'<a href="{html.escape(url or "", quote=True)}" target="_blank"><b>{mark_matches(title)}</b></a> '
+            f'<small>({date})</small><br><small>{mark_matches(snippet)}</small>',
+            unsafe_allow_html=True,
+        )
+
+
+def get_similar_papers(queries, exclude_ids=None):
+    """
+    Find the papers most similar to some query vectors with the paper vector index and fetch their details
+
+    Parameters:
+    queries (np.ndarray): Unit query vectors from vectorize_texts or paper_vectors
+    exclude_ids (list): One paper id per query to leave out of its results, or None
+
+    Returns:
+    list: For every query, the (title, URL, submission date, similarity) of the papers, most similar first
+    """
+    results = similar_papers(vector_index, queries, SIMILAR_RESULTS, exclude_ids)
+    paper_ids = sorted({paper_id for result in results for paper_id, _ in result})
+    if not paper_ids:
+        return [[] for _ in results]
+    conn = create_connection()
+    rows = {row[0]: row for row in conn.execute(PAPERS_BY_ID.format(placeholders=in_list(paper_ids)), paper_ids)}
+    close_connection(conn)
+    return [[rows[paper_id][1:4] + (round(similarity, 3),) for paper_id, similarity in result if paper_id in rows]
+            for result in results]
+
+
+def show_similar_papers(data):
+    """Show the papers found by similarity with their similarity to the query"""
+    if not data:
+        st.write('No similar papers found.')
+        return
+    df = pd.DataFrame(data, columns=['Title', 'URL', 'Submission date', 'Similarity'])
+    st.dataframe(
+        df,
+        column_config={
+            "URL": st.column_config.LinkColumn(),
+            "Similarity": st.column_config.ProgressColumn(min_value=0.0, max_value=1.0, format='%.2f'),
+        },
+        use_container_width=True,
+        hide_index=True,
+    )
+
+
+def show_more_like_this(data):
+    """Let the user pick a paper of the page and show the papers most similar to it"""
+    if vector_index is None:
+        return
+    titles = {row[0]: row[1] for row in data}
+    paper_id = st.selectbox(
+        'More like this',
+        list(titles),
+        index=None,
+        format_func=lambda paper_id: titles[paper_id],
+        placeholder='Choose a paper of this page to find similar papers',
+        key='paper_search_more_like',
+    )
+    if paper_id is None:
+        return
+    vectors, paper_ids = paper_vectors(vector_index, [paper_id])
+    if not len(paper_ids):
+        st.write('This paper was added after the paper vectors were built.')
+        return
+    show_similar_papers(get_similar_papers(vectors, paper_ids.tolist())[0])
+
+
+def show_paged_results(number_papers_found, fetch_page, filters, first_cursor, get_export_chunks):
+    """
+    Show one page of the papers found with the navigation between the pages, and the export of all of them
+
+    Parameters:
+    number_papers_found (int): Number of papers found
+    fetch_page (function): Returns the rows of a page from its cursor and the page size, see get_page_of_papers
+    filters (tuple): Everything the results depend on; the navigation starts over when it changes
+    first_cursor (tuple): Cursor of the first page
+    get_export_chunks (function): Returns the chunks of all papers found from a connection, see export_papers
+    """
+    page_size = st.sidebar.selectbox('Papers per page', PAGE_SIZES, index=1, key='paper_search_page_size')
+    cursors = get_page_cursors(filters + (page_size,), first_cursor)
+    data = fetch_page(cursors[-1], page_size)
+    has_next_page = len(data) > page_size
+    data = data[:page_size]
+    if data:
+        st.session_state['paper_search_next_cursor'] = (data[-1][4], data[-1][0])
+
+    # Convert the page into dataframe for display
+    df = pd.DataFrame([row[1:4] for row in data], columns=['Title', 'URL', 'Submission date'])
+
+    # Display results
+    page_count = -(-number_papers_found // page_size)
+    st.write('Number of papers found:', str(number_papers_found))
+    st.dataframe(
+        df,
+        column_config={
+            "URL": st.column_config.LinkColumn(
+            )
+        },
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    previous_column, page_column, next_column = st.columns([1, 2, 1])
+    previous_column.button('Previous', on_click=previous_page, disabled=len(cursors) == 1, use_container_width=True)
+    page_column.markdown(f"<div style='text-align: center'>Page {len(cursors)} of {page_count}</div>",
+                         unsafe_allow_html=True)
+    next_column.button('Next', on_click=next_page, disabled=not has_next_page, use_container_width=True)
+
+    export_button(f'Export all {number_papers_found:,} papers', filters, 'paper_search_results',
+                  PAPER_EXPORT_COLUMNS, get_export_chunks, number_papers_found)
+
+    show_more_like_this(data)
+
+
+def get_descendants(topics, depth):
+    """ Fetch the given topics and their descendants down to a depth from the topic intervals """
+    cursor.execute(TOPIC_DESCENDANTS.format(placeholders=in_list(topics)), tuple(topics) + (depth,))
+    return [desc[0] for desc in cursor.fetchall()]
+
+
+vector_index = get_vector_index()
+if similar_text.strip():
+    st.markdown('#### Papers similar to the description')
+    if vector_index is None:
+        st.write('Similarity search is not available: the paper vectors have not been built yet. '
+                 'Run `python db_manager.py` in the data folder to build them.')
+    else:
+        query_vectors = vectorize_texts(vector_index, [similar_text])
+        if not query_vectors.any():
+            st.write('None of the words of the description occur in the papers.')
+        else:
+            show_similar_papers(get_similar_papers(query_vectors)[0])
+
+descendants = []
+match_all = False
+excluded_topics = []
 if selected_topic:
-    # Fetch precomputed descendants for the selected topics
-    placeholders = ','.join(['?'] * len(selected_topic))
-    cursor.execute(f"SELECT DISTINCT descendant FROM topic_descendants WHERE topic IN ({placeholders})", tuple(selected_topic))
-    descendants = [desc[0] for desc in cursor.fetchall()]
-    descendants.extend(selected_topic)  # Include the main topics themselves
+    subtopic_depth = st.sidebar.slider(
+        'How many levels of subtopics should be included?',
+        min_value=0,
+        max_value=max(max_topic_depth, 1),
+        value=max_topic_depth,
+        help='0 only finds papers tagged with the selected topics, 1 also includes their direct subtopics, and so on',
+        key='subtopic_depth',
+    )
+    descendants = get_descendants(selected_topic, subtopic_depth)
 
+    if len(selected_topic) > 1:
+        match_all = st.sidebar.radio(
+            'Find papers tagged with',
+            MATCH_MODES,
+            key='paper_search_match',
+            help='A paper is tagged with a topic if it is tagged with the topic or one of the subtopics included',
+        ) == MATCH_MODES[1]
+
+    excluded_topics = topic_multiselect(
+        'Exclude papers tagged with',
+        'paper_search_excluded',
+        search_label='Search for a topic to exclude',
+        placeholder='Choose a topic',
+    )
+
+if selected_topic or keyword_query:
     date_interval = st.sidebar.slider(
         'Do you want to narrow down the search by date range (MM-YYYY)?',
         value=(start_date, end_date),
@@ -96,25 +434,55 @@ if selected_topic:
     start_date_str = start_date.strftime('%Y-%m-%d')
     end_date_str = end_date.strftime('%Y-%m-%d')
 
-    data, number_papers_found = get_data_for_papers(descendants, start_date_str, end_date_str)
+    # "All of these topics" and excluded topics are set operations on the posting lists of the topics: one
+    # group per selected topic with its subtopics
+    combine_topics = match_all or bool(excluded_topics)
+    postings = get_postings() if combine_topics else None
+    found_ids = None
+    if postings is not None:
+        groups = [get_descendants([topic], subtopic_depth) for topic in selected_topic]
+        excluded = [get_descendants(excluded_topics, subtopic_depth)] if excluded_topics else []
+        found_ids, found_days = newest_first(postings, match_papers(postings, groups, match_all, excluded),
+                                             date_to_day(start_date_str), date_to_day(end_date_str))
 
-    if not data:
-        st.write('No papers found.')
+    if combine_topics and postings is None:
+        st.write('Combining topics is not available: the topic index has not been built yet. '
+                 'Run `python db_manager.py` in the data folder to build it.')
+    elif keyword_query:
+        data = get_papers_matching_keywords(keyword_query, descendants, start_date_str, end_date_str, found_ids)
+        if data is None:
+            st.write('Keyword search is not available: the database has no full-text index yet. '
+                     'Run `python db_manager.py --migrate` in the data folder to build it.')
+        elif not data:
+            st.write('No papers found.')
+        else:
+            show_keyword_results(data)
+    elif found_ids is not None:
+        if not len(found_ids):
+            st.write('No papers found.')
+        else:
+            show_paged_results(
+                len(found_ids),
+                lambda cursor, page_size: get_page_of_found_papers(found_ids, found_days, cursor, page_size),
+                (database_version(), tuple(selected_topic), tuple(excluded_topics), match_all, subtopic_depth,
+                 start_date_str, end_date_str),
+                (end_date_str, LAST_ID),
+                lambda conn: export_found_papers(conn, found_ids),
+            )
     else:
-        # Convert search output into dataframe for display
-        df = pd.DataFrame(data, columns=['Title', 'URL', 'Submission date'])
-
-        # Display results
-        st.write('Number of papers found:', str(number_papers_found))
-        st.dataframe(
-            df,
-            column_config={
-                "URL": st.column_config.LinkColumn(
-                )
-            },
-            use_container_width=True,
-            hide_index=True,
-        )
+        number_papers_found = count_papers(tuple(descendants), start_date_str, end_date_str, database_version())
+
+        if not number_papers_found:
+            st.write('No papers found.')
+        else:
+            broad = number_papers_found > BROAD_RESULT_SHARE * metadata['row_counts']['tagged_papers']
+            show_paged_results(
+                number_papers_found,
+                lambda cursor, page_size: get_page_of_papers(descendants, start_date_str, cursor, page_size, broad),
+                (database_version(), tuple(descendants), start_date_str, end_date_str),
+                (end_date_str, LAST_ID),
+                lambda conn: export_papers(conn, descendants, start_date_str, (end_date_str, LAST_ID), broad),
+            )
 
 close_connection(conn)
 
@@ -1,21 +1,20 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import datetime
 from datetime import date, timedelta
 from Home import create_connection, close_connection
+from util.queries import TOP_TOPICS
+from util.metadata import database_version, get_metadata
+from util.encodings import date_to_day
+from util.trends import get_trend_counts, level_counts, top_topics, emerging_scores, top_emerging
 
 conn = create_connection()  # connect to the database
 cursor = conn.cursor()  # get a cursor
 
-# SQL query to return start and end dates from database (in string format)
-cursor.execute("SELECT date(min(date)) date FROM tagged_papers")
-start_date_str = cursor.fetchone()[0]
-cursor.execute("SELECT date(max(date)) date FROM tagged_papers")
-end_date_str = cursor.fetchone()[0]
-# Convert string dates to datetime objects for use in widgets
-start_date = datetime.datetime.strptime(start_date_str, "%Y-%m-%d")
-end_date = datetime.datetime.strptime(end_date_str, "%Y-%m-%d")
+# Start and end dates of the tagged papers (datetime objects for use in widgets), cached for all sessions
+metadata = get_metadata()
+start_date = metadata['start_date']
+end_date = metadata['end_date']
 
 
 # TITLE/HELP TEXT
@@ -23,7 +22,11 @@ end_date = datetime.datetime.strptime(end_date_str, "%Y-%m-%d")
 st.header('TOP TRENDS')
 st.subheader('Discover which AI topics were the top trending over the last week, month, year or the time interval of '
              'your choice.')
-st.markdown('You can choose up to 10 top trends to show.')
+st.markdown('You can choose up to 10 top trends to show, ranked by their number of tagged papers or by their momentum: '
+            'how far above their own usual level the topics were tagged in the timeframe.')
+
+# Rankings of the topics; momentum compares the timeframe with the previous timeframes of the same length
+RANKINGS = ['Number of tagged papers', 'Momentum (emerging topics)']
 
 
 # WIDGET
@@ -36,6 +39,8 @@ number_topics = st.sidebar.number_input(
 )
 
 timeframe = 0
+ranking = RANKINGS[0]
+rollup_level = None
 if number_topics > 0:
     timeframe = st.sidebar.radio(
         'Select time interval',
@@ -43,6 +48,30 @@ if number_topics > 0:
         index=None,
         key='timeframe',
     )
+    ranking = st.sidebar.radio(
+        'Rank topics by',
+        RANKINGS,
+        key='trend_ranking',
+        help='Momentum ranks the topics tagged far more often than in the previous timeframes of the same length '
+             '(a z-score against up to 12 of them), with their growth from the previous timeframe and its change',
+    )
+    # Rolling up needs the rolled-up trend counts, built with the trend counts by db_manager.py
+    trend_counts = get_trend_counts()
+    rollup_available = trend_counts is not None and trend_counts['rollup'] is not None
+    rollup_level = st.sidebar.selectbox(
+        'Roll up to level',
+        [None] + sorted(metadata['level_counts']),
+        format_func=lambda level: 'No roll-up (tagged topics)' if level is None
+        else f"Level {level} ({metadata['level_counts'][level]} topics)",
+        key='trend_rollup',
+        disabled=not rollup_available,
+        help='Counts each paper once for the topic of the chosen level above every topic it is tagged with, so a '
+             'topic includes the papers of all its subtopics. Papers only tagged with topics above the level are '
+             'not counted' if rollup_available else
+             'Not available until the trend counts are built: run `python db_manager.py` in the data folder',
+    )
+    if not rollup_available:
+        rollup_level = None
 print(number_topics)
 
 
@@ -75,46 +104,38 @@ end_date_str = end_date.strftime('%Y-%m-%d')
 
 # VISUALIZATION 
 
-def get_data_for_timeframe(start_date_str, end_date_str, number_topics):
+def get_trends(level):
+    """ Return the cumulative trend counts, rolled up to a level if one is given, or None if they haven't been built """
+    trends = get_trend_counts()
+    if trends is None or level is None:
+        return trends
+    return level_counts(trends, level)
+
+
+def get_data_for_timeframe(start_date_str, end_date_str, number_topics, level):
     """
-    SQL query to fetch data from database
+    Fetch the most tagged topics in the timeframe, from the cumulative trend counts if they have been built and
+    with an SQL query otherwise
 
     Parameters:
     start_date_str (str): Start date from slider converted to string
     end_date_str (str): End date from slider converted to string
     number_topics (int): Value input by user in number input box
+    level (int): Level the counts are rolled up to, or None for the tagged topics
 
     Returns:
-    data: Values returned by the SQL query
-        
-    """
-    params = []
-
-    # Append start and end date parameters for each topic column
-    for _ in range(5):
-        params.extend([start_date_str, end_date_str])
-
-    # Append the number_topics parameter for the LIMIT clause
-    params.append(number_topics)
-
-    # SQL query template for each topic column
-    query = f"""
-        SELECT topic, COUNT(*) AS topic_count 
-        FROM (
-            SELECT topic1 AS topic FROM tagged_papers WHERE topic1 IS NOT NULL AND date BETWEEN ? AND ?
-            UNION ALL
-            SELECT topic2 AS topic FROM tagged_papers WHERE topic2 IS NOT NULL AND date BETWEEN ? AND ?
-            UNION ALL
-            SELECT topic3 AS topic FROM tagged_papers WHERE topic3 IS NOT NULL AND date BETWEEN ? AND ?
-            UNION ALL
-            SELECT topic4 AS topic FROM tagged_papers WHERE topic4 IS NOT NULL AND date BETWEEN ? AND ?
-            UNION ALL
-            SELECT topic5 AS topic FROM tagged_papers WHERE topic5 IS NOT NULL AND date BETWEEN ? AND ?
-        ) AS subquery
-        GROUP BY topic
-        ORDER BY topic_count DESC
-        LIMIT ?
+    data: (topic, count) of the top topics, most tagged first, or None for a roll-up that hasn't been built
+
     """
+    trends = get_trends(level)
+    if trends is not None:
+        return top_topics(trends, date_to_day(start_date_str), date_to_day(end_date_str), number_topics)
+    if level is not None:
+        return None
+
+    params = [start_date_str, end_date_str, number_topics]
+
+    query = TOP_TOPICS
 
     print("Query:", query)
     print("Parameters:", params)
@@ -125,17 +146,64 @@ def get_data_for_timeframe(start_date_str, end_date_str, number_topics):
     return data
 
 
+@st.cache_data(max_entries=16)
+def standard_emerging_scores(first_day, last_day, level, version):
+    """
+    Emerging scores of the last 7 days, month and year, computed once per day and database version for all sessions
+
+    Parameters:
+    first_day (int): Day number of the first day of the timeframe
+    last_day (int): Day number of the last day of the timeframe
+    level (int): Level the counts are rolled up to, or None for the tagged topics
+    version (tuple): Stamp from database_version (part of the cache key)
+
+    Returns:
+    dict: Scores from emerging_scores, or None
+    """
+    return emerging_scores(get_trends(level), first_day, last_day)
+
+
+def get_emerging_topics(start_date_str, end_date_str, number_topics, level, custom):
+    """
+    Rank the topics by momentum in the timeframe from the cumulative trend counts
+
+    Parameters:
+    start_date_str (str): Start date from slider converted to string
+    end_date_str (str): End date from slider converted to string
+    number_topics (int): Value input by user in number input box
+    level (int): Level the counts are rolled up to, or None for the tagged topics
+    custom (bool): Whether the timeframe was chosen with the slider, and is computed on demand instead of cached
+
+    Returns:
+    data: (topic, count, growth, acceleration, momentum) of the top topics, highest momentum first, or None if
+          the trend counts haven't been built or there is too little history before the timeframe
+    """
+    trends = get_trends(level)
+    if trends is None:
+        return None
+    first_day, last_day = date_to_day(start_date_str), date_to_day(end_date_str)
+    if custom:
+        scores = emerging_scores(trends, first_day, last_day)
+    else:
+        scores = standard_emerging_scores(first_day, last_day, level, database_version())
+    return top_emerging(trends, scores, number_topics) if scores is not None else None
+
+
 if number_topics:
 
     placeholder = st.empty()
+    emerging = ranking == RANKINGS[1]
 
     # Get data for the given date interval and number of trends
-    data = get_data_for_timeframe(start_date_str, end_date_str, number_topics)
+    if emerging:
+        data = get_emerging_topics(start_date_str, end_date_str, number_topics, rollup_level, timeframe == 'Custom')
+    else:
+        data = get_data_for_timeframe(start_date_str, end_date_str, number_topics, rollup_level)
     print("Fetched data:", data)
 
-    # Extract topics and counts from the data
-    topics = [row[0] for row in data]
-    counts = [row[1] for row in data]
+    # Extract topics and counts (or momentum) from the data
+    topics = [row[0] for row in data or []]
+    counts = [row[4] if emerging else row[1] for row in data or []]
 
     # EnrichMyData colour scheme
     start_color = (142, 45, 226, 255)  # (R, G, B, A)
@@ -153,16 +221,27 @@ if number_topics:
     # Convert the color gradient to Plotly color format (rgba)
     colors = [f'rgba{color}' for color in color_gradient]
 
-    if not data:
+    if emerging and data is None:
+        st.subheader('Momentum is not available for this timeframe')
+        st.write('It needs the trend counts (built by `python db_manager.py` in the data folder) and at least two '
+                 'timeframes of the same length before this one.')
+    elif data is None:
+        st.subheader('Rolled-up counts are not available yet')
+        st.write('They are built with the trend counts: run `python db_manager.py` in the data folder first.')
+    elif not data:
         st.subheader('No data to show for this timeframe')
     elif number_topics > 0:
 
+        level_title = f' of level {rollup_level}' if rollup_level is not None else ''
+
         # Create a new plot
         fig = px.bar(data, x=counts, y=topics, orientation='h', color=topics, color_discrete_sequence=colors)
 
         fig.update_layout(
-            title=f'Top {number_topics} AI topics from {start_date_str} to {end_date_str}',
-            xaxis_title='Number of tagged papers',
+            title=f'Top {number_topics} {"emerging " if emerging else ""}AI topics{level_title} from '
+                  f'{start_date_str} to {end_date_str}',
+            xaxis_title=('Momentum (standard deviations above the usual level)' if emerging
+                         else 'Number of tagged papers'),
             xaxis=dict(
                 tickfont=dict(size=14),
                 titlefont=dict(size=16),
@@ -181,6 +260,20 @@ if number_topics:
         # Show plot
         placeholder.plotly_chart(fig)
 
+        if emerging:
+            st.dataframe(
+                pd.DataFrame([(topic, count, growth * 100, acceleration * 100, momentum)
+                              for topic, count, growth, acceleration, momentum in data],
+                             columns=['Topic', 'Tagged papers', 'Growth', 'Acceleration', 'Momentum']),
+                column_config={
+                    "Growth": st.column_config.NumberColumn(format='%+.0f%%'),
+                    "Acceleration": st.column_config.NumberColumn(format='%+.0f%%'),
+                    "Momentum": st.column_config.NumberColumn(format='%.1f'),
+                },
+                use_container_width=True,
+                hide_index=True,
+            )
+
 close_connection(conn)
 
 # FOOTER with logo at the bottom
@@ -1,19 +1,18 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+from util.metadata import get_metadata
 
 
-# MODULE LOADING FUNCTION
-@st.cache_data
+# DATA LOADING FUNCTION
 def load_data():
-    file_path = 'data/topic_tree_with_levels.csv'  # Update this path
-    data = pd.read_csv(file_path)
-    return data
+    # Number of topics per level of the topics table, from the metadata cache shared by all sessions
+    return pd.Series(get_metadata()['level_counts'])
 
 
 # PIE CHART for TOPICS DISTRIBUTION
-def prepare_chart(data):
-    levels_distribution = data['level'].value_counts().sort_index(ascending=True)
+def prepare_chart(levels_distribution):
+    levels_distribution = levels_distribution.sort_index(ascending=True)
 
     fig = px.pie(
         levels_distribution,
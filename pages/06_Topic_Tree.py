@@ -1,6 +1,7 @@
 import streamlit as st
 import importlib.util
 import sys
+from util.metadata import database_version
 
 
 # MODULE LOADING FUNCTION
@@ -51,14 +52,15 @@ def tree_page():
         main_tree_module = load_module("main_tree_module", "util/main_sunburst.py")
         main_tree_module.main()
 
-    tab2.write("Sunburst for Natural language processing ...")
-    tab3.write("Sunburst Artificial intelligence")
-    tab4.write("Sunburst for Machine translation ...")
-    tab5.write("Sunburst for Knowledge representation ...")
-    tab6.write("Sunburst for Computational linguistics ...")
-    tab7.write("Sunburst for Data mining ...")
-    tab8.write("Sunburst for Data analysis ...")
-    tab9.write("Sunburst for Data science ...")
+    # TABS 2-9: the subtree of one topic each
+    subtree_topics = ["Natural language processing", "Artificial intelligence", "Machine translation",
+                      "Knowledge representation", "Computational linguistics", "Data mining", "Data analysis",
+                      "Data science"]
+    version = database_version()
+    for tab, topic in zip([tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9], subtree_topics):
+        with tab:
+            st.write(f"Sunburst for {topic}")
+            main_tree_module.show_subtree(topic, version)
 
     # FOOTER with logo at the bottom
     with st.container():
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# The data/ builders import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'))
+import create_table_stats  # noqa: E402
+import db_manager  # noqa: E402
+from util.query_plan_guard import check_queries  # noqa: E402
+
+ROOT_TOPIC = 'http://dbpedia.org/resource/Artificial_intelligence'
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """A small database built like app_data.db: the tables, the derived tables and the indexes."""
+    conn = sqlite3.connect(tmp_path / 'app_data.db', isolation_level=None)
+    db_manager.create_tables(conn)
+    topics = [(f"http://dbpedia.org/resource/T{i}", f"Topic {i}",
+               ROOT_TOPIC if i < 3 else f"http://dbpedia.org/resource/T{i % 3}", 1 if i < 3 else 2)
+              for i in range(12)]
+    conn.executemany("INSERT INTO topics (s, prefLabel, broader, level) VALUES (?, ?, ?, ?)", topics)
+    papers = [(f"https://arxiv.org/abs/{i}", f"Paper {i} about learning", 'cs.AI cs.LG', 'An abstract on topics',
+               f"2020-01-{i % 28 + 1:02d}", "[['Doe', 'Jane', '']]") for i in range(60)]
+    conn.executemany("""
+        INSERT INTO papers (url, title, categories, abstract, submission_date, authors_parsed)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, papers)
+    conn.executemany("""
+        INSERT INTO tagged_papers (url, date, title, abstract, topic1, topic2)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(url, date, title, abstract, f"Topic {i % 12}", f"Topic {(i + 5) % 12}")
+          for i, (url, title, _, abstract, date, _) in enumerate(papers)])
+    db_manager.build_derived_tables(conn)
+    db_manager.create_indexes(conn)
+    create_table_stats.write_table_stats(conn)
+    yield conn
+    conn.close()
+
+
+def test_page_queries_have_no_new_full_scans(conn):
+    regressions, proposals = check_queries(conn)
+    assert regressions == []
+    assert proposals == []
+
+
+def test_full_scan_is_reported(conn):
+    regressions, proposals = check_queries(conn, {'abstracts': "SELECT title FROM tagged_papers WHERE abstract = ?"})
+    assert regressions == ['abstracts']
+    assert proposals == ["CREATE INDEX IF NOT EXISTS idx_tagged_papers_abstract ON tagged_papers(abstract);"]
+
+
+def test_temp_btree_not_allowed_is_reported(conn):
+    regressions, _ = check_queries(conn, {'by_title': "SELECT url FROM tagged_papers WHERE date = ? ORDER BY title"})
+    assert regressions == ['by_title']
@@ -0,0 +1,178 @@
+import re
+from bisect import bisect_left
+from collections import Counter
+import streamlit as st
+from util.database import DATABASE_PATH, read_connection
+from util.metadata import database_version
+from util.queries import TOPIC_SYNONYMS
+
+# TOPIC AUTOCOMPLETE: server-side matching of what the user types against the labels (prefLabel) and synonyms
+# (altLabel, separated by '|') of the topics. Every match resolves to the label of its topic. The index is
+# built once per server process in memory:
+# - 'prefixes': sorted (name, synonym?, topic) tuples for every label and synonym, so that the names starting with
+#   the query are found with a binary search
+# - 'words': the same for every word of a name onwards ('language processing' for 'natural language processing')
+# - 'trigrams': the names containing each trigram, for fuzzy matches when no name starts with the query
+AUTOCOMPLETE_LIMIT = 20
+SYNONYM_SEPARATOR = '|'
+
+
+def normalize(text):
+    """Lowercase a name and collapse its whitespace, the form the index and the queries are compared in."""
+    return ' '.join(text.casefold().split())
+
+
+def trigrams(text):
+    """Return the trigrams of a normalized name, padded so that short words have trigrams too."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_topic_index(rows):
+    """
+    Build the autocomplete index of the topics.
+
+    Args:
+    rows (list): (prefLabel, altLabel) rows of the topics table.
+
+    Returns:
+    dict: 'prefixes' and 'words' (sorted lists of (name, whether it is a synonym, topic)), 'names' (list of
+          (name, topic) for every label and synonym) and 'trigrams' (dict of the positions in 'names' by trigram).
+    """
+    names = []
+    for label, synonyms in rows:
+        if not label:
+            continue
+        names.append((normalize(label), False, label))
+        for synonym in (synonyms or '').split(SYNONYM_SEPARATOR):
+            if synonym.strip():
+                names.append((normalize(synonym), True, label))
+
+    # Each word onwards, except the first one, which is the whole name
+    words = [(name[match.start():], is_synonym, label)
+             for name, is_synonym, label in names for match in re.finditer(r'(?<= )\S', name)]
+
+    index_trigrams = {}
+    for position, (name, _, _) in enumerate(names):
+        for trigram in trigrams(name):
+            index_trigrams.setdefault(trigram, []).append(position)
+    return {'prefixes': sorted(names), 'words': sorted(words),
+            'names': [(name, label) for name, _, label in names], 'trigrams': index_trigrams}
+
+
+def prefix_matches(keys, query, limit):
+    """
+    Return the topics of the first names in `keys` starting with the query, labels before synonyms and
+    shorter names first.
+    """
+    ranks = {}
+    position = bisect_left(keys, (query,))
+    while position < len(keys) and keys[position][0].startswith(query) and len(ranks) < limit:
+        name, is_synonym, label = keys[position]
+        ranks[label] = min(ranks.get(label, (is_synonym, len(name))), (is_synonym, len(name)))
+        position += 1
+    return sorted(ranks, key=lambda label: (ranks[label], label))
+
+
+def complete_topics(index, query, limit=AUTOCOMPLETE_LIMIT):
+    """
+    Return the topics matching what the user typed, best matches first.
+
+    Topics whose label or synonym starts with the query come first, then topics with a word starting with the
+    query. If no name starts with the query, the topics whose names share the most trigrams with it are returned
+    instead, so that a typo still finds the topic.
+
+    Args:
+    index (dict): Index from build_topic_index.
+    query (str): What the user typed.
+    limit (int): Maximum number of topics to return.
+
+    Returns:
+    list: Topic labels (prefLabel), without duplicates.
+    """
+    query = normalize(query)
+    if not query:
+        return []
+
+    matches = prefix_matches(index['prefixes'], query, limit)
+    for label in prefix_matches(index['words'], query, limit):
+        if len(matches) < limit and label not in matches:
+            matches.append(label)
+
+    if not matches and len(query) >= 3:
+        query_trigrams = trigrams(query)
+        shared = Counter()
+        for trigram in query_trigrams:
+            for position in index['trigrams'].get(trigram, []):
+                shared[position] += 1
+        # At least half of the query's trigrams have to be in the name
+        for position, count in shared.most_common():
+            if count < len(query_trigrams) / 2 or len(matches) >= limit:
+                break
+            label = index['names'][position][1]
+            if label not in matches:
+                matches.append(label)
+    return matches
+
+
+@st.cache_resource(max_entries=1)
+def load_topic_index(path, version):
+    """
+    Build the autocomplete index from the database. Cached per database version, like the metadata.
+
+    Args:
+    path (str): Path of the database file.
+    version (tuple): Stamp from database_version (part of the cache key).
+
+    Returns:
+    dict: Index from build_topic_index.
+    """
+    with read_connection(path) as conn:
+        rows = conn.execute(TOPIC_SYNONYMS).fetchall()
+    return build_topic_index(rows)
+
+
+def get_topic_index():
+    """Return the cached autocomplete index, rebuilding it if the database has changed since."""
+    return load_topic_index(DATABASE_PATH, database_version())
+
+
+def topic_options(query, selected):
+    """
+    Return the options of a topic multiselect: the topics already selected, then the topics matching the query.
+
+    Args:
+    query (str): What the user typed in the topic search box.
+    selected (list): Topics currently selected in the multiselect.
+
+    Returns:
+    list: Topic labels, without duplicates.
+    """
+    return list(dict.fromkeys(list(selected) + complete_topics(get_topic_index(), query)))
+
+
+def topic_multiselect(label, state_key, search_label='Search for a topic', **kwargs):
+    """
+    Show a topic search box and a multiselect of the selected topics and the matches of the search in the sidebar.
+
+    Args:
+    label (str): Label of the multiselect.
+    state_key (str): Session state key the selection is kept under (one per page).
+    search_label (str): Label of the search box.
+    **kwargs: Further arguments of st.multiselect, e.g. max_selections.
+
+    Returns:
+    list: The selected topics.
+    """
+    query = st.sidebar.text_input(
+        search_label,
+        key=f'{state_key}_query',
+        placeholder='Type a topic or one of its synonyms',
+        help='Topic names and their synonyms are matched; press Enter to update the list below',
+    )
+    selected = st.session_state.get(state_key, [])
+    # The options change with the search, which resets a widget with a key, so the multiselect has none: the
+    # selection is kept in session state and passed back as its default
+    selection = st.sidebar.multiselect(label, topic_options(query, selected), default=selected, **kwargs)
+    st.session_state[state_key] = selection
+    return selection
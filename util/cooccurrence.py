@@ -0,0 +1,82 @@
+import os
+import numpy as np
+import streamlit as st
+from util.database import read_connection
+from util.metadata import database_version
+from util.queries import TOPIC_IDS
+from util.snapshot import SNAPSHOT_DIR, array_version
+
+# TOPIC CO-OCCURRENCE: the number of papers tagged with each pair of topics per year, written by
+# data/create_topic_cooccurrence.py as memory-mapped CSR arrays (see there for the layout)
+COOCCURRENCE_ARRAYS = ['years', 'indptr', 'indices', 'counts']
+RELATED_TOPICS_LIMIT = 10
+
+
+@st.cache_resource(max_entries=1)
+def open_cooccurrence(directory, version):
+    """
+    Memory-map the co-occurrence arrays and load the id of every topic label.
+
+    Args:
+    directory (str): Directory of the .npy files.
+    version (tuple): Version stamp of the arrays and the database (part of the cache key).
+
+    Returns:
+    dict: The COOCCURRENCE_ARRAYS, 'topic_ids' (id by label) and 'labels' (label by id).
+    """
+    matrix = {name: np.load(os.path.join(directory, f"cooccurrence_{name}.npy"), mmap_mode='r')
+              for name in COOCCURRENCE_ARRAYS}
+    with read_connection() as conn:
+        matrix['topic_ids'] = dict(conn.execute(TOPIC_IDS).fetchall())
+    matrix['labels'] = {topic_id: label for label, topic_id in matrix['topic_ids'].items()}
+    return matrix
+
+
+def get_cooccurrence():
+    """Return the co-occurrence matrix, or None if it hasn't been built."""
+    version = array_version('cooccurrence')
+    if version is None:
+        return None
+    matrix = open_cooccurrence(SNAPSHOT_DIR, (version,) + database_version())
+    # Not if the arrays were replaced while they were being mapped
+    return matrix if array_version('cooccurrence') == version else None
+
+
+def related_topics(matrix, topic, first_year, last_year, limit=RELATED_TOPICS_LIMIT):
+    """
+    Return the topics most often tagged together with a topic in a range of years.
+
+    Args:
+    matrix (dict): Matrix from get_cooccurrence.
+    topic (str): Topic label.
+    first_year (int): First year counted.
+    last_year (int): Last year counted.
+    limit (int): Maximum number of related topics.
+
+    Returns:
+    tuple: (number of papers of the topic, list of (related topic, papers tagged with both, share of the topic's
+           papers)) with the related topics ordered by the number of papers tagged with both.
+    """
+    topic_id = matrix['topic_ids'].get(topic)
+    years, indptr = matrix['years'], matrix['indptr']
+    if topic_id is None or len(years) == 0:
+        return 0, []
+    topic_count = (len(indptr) - 1) // len(years)
+
+    # The row of the topic in every year of the range, added up
+    first, last = np.searchsorted(years, [first_year, last_year + 1])
+    rows = [year * topic_count + topic_id for year in range(first, last)]
+    indices = np.concatenate([matrix['indices'][indptr[row]:indptr[row + 1]] for row in rows] or [[]])
+    counts = np.concatenate([matrix['counts'][indptr[row]:indptr[row + 1]] for row in rows] or [[]])
+    totals = np.bincount(indices.astype(np.int64), weights=counts, minlength=topic_count)
+    papers = int(totals[topic_id])
+    totals[topic_id] = 0
+
+    # Top `limit` entries without sorting the whole row
+    limit = min(limit, int(np.count_nonzero(totals)))
+    if limit == 0:
+        return papers, []
+    top = np.argpartition(-totals, limit - 1)[:limit]
+    top = top[np.argsort(-totals[top], kind='stable')]
+    return papers, [(matrix['labels'][topic_id], int(totals[topic_id]), totals[topic_id] / papers)
+                    for topic_id in top.tolist()]
@@ -0,0 +1,165 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from util.queries import PAGE_QUERIES
+
+# CONNECTION POOL: the pages only read the database, so they share a small pool of read-only connections per
+# server process instead of opening a connection per query. Connections are opened with mode=ro and query_only,
+# and tuned for reading: the database file is memory-mapped and every connection keeps a large page cache.
+# The build (data/db_manager.py) leaves the database in WAL mode, so the pages keep reading while it is updated.
+DATABASE_PATH = 'data/app_data.db'
+POOL_SIZE = 8
+
+# Seconds to wait for a connection when all of them are in use before opening one outside the pool
+POOL_TIMEOUT = 5.0
+
+READ_PRAGMAS = [
+    "PRAGMA query_only = ON;",
+    "PRAGMA mmap_size = 1073741824;",  # map up to 1 GiB of the database file
+    "PRAGMA cache_size = -65536;",  # negative value is in KiB, i.e. 64 MiB per connection
+    "PRAGMA temp_store = MEMORY;",
+]
+
+# Prepared statements kept per connection. sqlite3 caches statements by their SQL text, and a page query with an
+# IN list has one text per list length, so there is room for several variants of every page query.
+CACHED_STATEMENTS = 16 * len(PAGE_QUERIES)
+
+
+def open_read_connection(path):
+    """
+    Open a tuned read-only connection to the database.
+
+    Args:
+    path (str): Path of the database file.
+
+    Returns:
+    sqlite3.Connection: The connection, usable from any thread (the pool hands it to one thread at a time).
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False,
+                           cached_statements=CACHED_STATEMENTS)
+    for pragma in READ_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+# Pools by database file, shared by all sessions of the server process
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+def get_pool(path=DATABASE_PATH):
+    """
+    Return the connection pool of a database file, creating it on first use. A database that is replaced by a new
+    file (a full rebuild) gets a new pool.
+
+    Args:
+    path (str): Path of the database file.
+
+    Returns:
+    dict: 'idle' (queue of idle connections), 'lock' and 'stats' (see pool_stats).
+    """
+    key = (path, os.stat(path).st_ino)
+    with POOLS_LOCK:
+        if key not in POOLS:
+            POOLS[key] = {
+                'idle': queue.LifoQueue(),
+                'lock': threading.Lock(),
+                'stats': {'opened': 0, 'hits': 0, 'waits': 0, 'wait_seconds': 0.0, 'overflows': 0},
+            }
+        return POOLS[key]
+
+
+def add_to_stat(pool, name, value=1):
+    """Add to one of the statistics of a pool."""
+    with pool['lock']:
+        pool['stats'][name] += value
+
+
+def get_connection(path=DATABASE_PATH):
+    """
+    Take a connection from the pool. An idle connection is reused (a hit); if there is none, a new connection is
+    opened while the pool holds fewer than POOL_SIZE, and otherwise the caller waits for one to be released.
+    Every connection has to be given back with release_connection.
+
+    Args:
+    path (str): Path of the database file.
+
+    Returns:
+    sqlite3.Connection: A read-only connection.
+    """
+    pool = get_pool(path)
+    try:
+        conn = pool['idle'].get_nowait()
+        add_to_stat(pool, 'hits')
+        return conn
+    except queue.Empty:
+        pass
+
+    with pool['lock']:
+        can_open = pool['stats']['opened'] < POOL_SIZE
+        if can_open:
+            pool['stats']['opened'] += 1
+    if can_open:
+        return open_read_connection(path)
+
+    start_time = time.perf_counter()
+    try:
+        conn = pool['idle'].get(timeout=POOL_TIMEOUT)
+    except queue.Empty:
+        # Connections that were never released (e.g. a page that raised) are not waited for forever
+        add_to_stat(pool, 'overflows')
+        conn = open_read_connection(path)
+    add_to_stat(pool, 'waits')
+    add_to_stat(pool, 'wait_seconds', time.perf_counter() - start_time)
+    return conn
+
+
+def release_connection(conn, path=DATABASE_PATH):
+    """
+    Give a connection back to the pool, or close it if the pool already holds POOL_SIZE idle connections.
+
+    Args:
+    conn (sqlite3.Connection): Connection from get_connection.
+    path (str): Path of the database file.
+    """
+    if conn is None:
+        return
+    pool = get_pool(path)
+    if conn.in_transaction:
+        conn.rollback()
+    if pool['idle'].qsize() < POOL_SIZE:
+        pool['idle'].put(conn)
+    else:
+        conn.close()
+
+
+@contextmanager
+def read_connection(path=DATABASE_PATH):
+    """Context manager around get_connection and release_connection."""
+    conn = get_connection(path)
+    try:
+        yield conn
+    finally:
+        release_connection(conn, path)
+
+
+def pool_stats(path=DATABASE_PATH):
+    """
+    Return the statistics of the connection pool.
+
+    Args:
+    path (str): Path of the database file.
+
+    Returns:
+    dict: 'opened' (connections opened for the pool), 'hits' (connections reused from the pool), 'waits' and
+          'wait_seconds' (times and total seconds callers waited for a connection), 'overflows' (connections
+          opened outside the pool after POOL_TIMEOUT) and 'idle' (connections in the pool right now).
+    """
+    pool = get_pool(path)
+    with pool['lock']:
+        stats = dict(pool['stats'])
+    stats['idle'] = pool['idle'].qsize()
+    return stats
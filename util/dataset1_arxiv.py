@@ -1,18 +1,18 @@
 import streamlit as st
 import pandas as pd
-from sqlalchemy import create_engine
+from util.table_stats import get_table_stats, sample_frame, show_missing_stats
+from util.export import table_export_button
 
 # DATASET1: arXiv papers from "papers" table in the database
 st.subheader("Dataset 1: The arXiv database with selected categories")
 
 
 def main():
-    # Create a database connection
-    engine = create_engine('sqlite:///data/app_data.db')
-
-    # Load the dataset from the database
-    query = "SELECT * FROM papers"
-    df = pd.read_sql_query(query, engine)
+    # Load the precomputed statistics of the dataset; the table itself is not read
+    stats = get_table_stats('papers')
+    if stats is None:
+        show_missing_stats('papers')
+        return
 
     st.markdown("""
     1. **Description**:
@@ -27,7 +27,7 @@ def main():
     """)
 
     # Print the names of the columns and the total papers in the dataset
-    st.write(f"**Total papers in the dataset**: {len(df)}")
+    st.write(f"**Total papers in the dataset**: {stats['row_count']}")
 
     st.write("#### Name of the List")
     st.markdown(":blue_book: **Database Table**: papers")
@@ -39,7 +39,7 @@ def main():
 
         with col1:
             # Print the shape of the dataset (number of rows and columns)
-            st.write("Shape of the dataset (row, col):", df.shape)
+            st.write("Shape of the dataset (row, col):", (stats['row_count'], len(stats['columns'])))
 
             # Print the names of the columns
             st.write("##### Column Names:")
@@ -53,9 +53,10 @@ def main():
             }
             st.write(column_descriptions)
 
-            # Analyzing the data for presentation
-            category_count = df['categories'].nunique()
-            category_distribution = df['categories'].value_counts().sort_index()
+            # Analyzing the data for presentation (counted when the database was built)
+            category_count = stats['distinct_categories']
+            category_distribution = pd.Series(dict(stats['distribution_categories']), name='count')
+            category_distribution.index.name = 'categories'
 
         with col2:
             st.write(f"##### Number of Categories: {category_count}")
@@ -78,7 +79,10 @@ def main():
             category_distribution_df = category_distribution_df.set_index('Papers')  # Set 'Papers' as index
 
     st.subheader("Dataframe: the arXiv dataset")
-    st.dataframe(df.head(10))
+    st.dataframe(sample_frame(stats))
+
+    # Export of the whole table, streamed from the database
+    table_export_button('papers', stats['row_count'])
 
 
 if __name__ == '__main__':
@@ -1,29 +1,28 @@
 import streamlit as st
 import pandas as pd
-from sqlalchemy import create_engine
+from util.table_stats import get_table_stats, sample_frame, show_missing_stats
+from util.export import table_export_button
 
 # DATASET2: AI topics list from "topics" table in the database
 st.subheader("Dataset 2: AI Topics")
 
 
-@st.cache_resource
 def load_data():
-    # Create a database connection
-    engine = create_engine('sqlite:///data/app_data.db')  # Adjust the path if necessary
-
-    # Load the dataset from the database
-    query = "SELECT * FROM topics"
-    data = pd.read_sql_query(query, engine)
-    return data
+    # Load the precomputed statistics of the dataset; the table itself is not read
+    return get_table_stats('topics')
 
 
 def main():
     # Call the load_data function
-    data = load_data()
+    stats = load_data()
+    if stats is None:
+        show_missing_stats('topics')
+        return
 
-    # Analyzing the data for presentation
-    levels_count = data['level'].nunique()
-    levels_distribution = data['level'].value_counts().sort_index()
+    # Analyzing the data for presentation (counted when the database was built)
+    levels_count = stats['distinct_level']
+    levels_distribution = pd.Series(dict(stats['distribution_level']), name='count')
+    levels_distribution.index.name = 'level'
 
     # Streamlit page setup
     # Create a container for structured layout
@@ -52,7 +51,10 @@ def main():
             st.bar_chart(levels_distribution)
 
     st.subheader("AI Topics List with Levels:")
-    st.dataframe(data.head(10))
+    st.dataframe(sample_frame(stats))
+
+    # Export of the whole table, streamed from the database
+    table_export_button('topics', stats['row_count'])
 
 
 if __name__ == "__main__":
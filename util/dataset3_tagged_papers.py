@@ -1,6 +1,6 @@
 import streamlit as st
-import pandas as pd
-from sqlalchemy import create_engine
+from util.table_stats import get_table_stats, sample_frame, show_missing_stats
+from util.export import table_export_button
 
 # DATASET3: The result of our work after tagging arXiv papers with AI topics
 # The "tagged_papers" dataset is fetched from "tagged_papers" table in the database
@@ -8,30 +8,27 @@ st.subheader("Dataset 3: Tagged Papers")
 
 
 def load_data():
-    # Create a database connection
-    engine = create_engine('sqlite:///data/app_data.db')
-
-    # Load the dataset from the database
-    query = "SELECT * FROM tagged_papers"
-    data = pd.read_sql_query(query, engine)
-    return data
+    # Load the precomputed statistics of the dataset; the table itself is not read
+    return get_table_stats('tagged_papers')
 
 
 # MAIN
 def main():
     # Call the load_data function
-    df = load_data()
-    df.shape
+    stats = load_data()
+    if stats is None:
+        show_missing_stats('tagged_papers')
+        return
 
     st.markdown("""
     #### Name of the List: 
     :blue_book: **Database Table**: tagged_papers """, unsafe_allow_html=True)
 
     # Print the shape of the dataset (number of rows and columns)
-    st.write("Shape of the dataset (row, col):", df.shape)
+    st.write("Shape of the dataset (row, col):", (stats['row_count'], len(stats['columns'])))
 
-    # Count and print the number of unique topics
-    st.write("Number of unique titles:", df['title'].nunique())
+    # Print the number of unique titles (counted when the database was built)
+    st.write("Number of unique titles:", stats['distinct_title'])
 
     # Organizing in containers and columns
     with st.container():
@@ -58,7 +55,10 @@ def main():
 
     # Display the dataframe on the page
     st.write("Sample Data from CSV File:")
-    st.dataframe(df.head())
+    st.dataframe(sample_frame(stats))
+
+    # Export of the whole table, streamed from the database
+    table_export_button('tagged_papers', stats['row_count'])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,58 @@
+import datetime
+
+# DAY NUMBERS: dates stored as the number of days since 1970-01-01 (see data/create_paper_topics.py):
+# - tagged_papers.day and postings_days: the date of each paper
+# - trends_first_day: the day of the first row of the cumulative counts of Top Trends
+# - topic_period_counts.bucket: the first day of a week, month, quarter or year
+# The helpers below translate the dates of the page filters into day numbers.
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def date_to_day(value):
+    """
+    Convert a date to its day number.
+
+    Args:
+    value (datetime.date | datetime.datetime | str): The date; strings in YYYY-MM-DD format (a time part is ignored).
+
+    Returns:
+    int: Days since 1970-01-01.
+    """
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value[:10])
+    elif isinstance(value, datetime.datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+
+def day_to_date(day):
+    """Convert a day number back to a datetime.date."""
+    return EPOCH + datetime.timedelta(days=int(day))
+
+
+# Periods of the topic count cube (data/create_topic_counts.py) and their pandas frequencies, for filling gaps
+PERIOD_FREQUENCIES = {'week': 'W-MON', 'month': 'MS', 'quarter': 'QS', 'year': 'YS'}
+
+
+def period_start(value, period):
+    """
+    Return the first day of the period containing a date, the bucket of the date in the topic count cube.
+
+    Args:
+    value (datetime.date | datetime.datetime | str): The date (anything date_to_day accepts).
+    period (str): 'week' (starting on Monday), 'month', 'quarter' or 'year'; any other period is a single day.
+
+    Returns:
+    int: Day number of the first day of the period.
+    """
+    value = day_to_date(date_to_day(value))
+    if period == 'week':
+        value -= datetime.timedelta(days=value.weekday())
+    elif period == 'month':
+        value = value.replace(day=1)
+    elif period == 'quarter':
+        value = value.replace(month=(value.month - 1) // 3 * 3 + 1, day=1)
+    elif period == 'year':
+        value = value.replace(month=1, day=1)
+    return date_to_day(value)
+
@@ -0,0 +1,225 @@
+import argparse
+import csv
+import gzip
+import os
+import sys
+import tempfile
+import time
+import uuid
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+from util.database import DATABASE_PATH, read_connection
+from util.metadata import database_version
+
+# EXPORT: results and tables are written to a file on the server chunk by chunk, straight from the SQLite cursor,
+# so exporting a million rows holds no more than EXPORT_CHUNK_ROWS of them in memory. The pages offer the finished
+# file for download; `python -m util.export` writes a whole table to a given path without the app.
+EXPORT_FORMATS = {
+    'CSV': ('.csv', 'text/csv'),
+    'CSV (gzip)': ('.csv.gz', 'application/gzip'),
+    'Parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+EXPORT_CHUNK_ROWS = 10_000
+
+# Exports of the pages are written here and deleted when older than EXPORT_MAX_AGE seconds
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), 'tabulai_exports')
+EXPORT_MAX_AGE = 3600
+
+# Tables that can be exported whole, and internal bookkeeping columns left out
+EXPORT_TABLES = ['papers', 'topics', 'tagged_papers']
+EXCLUDED_COLUMNS = {'row_hash'}
+
+
+def cursor_chunks(cursor):
+    """Yield the rows of an executed query EXPORT_CHUNK_ROWS at a time."""
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        if not rows:
+            return
+        yield rows
+
+
+def list_chunks(rows):
+    """Yield the rows of a list EXPORT_CHUNK_ROWS at a time."""
+    for start in range(0, len(rows), EXPORT_CHUNK_ROWS):
+        yield rows[start:start + EXPORT_CHUNK_ROWS]
+
+
+def table_columns(conn, table_name):
+    """
+    Return the exported columns of a table with their Arrow types.
+
+    Args:
+    conn (sqlite3.Connection): Connection to the database.
+    table_name (str): Name of the table.
+
+    Returns:
+    list: (name, type) pairs, INTEGER columns as int64 and all other columns (TEXT, DATE) as strings.
+    """
+    return [(name, pa.int64() if declared_type.upper() == 'INTEGER' else pa.string())
+            for _, name, declared_type, *_ in conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+            if name not in EXCLUDED_COLUMNS]
+
+
+def table_chunks(conn, table_name, columns):
+    """Return the chunks of rows of the given columns of a whole table."""
+    return cursor_chunks(conn.execute(f"SELECT {', '.join(name for name, _ in columns)} FROM {table_name}"))
+
+
+def to_arrow_batch(rows, schema):
+    """Convert a chunk of rows to an Arrow record batch; SQLite may store e.g. a numeric-looking date as a number."""
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        if field.type == pa.string():
+            values = [None if value is None else str(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_rows(chunks, columns, path, export_format, progress=None):
+    """
+    Write chunks of rows to a CSV, gzip-compressed CSV or Parquet file (one row group per chunk).
+
+    Args:
+    chunks (iterator): Lists of rows, e.g. from cursor_chunks.
+    columns (list): (name, Arrow type) pairs of the columns of the rows; CSV only uses the names.
+    path (str): Path of the file.
+    export_format (str): One of EXPORT_FORMATS.
+    progress (function): Called with the number of rows written after every chunk, or None.
+
+    Returns:
+    int: Number of rows written.
+    """
+    rows_written = 0
+    if export_format == 'Parquet':
+        schema = pa.schema(columns)
+        with pq.ParquetWriter(path, schema) as writer:
+            for rows in chunks:
+                writer.write_batch(to_arrow_batch(rows, schema))
+                rows_written += len(rows)
+                if progress:
+                    progress(rows_written)
+        return rows_written
+
+    open_file = gzip.open if export_format == 'CSV (gzip)' else open
+    with open_file(path, 'wt', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow([name for name, _ in columns])
+        for rows in chunks:
+            writer.writerows(rows)
+            rows_written += len(rows)
+            if progress:
+                progress(rows_written)
+    return rows_written
+
+
+def remove_old_exports():
+    """Delete the exports of the pages older than EXPORT_MAX_AGE."""
+    now = time.time()
+    for entry in os.scandir(EXPORT_DIR):
+        if now - entry.stat().st_mtime > EXPORT_MAX_AGE:
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                print(e)
+
+
+def export_button(label, key, file_stem, columns, get_chunks, total_rows):
+    """
+    Show an export format picker and a button that writes the rows to a file on the server with a progress bar,
+    then a button to download the file. The export is kept in session state until `key` shows other rows.
+
+    Args:
+    label (str): Label of the export button.
+    key (tuple): Everything the rows depend on, e.g. the filters of the results.
+    file_stem (str): Name of the downloaded file without extension.
+    columns (list): (name, Arrow type) pairs of the columns of the rows.
+    get_chunks (function): Called with an open database connection, returns the chunks of rows to write.
+    total_rows (int): Number of rows, for the progress bar.
+    """
+    format_column, button_column = st.columns([1, 2])
+    export_format = format_column.selectbox('Export format', list(EXPORT_FORMATS), key=f'export_format_{file_stem}',
+                                            label_visibility='collapsed')
+    extension, mime_type = EXPORT_FORMATS[export_format]
+    export_key = (key, export_format)
+    exports = st.session_state.setdefault('exports', {})
+
+    if button_column.button(label, key=f'export_{file_stem}'):
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        remove_old_exports()
+        path = os.path.join(EXPORT_DIR, f"{file_stem}-{uuid.uuid4().hex}{extension}")
+        progress_bar = st.progress(0.0, text='Exporting...')
+
+        def show_progress(rows_written):
+            progress_bar.progress(min(rows_written / max(total_rows, 1), 1.0),
+                                  text=f'Exported {rows_written:,} of {total_rows:,} rows')
+
+        with read_connection() as conn:
+            write_rows(get_chunks(conn), columns, path, export_format, show_progress)
+        progress_bar.empty()
+        exports[file_stem] = (export_key, path)
+
+    export = exports.get(file_stem)
+    if export and export[0] == export_key and os.path.isfile(export[1]):
+        with open(export[1], 'rb') as file:
+            st.download_button(f'Download {file_stem}{extension} ({os.path.getsize(export[1]) / 1e6:,.1f} MB)', file,
+                               file_name=f'{file_stem}{extension}', mime=mime_type, key=f'download_{file_stem}')
+
+
+def table_export_button(table_name, total_rows):
+    """
+    Show the export of a whole table, see export_button.
+
+    Args:
+    table_name (str): One of EXPORT_TABLES.
+    total_rows (int): Number of rows of the table, for the progress bar.
+    """
+    with read_connection() as conn:
+        columns = table_columns(conn, table_name)
+    export_button(f'Export the whole {table_name} table', database_version(), table_name, columns,
+                  lambda conn: table_chunks(conn, table_name, columns), total_rows)
+
+
+def export_table(conn, table_name, path, export_format):
+    """
+    Write a whole table to a file, streaming it from SQLite in chunks.
+
+    Args:
+    conn (sqlite3.Connection): Connection to the database.
+    table_name (str): One of EXPORT_TABLES.
+    path (str): Path of the file.
+    export_format (str): One of EXPORT_FORMATS.
+
+    Returns:
+    int: Number of rows written.
+    """
+    columns = table_columns(conn, table_name)
+    return write_rows(table_chunks(conn, table_name, columns), columns, path, export_format)
+
+
+def main():
+    """Export a whole table from the command line, e.g. python -m util.export tagged_papers tagged_papers.parquet"""
+    parser = argparse.ArgumentParser(description='Export a table of the database to CSV, gzip-compressed CSV or '
+                                                 'Parquet, chosen by the extension of the output file.')
+    parser.add_argument('table', choices=EXPORT_TABLES)
+    parser.add_argument('output', help=f"Output file ({', '.join(ext for ext, _ in EXPORT_FORMATS.values())})")
+    parser.add_argument('--database', default=DATABASE_PATH)
+    args = parser.parse_args()
+
+    export_format = next((export_format for export_format, (extension, _) in EXPORT_FORMATS.items()
+                          if args.output.endswith(extension)), None)
+    if export_format is None:
+        print(f"Error! The output file must end with one of "
+              f"{', '.join(ext for ext, _ in EXPORT_FORMATS.values())}.")
+        sys.exit(1)
+
+    start_time = time.perf_counter()
+    with read_connection(args.database) as conn:
+        rows_written = export_table(conn, args.table, args.output, export_format)
+    print(f"Exported {rows_written:,} rows of {args.table} to {args.output} in "
+          f"{time.perf_counter() - start_time:.2f}s.")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,14 +2,15 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import sqlite3
+from util.queries import TOPIC_SUBTREE
+from util.database import get_connection, release_connection
 
 
 # Database connection
 def create_connection():
-    """Create and return a database connection."""
+    """Take a connection from the shared pool of read-only connections."""
     try:
-        conn = sqlite3.connect('data/app_data.db')
-        return conn
+        return get_connection()
     except sqlite3.Error as e:
         st.error(f"Error connecting to database: {e}")
         return None
@@ -34,10 +35,54 @@ def fetch_topics():
         st.error(f"Error fetching data from database: {e}")
         return pd.DataFrame()  # Return an empty DataFrame on query error
     finally:
-        conn.close()
+        release_connection(conn)
     return df
 
 
+# Fetching the subtree of one topic, a single range scan over the nested-set intervals of the topics
+@st.cache_data
+def fetch_subtree(topic, version):
+    """Fetch a topic and all of its descendants from the database. Cached per database version, so an updated
+    database is read again.
+
+    Args:
+        topic (str): Label of the topic at the center of the chart.
+        version (tuple): Stamp from database_version (part of the cache key).
+
+    Returns:
+        pd.DataFrame: DataFrame containing the subtree in pre-order, the topic itself first.
+    """
+    conn = create_connection()
+    if conn is None:
+        return pd.DataFrame()
+
+    try:
+        df = pd.read_sql(TOPIC_SUBTREE, conn, params=(topic,))
+    except pd.io.sql.DatabaseError as e:
+        st.error(f"Error fetching data from database: {e}")
+        return pd.DataFrame()
+    finally:
+        release_connection(conn)
+    return df
+
+
+def prepare_subtree_data(df):
+    """Prepare a subtree for the sunburst chart.
+
+    Args:
+        df (pd.DataFrame): DataFrame returned by fetch_subtree.
+
+    Returns:
+        pd.DataFrame: DataFrame prepared for the sunburst chart visualization.
+    """
+    df = df.rename(columns={'prefLabel': 'topic'})
+    # The subtree root is the first row; its broader topic is outside the subtree, so it maps to no parent
+    broader_map = df.set_index('s')['topic'].to_dict()
+    df['parent'] = df['broader'].map(broader_map).fillna('')
+    df.loc[df.index[0], 'parent'] = ''
+    return df[['topic', 'parent']]
+
+
 def prepare_data(df):
     """Prepare data for the sunburst chart.
 
@@ -125,5 +170,25 @@ def main():
         st.plotly_chart(fig, use_container_width=True)
 
 
+# SUBTREE SUNBURST CHART - one topic and its subtopics
+def show_subtree(topic, version):
+    """Display the sunburst chart of a topic and its subtopics.
+
+    Args:
+        topic (str): Label of the topic at the center of the chart.
+        version (tuple): Stamp from database_version, the cache key of the subtree.
+    """
+    df = fetch_subtree(topic, version)
+
+    if df.empty:
+        st.warning(f"The topic '{topic}' is not in the topics-table.")
+        return
+
+    fig = create_sunburst_chart(prepare_subtree_data(df))
+
+    if fig:
+        st.plotly_chart(fig, use_container_width=True)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,61 @@
+import os
+import datetime
+import streamlit as st
+from util.database import DATABASE_PATH, read_connection
+from util.queries import TOPIC_LABELS, DATE_RANGE, MAX_TOPIC_DEPTH, TOPIC_LEVEL_COUNTS, ROW_COUNTS
+
+# METADATA CACHE: the topic list, date bounds, topic level counts and table row counts that the pages need on
+# every rerun. They are loaded once per server process and shared by all sessions, and loaded again when the
+# database file changes.
+
+
+def database_version(path=DATABASE_PATH):
+    """
+    Return a stamp that changes whenever the database is written to.
+
+    Args:
+    path (str): Path of the database file.
+
+    Returns:
+    tuple: Modification times in nanoseconds of the database file and of its write-ahead log (0 if there is none).
+    """
+    stamps = []
+    for file_path in [path, f"{path}-wal"]:
+        stamps.append(os.stat(file_path).st_mtime_ns if os.path.isfile(file_path) else 0)
+    return tuple(stamps)
+
+
+@st.cache_resource(max_entries=1)
+def load_metadata(path, version):
+    """
+    Run the metadata queries on the database. Cached per database version, so a rebuilt database is read again.
+
+    Args:
+    path (str): Path of the database file.
+    version (tuple): Stamp from database_version (part of the cache key).
+
+    Returns:
+    dict: 'topics' (tuple of topic labels), 'start_date' and 'end_date' (datetime of the first and last tagged
+          paper), 'max_topic_depth' (int), 'level_counts' (dict of number of topics by level) and 'row_counts'
+          (dict of number of rows by table).
+    """
+    with read_connection(path) as conn:
+        topics = tuple(row[0] for row in conn.execute(TOPIC_LABELS))
+        start_date_str, end_date_str = conn.execute(DATE_RANGE).fetchone()
+        max_topic_depth = conn.execute(MAX_TOPIC_DEPTH).fetchone()[0] or 0
+        level_counts = dict(conn.execute(TOPIC_LEVEL_COUNTS).fetchall())
+        row_counts = dict(zip(['papers', 'topics', 'tagged_papers'], conn.execute(ROW_COUNTS).fetchone()))
+    print(f"Loaded the metadata of {path}.")
+    return {
+        'topics': topics,
+        'start_date': datetime.datetime.strptime(start_date_str, "%Y-%m-%d"),
+        'end_date': datetime.datetime.strptime(end_date_str, "%Y-%m-%d"),
+        'max_topic_depth': max_topic_depth,
+        'level_counts': level_counts,
+        'row_counts': row_counts,
+    }
+
+
+def get_metadata():
+    """Return the cached metadata of the database, reloading it if the database has changed since."""
+    return load_metadata(DATABASE_PATH, database_version())
@@ -0,0 +1,132 @@
+import os
+import numpy as np
+import streamlit as st
+from util.database import read_connection
+from util.metadata import database_version
+from util.queries import TOPIC_IDS
+from util.snapshot import SNAPSHOT_DIR, array_version
+
+# INVERTED TOPIC INDEX: the sorted ids of the papers tagged with each topic and the day number of each paper,
+# written by data/create_topic_postings.py as memory-mapped arrays (see there for the layout). Boolean topic
+# queries are answered with set operations on the sorted arrays instead of SQL.
+POSTING_ARRAYS = ['indptr', 'papers', 'days']
+
+
+@st.cache_resource(max_entries=1)
+def open_postings(directory, version):
+    """
+    Memory-map the posting arrays and load the id of every topic label.
+
+    Args:
+    directory (str): Directory of the .npy files.
+    version (tuple): Version stamp of the arrays and the database (part of the cache key).
+
+    Returns:
+    dict: The POSTING_ARRAYS and 'topic_ids' (id by label).
+    """
+    postings = {name: np.load(os.path.join(directory, f"postings_{name}.npy"), mmap_mode='r')
+                for name in POSTING_ARRAYS}
+    with read_connection() as conn:
+        postings['topic_ids'] = dict(conn.execute(TOPIC_IDS).fetchall())
+    return postings
+
+
+def get_postings():
+    """Return the inverted topic index, or None if it hasn't been built."""
+    version = array_version('postings')
+    if version is None:
+        return None
+    postings = open_postings(SNAPSHOT_DIR, (version,) + database_version())
+    # Not if the arrays were replaced while they were being mapped
+    return postings if array_version('postings') == version else None
+
+
+def topic_papers(postings, labels):
+    """
+    Return the papers tagged with any of the given topics (OR).
+
+    Args:
+    postings (dict): Index from get_postings.
+    labels (list): Topic labels, e.g. a topic and its descendants.
+
+    Returns:
+    np.ndarray: Sorted paper ids, without duplicates.
+    """
+    indptr, papers = postings['indptr'], postings['papers']
+    # Topics added to the database since the index was written have no posting list yet
+    topic_ids = [postings['topic_ids'][label] for label in labels if label in postings['topic_ids']]
+    topic_ids = [topic_id for topic_id in topic_ids if topic_id < len(indptr) - 1]
+    lists = [papers[indptr[topic_id]:indptr[topic_id + 1]] for topic_id in topic_ids]
+    if len(lists) == 1:
+        return np.asarray(lists[0])
+    return np.unique(np.concatenate(lists)) if lists else np.empty(0, dtype=np.int32)
+
+
+def match_papers(postings, groups, match_all=False, excluded_groups=()):
+    """
+    Answer a boolean topic query: the papers tagged with any (OR) or all (AND) of the groups of topics, and with
+    none of the excluded groups (NOT). A paper matches a group if it is tagged with any topic of the group, so a
+    selected topic and its descendants form one group.
+
+    Args:
+    postings (dict): Index from get_postings.
+    groups (list): Lists of topic labels.
+    match_all (bool): Whether a paper has to match every group instead of any group.
+    excluded_groups (list): Lists of topic labels whose papers are left out.
+
+    Returns:
+    np.ndarray: Sorted paper ids, without duplicates.
+    """
+    if match_all:
+        # Smallest group first, so that every intersection is at most as large as the smallest group
+        group_papers = sorted((topic_papers(postings, labels) for labels in groups), key=len)
+        result = group_papers[0] if group_papers else np.empty(0, dtype=np.int32)
+        for papers in group_papers[1:]:
+            result = np.intersect1d(result, papers, assume_unique=True)
+    else:
+        result = topic_papers(postings, [label for labels in groups for label in labels])
+    excluded = topic_papers(postings, [label for labels in excluded_groups for label in labels])
+    if len(excluded):
+        result = np.setdiff1d(result, excluded, assume_unique=True)
+    return result
+
+
+def newest_first(postings, paper_ids, first_day, last_day):
+    """
+    Keep the papers submitted in a range of days and order them newest first, as the Paper Search pages.
+
+    Args:
+    postings (dict): Index from get_postings.
+    paper_ids (np.ndarray): Sorted paper ids.
+    first_day (int): Day number of the first day of the range.
+    last_day (int): Day number of the last day of the range.
+
+    Returns:
+    tuple: (paper ids, their day numbers), ordered by day and id, both descending.
+    """
+    days = postings['days']
+    paper_ids = paper_ids[paper_ids < len(days)]
+    paper_days = days[paper_ids]
+    in_range = (paper_days >= first_day) & (paper_days <= last_day)
+    paper_ids, paper_days = paper_ids[in_range], paper_days[in_range]
+    order = np.lexsort((paper_ids, paper_days))[::-1]
+    return paper_ids[order], paper_days[order]
+
+
+def page_after(paper_ids, paper_days, cursor_day, cursor_id, size):
+    """
+    Return the papers of a page that starts after a cursor, from papers ordered by newest_first.
+
+    Args:
+    paper_ids (np.ndarray): Paper ids from newest_first.
+    paper_days (np.ndarray): Their day numbers.
+    cursor_day (int): Day number of the last paper of the previous page.
+    cursor_id (int): Id of the last paper of the previous page.
+    size (int): Number of papers of the page.
+
+    Returns:
+    list: Up to `size` paper ids.
+    """
+    after = (paper_days < cursor_day) | ((paper_days == cursor_day) & (paper_ids < cursor_id))
+    start = int(np.argmax(after)) if after.any() else len(paper_ids)
+    return paper_ids[start:start + size].tolist()
@@ -0,0 +1,278 @@
+# PAGE QUERIES: the SQL statements issued by the pages, kept in one place so that their query plans can be
+# checked against a built database (see util/query_plan_guard.py).
+# Statements with a variable number of values in an IN list contain `{placeholders}`, see in_list().
+import re
+
+
+def in_list(values):
+    """
+    Return the `?` placeholders for an IN list with one placeholder per value.
+
+    Parameters:
+    values (list): Values that will be bound to the IN list
+
+    Returns:
+    str: Comma-separated placeholders
+    """
+    return ','.join(['?'] * len(values))
+
+
+def match_expression(text):
+    """
+    Turn a keyword search typed by the user into an FTS5 query that cannot be a syntax error.
+
+    Every word or "quoted phrase" must occur in the paper. Words joined by punctuation ("self-supervised") are
+    searched as a phrase, and a trailing * searches for the words starting with the prefix.
+
+    Parameters:
+    text (str): Keywords typed by the user
+
+    Returns:
+    str: FTS5 query, empty if the text has no words
+    """
+    terms = []
+    for phrase, chunk in re.findall(r'"([^"]*)"?|([^\s"]+)', text):
+        words = re.findall(r"\w+", phrase or chunk)
+        if words:
+            prefix = '*' if chunk.endswith('*') else ''
+            terms.append('"' + ' '.join(words) + '"' + prefix)
+    return ' '.join(terms)
+
+
+# Labels of all topics, for the topic pickers
+TOPIC_LABELS = "SELECT prefLabel FROM topics ORDER BY prefLabel"
+
+# First and last date of the tagged papers. Two scalar subqueries let SQLite answer each with a single
+# lookup in the date index, where `SELECT MIN(date), MAX(date)` would scan the table.
+DATE_RANGE = """
+    SELECT (SELECT date(MIN(date)) FROM tagged_papers), (SELECT date(MAX(date)) FROM tagged_papers)
+"""
+
+# Depth of the deepest topic below a top-level topic, the maximum of the subtopic depth widgets
+MAX_TOPIC_DEPTH = "SELECT (SELECT MAX(level) FROM topics) - (SELECT MIN(level) FROM topics)"
+
+# Labels and synonyms of all topics, for the topic autocomplete (see util/autocomplete.py)
+TOPIC_SYNONYMS = "SELECT prefLabel, altLabel FROM topics"
+
+# Id of each topic label (the lowest id if a label occurs more than once, as in paper_topics)
+TOPIC_IDS = "SELECT prefLabel, MIN(id) FROM topics GROUP BY prefLabel"
+
+# The label of every topic id, to name the columns of the trend counts (see util/trends.py)
+TOPIC_LABELS_BY_ID = "SELECT id, prefLabel FROM topics"
+
+# Number of topics per level, for the topic distribution charts
+TOPIC_LEVEL_COUNTS = "SELECT level, COUNT(*) FROM topics GROUP BY level ORDER BY level"
+
+# Number of rows of the imported tables
+ROW_COUNTS = """
+    SELECT (SELECT COUNT(*) FROM papers), (SELECT COUNT(*) FROM topics), (SELECT COUNT(*) FROM tagged_papers)
+"""
+
+# Every precomputed statistic of the imported tables, for the Datasets pages (see data/create_table_stats.py)
+TABLE_STATS = "SELECT table_name, name, value FROM table_stats"
+
+# The selected topics and their descendants down to a maximum depth. The descendants of a topic are the topics
+# whose nested-set number lo lies in its interval (see data/create_topic_intervals.py), a range scan on idx_topics_lo
+TOPIC_DESCENDANTS = """
+    SELECT DISTINCT d.prefLabel
+    FROM topics x
+    JOIN topics d ON d.lo BETWEEN x.lo AND x.hi
+    WHERE x.prefLabel IN ({placeholders})
+        AND d.tree_level - x.tree_level <= ?
+"""
+
+# TOPIC SEARCH: topic tags per period (week, month, quarter or year) for each of the selected topics and their
+# descendants down to a maximum depth, read from the count cube (see data/create_topic_counts.py) in one query.
+# Buckets are day numbers.
+TOPIC_SERIES_COUNTS = """
+    SELECT t.prefLabel AS topic, c.bucket, SUM(c.tags)
+    FROM topics t
+    JOIN topic_period_counts c ON c.topic_id = t.id
+    WHERE t.prefLabel IN ({placeholders})
+        AND c.period = ?
+        AND c.bucket BETWEEN ? AND ?
+        AND c.depth <= ?
+    GROUP BY t.prefLabel, c.bucket
+"""
+
+# PAPER SEARCH: the results are shown one page at a time, newest first. Pages are read with keyset pagination on
+# (date, id): each page starts after the last paper of the previous one, the cursor, so reading a page never reads
+# the pages before it. The first cursor is (end date, a larger id than any paper).
+
+# Number of papers tagged with any of the given topics in a date range, counted once per filter
+# Parameters: the labels, the start and end date.
+PAPERS_FOR_TOPICS_COUNT = """
+    SELECT COUNT(DISTINCT pt.paper_id)
+    FROM paper_topics pt
+    WHERE pt.topic_id IN (SELECT id FROM topics WHERE prefLabel IN ({placeholders}))
+      AND pt.date BETWEEN ? AND ?
+"""
+
+# A page of the papers tagged with any of the given topics, for results that are a small share of the papers: the
+# matching papers after the start date and up to the cursor date are looked up in paper_topics and sorted.
+# Parameters: the labels, the start date, the cursor date, the cursor date and id, the page size.
+PAPERS_FOR_TOPICS_PAGE = """
+    SELECT tp.id, tp.title, tp.url, strftime('%Y-%m-%d', tp.date) AS date, tp.date
+    FROM tagged_papers tp
+    WHERE tp.id IN (
+        SELECT pt.paper_id
+        FROM paper_topics pt
+        WHERE pt.topic_id IN (SELECT id FROM topics WHERE prefLabel IN ({placeholders}))
+          AND pt.date BETWEEN ? AND ?
+    )
+        AND (tp.date, tp.id) < (?, ?)
+    ORDER BY tp.date DESC, tp.id DESC
+    LIMIT ?
+"""
+
+# The same page for results that are a large share of the papers: the papers are read from the date index
+# backwards from the cursor and kept if one of their topics is given, so a page stops as soon as it is full.
+# Parameters: the labels, the start date, the cursor date and id, the page size.
+PAPERS_FOR_TOPICS_PAGE_BY_DATE = """
+    SELECT tp.id, tp.title, tp.url, strftime('%Y-%m-%d', tp.date) AS date, tp.date
+    FROM tagged_papers tp
+    WHERE EXISTS (
+        SELECT 1
+        FROM paper_topics pt
+        WHERE pt.paper_id = tp.id
+          AND pt.topic_id IN (SELECT id FROM topics WHERE prefLabel IN ({placeholders}))
+    )
+        AND tp.date >= ?
+        AND (tp.date, tp.id) < (?, ?)
+    ORDER BY tp.date DESC, tp.id DESC
+    LIMIT ?
+"""
+
+# The papers of a page found with the inverted topic index (see util/postings.py) or by similarity
+# (see util/similar.py), by id
+PAPERS_BY_ID = """
+    SELECT id, title, url, strftime('%Y-%m-%d', date) AS date, date
+    FROM tagged_papers
+    WHERE id IN ({placeholders})
+"""
+
+# PAPER SEARCH BY KEYWORDS: the papers whose title or abstract match an FTS5 query (see match_expression), best
+# BM25 rank first. The rank column is set up as BM25 with title matches weighted ten times abstract matches, and
+# ordering by it lets FTS5 return the papers in rank order without a sort. The matches in the title and in the best
+# snippet of the abstract are wrapped in char(2) and char(3), which cannot occur in the text, so that the page can
+# escape the text before marking them.
+# Parameters: the FTS5 query, the start and end date and the number of papers.
+PAPERS_MATCHING_KEYWORDS = """
+    SELECT highlight(tagged_papers_fts, 0, char(2), char(3)) AS title, tp.url, strftime('%Y-%m-%d', tp.date) AS date,
+           snippet(tagged_papers_fts, 1, char(2), char(3), '…', 32) AS snippet
+    FROM tagged_papers_fts
+    JOIN tagged_papers tp ON tp.id = tagged_papers_fts.rowid
+    WHERE tagged_papers_fts MATCH ?
+        AND tp.date BETWEEN ? AND ?
+    ORDER BY tagged_papers_fts.rank
+    LIMIT ?
+"""
+
+# The same for the papers tagged with any of the given topics, in the same query: the FTS5 matches are joined
+# to the topic and date filter of PAPERS_FOR_TOPICS_COUNT.
+# Parameters: the FTS5 query, the labels, the start and end date and the number of papers.
+PAPERS_MATCHING_KEYWORDS_FOR_TOPICS = """
+    SELECT highlight(tagged_papers_fts, 0, char(2), char(3)) AS title, tp.url, strftime('%Y-%m-%d', tp.date) AS date,
+           snippet(tagged_papers_fts, 1, char(2), char(3), '…', 32) AS snippet
+    FROM tagged_papers_fts
+    JOIN tagged_papers tp ON tp.id = tagged_papers_fts.rowid
+    WHERE tagged_papers_fts MATCH ?
+        AND tp.id IN (
+            SELECT pt.paper_id
+            FROM paper_topics pt
+            WHERE pt.topic_id IN (SELECT id FROM topics WHERE prefLabel IN ({placeholders}))
+              AND pt.date BETWEEN ? AND ?
+        )
+    ORDER BY tagged_papers_fts.rank
+    LIMIT ?
+"""
+
+# The same among the papers found with the inverted topic index, given by their ids. The unary + keeps FTS5 from
+# looking up the ids one at a time: the matches are read in rank order and filtered by the list until the limit.
+# The rank is returned last so that the best matches of several lists of ids can be merged.
+# Parameters: the FTS5 query, the ids and the number of papers.
+PAPERS_MATCHING_KEYWORDS_BY_ID = """
+    SELECT highlight(tagged_papers_fts, 0, char(2), char(3)) AS title, tp.url, strftime('%Y-%m-%d', tp.date) AS date,
+           snippet(tagged_papers_fts, 1, char(2), char(3), '…', 32) AS snippet, tagged_papers_fts.rank
+    FROM tagged_papers_fts
+    JOIN tagged_papers tp ON tp.id = tagged_papers_fts.rowid
+    WHERE tagged_papers_fts MATCH ?
+        AND +tagged_papers_fts.rowid IN ({placeholders})
+    ORDER BY tagged_papers_fts.rank
+    LIMIT ?
+"""
+
+# TOP TRENDS: the most tagged topics in a date range
+TOP_TOPICS = """
+    SELECT t.prefLabel AS topic, COUNT(*) AS topic_count
+    FROM paper_topics pt
+    JOIN topics t ON t.id = pt.topic_id
+    WHERE pt.date BETWEEN ? AND ?
+    GROUP BY pt.topic_id
+    ORDER BY topic_count DESC
+    LIMIT ?
+"""
+
+# TOPIC TREE: a topic and its subtree in pre-order, for the sunburst charts
+TOPIC_SUBTREE = """
+    SELECT d.s, d.prefLabel, d.broader, d.tree_level
+    FROM topics x
+    JOIN topics d ON d.lo BETWEEN x.lo AND x.hi
+    WHERE x.prefLabel = ?
+    ORDER BY d.lo
+"""
+
+# Every page query by name, checked by the query plan guard
+PAGE_QUERIES = {
+    'topic_labels': TOPIC_LABELS,
+    'date_range': DATE_RANGE,
+    'max_topic_depth': MAX_TOPIC_DEPTH,
+    'topic_synonyms': TOPIC_SYNONYMS,
+    'topic_ids': TOPIC_IDS,
+    'topic_labels_by_id': TOPIC_LABELS_BY_ID,
+    'topic_level_counts': TOPIC_LEVEL_COUNTS,
+    'row_counts': ROW_COUNTS,
+    'table_stats': TABLE_STATS,
+    'topic_descendants': TOPIC_DESCENDANTS,
+    'topic_series_counts': TOPIC_SERIES_COUNTS,
+    'papers_for_topics_count': PAPERS_FOR_TOPICS_COUNT,
+    'papers_for_topics_page': PAPERS_FOR_TOPICS_PAGE,
+    'papers_for_topics_page_by_date': PAPERS_FOR_TOPICS_PAGE_BY_DATE,
+    'papers_by_id': PAPERS_BY_ID,
+    'papers_matching_keywords': PAPERS_MATCHING_KEYWORDS,
+    'papers_matching_keywords_for_topics': PAPERS_MATCHING_KEYWORDS_FOR_TOPICS,
+    'papers_matching_keywords_by_id': PAPERS_MATCHING_KEYWORDS_BY_ID,
+    'top_topics': TOP_TOPICS,
+    'topic_subtree': TOPIC_SUBTREE,
+}
+
+# Queries that read a whole table by design (e.g. to fill a picker), so a full scan is not a regression. The
+# metadata and autocomplete queries run once per server process (see util/metadata.py).
+FULL_SCAN_ALLOWED = {'topic_labels', 'topic_synonyms', 'topic_ids', 'topic_labels_by_id', 'topic_level_counts',
+                     'row_counts', 'table_stats'}
+
+# Temporary B-trees accepted in the plan of a page query, by query and what the B-tree is for, with the reason it is
+# accepted. Any other temporary B-tree fails the guard like a full scan, so a new sort of a large result isn't
+# accepted silently.
+TEMP_BTREE_ALLOWED = {
+    'topic_descendants': {
+        'DISTINCT': "the labels of the subtrees of the selected topics, a few hundred rows at most",
+    },
+    'topic_series_counts': {
+        'GROUP BY': "the count cube rows of the selected topics in the date range, found by primary key",
+    },
+    'papers_for_topics_count': {
+        'count(DISTINCT)': "a paper tagged with several of the topics is counted once; the postings are found by index",
+    },
+    'papers_for_topics_page': {
+        'ORDER BY': "only used for results below BROAD_RESULT_SHARE of the papers (see pages/03_Paper_Search.py); "
+                    "larger results use papers_for_topics_page_by_date, which reads the date index in order",
+    },
+    'top_topics': {
+        'GROUP BY': "SQL fallback of Top Trends, only run until the trend counts are built (see util/trends.py)",
+        'ORDER BY': "sorts one row per topic of the GROUP BY",
+    },
+    'topic_subtree': {
+        'ORDER BY': "one topic's subtree; topics sharing a label have separate intervals, merged by the sort",
+    },
+}
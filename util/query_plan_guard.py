@@ -0,0 +1,209 @@
+# QUERY PLAN GUARD: runs EXPLAIN QUERY PLAN for every page query (util/queries.py) against a built database,
+# flags full table scans and temporary B-trees, and proposes indexes that remove the full scans.
+#
+# Run from the project root:
+#   python -m util.query_plan_guard                 # report, exit status 1 if a page query does a full scan or
+#                                                   # uses a temporary B-tree that isn't in TEMP_BTREE_ALLOWED
+#   python -m util.query_plan_guard --apply         # also create the proposed indexes
+#   python -m util.query_plan_guard --verbose       # also print the query plans
+import argparse
+import itertools
+import re
+import sqlite3
+import sys
+
+from util.queries import PAGE_QUERIES, FULL_SCAN_ALLOWED, TEMP_BTREE_ALLOWED
+
+# Number of values bound to each `{placeholders}` IN list when explaining a query
+SAMPLE_IN_LIST_LENGTH = 3
+
+# Table references in a statement: `FROM table [AS] alias` and `JOIN table [AS] alias`
+TABLE_REFERENCE = re.compile(
+    r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|ON|GROUP|ORDER|LIMIT|LEFT|INNER|CROSS|USING)\b)(\w+))?",
+    re.IGNORECASE)
+
+# Plan steps: `SCAN name [USING [COVERING] INDEX idx]`, a `SEARCH name` that uses no index (how a MIN/MAX
+# over an unindexed column is shown) and `USE TEMP B-TREE FOR ...`
+SCAN_STEP = re.compile(r"^(?:SCAN (\w+)|SEARCH (\w+)$)")
+TEMP_BTREE_STEP = re.compile(r"^USE TEMP B-TREE FOR (.+)$")
+
+
+def expand_query(sql):
+    """Fill the `{placeholders}` IN lists of a page query with sample placeholders."""
+    return sql.format(placeholders=','.join(['?'] * SAMPLE_IN_LIST_LENGTH))
+
+
+def explain(conn, sql):
+    """
+    Return the EXPLAIN QUERY PLAN steps of a statement. The plan doesn't depend on the bound values,
+    so NULL is bound to every parameter.
+    """
+    params = [None] * sql.count('?')
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def get_tables(conn):
+    """Return the names of the ordinary tables in the database."""
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def get_aliases(sql, tables):
+    """Map the table names and aliases used in a statement to the tables they refer to."""
+    aliases = {}
+    for table, alias in TABLE_REFERENCE.findall(sql):
+        if table in tables:
+            aliases[table] = table
+            if alias:
+                aliases[alias] = table
+    return aliases
+
+
+def analyze_plan(plan, aliases):
+    """
+    Find the problems in a query plan.
+
+    Parameters:
+    plan (list): Steps of the query plan
+    aliases (dict): Table names and aliases of the statement, from get_aliases()
+
+    Returns:
+    tuple: (tables that are fully scanned, reasons for temporary B-trees)
+    """
+    full_scans = []
+    temp_btrees = []
+    for step in plan:
+        scan = SCAN_STEP.match(step)
+        name = scan and (scan.group(1) or scan.group(2))
+        # Scans of subqueries, CTEs and virtual tables are not table scans
+        if name in aliases and 'VIRTUAL TABLE' not in step:
+            full_scans.append(aliases[name])
+        temp_btree = TEMP_BTREE_STEP.match(step)
+        if temp_btree:
+            temp_btrees.append(temp_btree.group(1))
+    return full_scans, temp_btrees
+
+
+def get_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def candidate_indexes(conn, sql, table):
+    """
+    Candidate indexes for a scanned table: every column of the table that the statement mentions,
+    and every ordered pair of them.
+    """
+    words = set(re.findall(r"\w+", sql))
+    columns = [column for column in get_columns(conn, table) if column in words]
+    return [(column,) for column in columns] + list(itertools.permutations(columns, 2))
+
+
+def propose_index(conn, sql, table, aliases):
+    """
+    Try the candidate indexes for a fully scanned table one by one (each inside a savepoint that is rolled
+    back) and return the one that removes the scan with the fewest remaining problems and columns.
+
+    Returns:
+    tuple: Columns of the proposed index, or None if no candidate removes the full scan
+    """
+    best = None
+    for columns in candidate_indexes(conn, sql, table):
+        conn.execute("SAVEPOINT index_advisor")
+        try:
+            conn.execute(f"CREATE INDEX index_advisor_candidate ON {table}({', '.join(columns)})")
+            full_scans, temp_btrees = analyze_plan(explain(conn, sql), aliases)
+        finally:
+            conn.execute("ROLLBACK TO index_advisor")
+            conn.execute("RELEASE index_advisor")
+        if table in full_scans:
+            continue
+        score = (len(full_scans), len(temp_btrees), len(columns))
+        if best is None or score < best[0]:
+            best = (score, columns)
+    return best[1] if best else None
+
+
+def index_statement(table, columns):
+    return f"CREATE INDEX IF NOT EXISTS idx_{table}_{'_'.join(columns)} ON {table}({', '.join(columns)});"
+
+
+def check_queries(conn, queries=None, verbose=False):
+    """
+    Check the query plans of the page queries.
+
+    Parameters:
+    conn (sqlite3.Connection): Connection to a built database
+    queries (dict): Page queries by name (default: all of util/queries.py)
+    verbose (bool): Print the query plan of every statement
+
+    Returns:
+    tuple: (names of the queries with a full scan or a temporary B-tree that is not allowed, proposed CREATE INDEX
+            statements)
+    """
+    queries = PAGE_QUERIES if queries is None else queries
+    tables = get_tables(conn)
+    regressions = []
+    proposals = []
+    for name, sql in queries.items():
+        sql = expand_query(sql)
+        aliases = get_aliases(sql, tables)
+        plan = explain(conn, sql)
+        full_scans, temp_btrees = analyze_plan(plan, aliases)
+
+        problems = [f"full scan of {table}" for table in full_scans] + \
+                   [f"temp B-tree for {reason}" for reason in temp_btrees]
+        allowed = name in FULL_SCAN_ALLOWED
+        accepted_btrees = TEMP_BTREE_ALLOWED.get(name, {})
+        new_btrees = [reason for reason in temp_btrees if reason not in accepted_btrees]
+        if not problems:
+            status = 'OK'
+        elif (allowed or not full_scans) and not new_btrees:
+            status = 'OK (' + ', '.join(problems) + ' allowed)'
+        else:
+            status = ', '.join(problems)
+        print(f"{name:<28} {status}")
+        if verbose:
+            for step in plan:
+                print(f"    {step}")
+            for reason in dict.fromkeys(temp_btrees):
+                if reason in accepted_btrees:
+                    print(f"    temp B-tree for {reason} allowed: {accepted_btrees[reason]}")
+
+        if (full_scans and not allowed) or new_btrees:
+            regressions.append(name)
+        if full_scans and not allowed:
+            for table in dict.fromkeys(full_scans):
+                columns = propose_index(conn, sql, table, aliases)
+                if columns is None:
+                    print(f"    no single index removes the full scan of {table}")
+                else:
+                    statement = index_statement(table, columns)
+                    print(f"    proposed: {statement}")
+                    if statement not in proposals:
+                        proposals.append(statement)
+    return regressions, proposals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the query plans of the page queries.")
+    parser.add_argument('--database', default='data/app_data.db')
+    parser.add_argument('--apply', action='store_true', help="create the proposed indexes and check again")
+    parser.add_argument('--verbose', action='store_true', help="print the query plan of every page query")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database, isolation_level=None)
+    regressions, proposals = check_queries(conn, verbose=args.verbose)
+    if args.apply and proposals:
+        for statement in proposals:
+            conn.execute(statement)
+        print(f"Created {len(proposals)} index(es), checking again.")
+        regressions, _ = check_queries(conn, verbose=args.verbose)
+    conn.close()
+
+    if regressions:
+        print(f"Full table scans or temporary B-trees not allowed in: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import os
+import re
+import numpy as np
+import streamlit as st
+from util.metadata import database_version
+from util.snapshot import SNAPSHOT_DIR, array_version
+
+# SIMILAR PAPERS: approximate nearest neighbours of the paper vectors written by data/create_paper_vectors.py
+# (see there for the vectorizer and the layout of the arrays). The vectors have unit length, so the similarity of
+# two papers is the dot product of their vectors. Queries are answered with the IVF index: only the vectors in
+# the NPROBE lists whose centroids are closest to a query are scored.
+VECTOR_ARRAYS = ['matrix', 'paper_ids', 'rows', 'centroids', 'list_indptr', 'terms', 'idf', 'components',
+                 'token_pattern', 'stop_words']
+NPROBE = 32
+SIMILAR_LIMIT = 10
+
+
+def tokenize(index, text):
+    """Split a text into lowercase words with the tokenizer the index was built with."""
+    return [word for word in index['token_regex'].findall((text or '').lower()) if word not in index['stop_word_set']]
+
+
+@st.cache_resource(max_entries=1)
+def open_vector_index(directory, version):
+    """
+    Memory-map the paper vectors and load the rest of the index.
+
+    Args:
+    directory (str): Directory of the .npy files.
+    version (tuple): Version stamp of the arrays and the database (part of the cache key).
+
+    Returns:
+    dict: The VECTOR_ARRAYS (the matrix memory-mapped), 'term_index' (column of each vocabulary term),
+          'token_regex' and 'stop_word_set' (the tokenizer of the papers).
+    """
+    index = {name: np.load(os.path.join(directory, f"vectors_{name}.npy"),
+                           mmap_mode='r' if name == 'matrix' else None)
+             for name in VECTOR_ARRAYS}
+    index['term_index'] = {term: column for column, term in enumerate(index['terms'].tolist())}
+    index['token_regex'] = re.compile(str(index['token_pattern'][0]))
+    index['stop_word_set'] = set(index['stop_words'].tolist())
+    return index
+
+
+def get_vector_index():
+    """Return the paper vector index, or None if it hasn't been built."""
+    version = array_version('vectors')
+    paths = [os.path.join(SNAPSHOT_DIR, f"vectors_{name}.npy") for name in VECTOR_ARRAYS]
+    # An index built before its tokenizer was saved with it is built again by db_manager.py
+    if version is None or not all(os.path.isfile(path) for path in paths):
+        return None
+    index = open_vector_index(SNAPSHOT_DIR, (version,) + database_version())
+    # Not if the arrays were replaced while they were being mapped
+    return index if array_version('vectors') == version else None
+
+
+def vectorize_texts(index, texts):
+    """
+    Vectorize free-text queries like the titles and abstracts of the papers: TF-IDF, LSA components, unit length.
+
+    Args:
+    index (dict): Index from get_vector_index.
+    texts (list): Query texts.
+
+    Returns:
+    np.ndarray: One unit vector per text (a text without known words gives a vector of zeros).
+    """
+    tfidf = np.zeros((len(texts), len(index['terms'])), dtype=np.float32)
+    for row, text in enumerate(texts):
+        columns = [index['term_index'][word] for word in tokenize(index, text) if word in index['term_index']]
+        columns, counts = np.unique(np.array(columns, dtype=np.int64), return_counts=True)
+        tfidf[row, columns] = (1 + np.log(counts)) * index['idf'][columns]
+    vectors = tfidf @ index['components']
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.where(norms > 0, norms, 1)).astype(np.float32)
+
+
+def paper_vectors(index, paper_ids):
+    """
+    Return the stored vectors of some papers.
+
+    Args:
+    index (dict): Index from get_vector_index.
+    paper_ids (list): Paper ids.
+
+    Returns:
+    tuple: (vectors of the papers that have one, their paper ids)
+    """
+    paper_ids = np.asarray(paper_ids, dtype=np.int64)
+    rows = np.full(len(paper_ids), -1)
+    known = paper_ids < len(index['rows'])
+    rows[known] = index['rows'][paper_ids[known]]
+    return np.asarray(index['matrix'][rows[rows >= 0]]), paper_ids[rows >= 0]
+
+
+def merge_top(scores, rows, new_scores, new_rows, k):
+    """Keep the k best of two sets of candidates per query (each row of the arrays is a query)."""
+    scores = np.concatenate([scores, new_scores], axis=1)
+    rows = np.concatenate([rows, new_rows], axis=1)
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, top, axis=1)
+        rows = np.take_along_axis(rows, top, axis=1)
+    return scores, rows
+
+
+def sort_top(scores, rows, index):
+    """Order the candidates of every query by decreasing similarity and translate the rows to paper ids."""
+    order = np.argsort(-scores, axis=1, kind='stable')
+    scores = np.take_along_axis(scores, order, axis=1)
+    rows = np.take_along_axis(rows, order, axis=1)
+    paper_ids = np.where(rows >= 0, index['paper_ids'][np.maximum(rows, 0)], -1)
+    return paper_ids, scores
+
+
+def search(index, queries, k=SIMILAR_LIMIT, nprobe=NPROBE):
+    """
+    Find the approximate k nearest papers of a batch of query vectors with the IVF index.
+
+    The queries are grouped by list: every list probed by any query is read once and scored against all the
+    queries probing it with one matrix product.
+
+    Args:
+    index (dict): Index from get_vector_index.
+    queries (np.ndarray): Unit query vectors, one per row.
+    k (int): Number of papers per query.
+    nprobe (int): Number of lists scored per query.
+
+    Returns:
+    tuple: (paper ids, similarities), both of shape (queries, k), best first; -1 and -inf where fewer than k papers
+           were scored.
+    """
+    centroids, list_indptr, matrix = index['centroids'], index['list_indptr'], index['matrix']
+    nprobe = min(nprobe, len(centroids))
+    probes = np.argpartition(-(queries @ centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+    for list_id in np.unique(probes):
+        start, end = list_indptr[list_id], list_indptr[list_id + 1]
+        if start == end:
+            continue
+        probing = np.flatnonzero((probes == list_id).any(axis=1))
+        scores = queries[probing] @ np.asarray(matrix[start:end]).T
+        rows = np.broadcast_to(np.arange(start, end), scores.shape)
+        best_scores[probing], best_rows[probing] = merge_top(best_scores[probing], best_rows[probing], scores, rows, k)
+    return sort_top(best_scores, best_rows, index)
+
+
+def brute_force_search(index, queries, k=SIMILAR_LIMIT, chunk_rows=100_000):
+    """
+    Find the exact k nearest papers of a batch of query vectors by scoring every paper, the reference search() is
+    measured against.
+
+    Args:
+    index (dict): Index from get_vector_index.
+    queries (np.ndarray): Unit query vectors, one per row.
+    k (int): Number of papers per query.
+    chunk_rows (int): Number of paper vectors scored at a time.
+
+    Returns:
+    tuple: The same as search().
+    """
+    matrix = index['matrix']
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+    for start in range(0, len(matrix), chunk_rows):
+        scores = queries @ np.asarray(matrix[start:start + chunk_rows]).T
+        rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        best_scores, best_rows = merge_top(best_scores, best_rows, scores, rows, k)
+    return sort_top(best_scores, best_rows, index)
+
+
+def recall_at_k(approximate_ids, exact_ids):
+    """
+    Return the share of the exact k nearest papers that the approximate search found, averaged over the queries.
+
+    Args:
+    approximate_ids (np.ndarray): Paper ids from search().
+    exact_ids (np.ndarray): Paper ids from brute_force_search() for the same queries and k.
+
+    Returns:
+    float: Recall@k between 0 and 1.
+    """
+    found = [len(set(approximate[approximate >= 0]) & set(exact[exact >= 0])) / max((exact >= 0).sum(), 1)
+             for approximate, exact in zip(approximate_ids, exact_ids)]
+    return float(np.mean(found)) if found else 0.0
+
+
+def similar_papers(index, queries, k=SIMILAR_LIMIT, exclude_ids=None):
+    """
+    Find the papers most similar to each query, leaving out e.g. the paper a query was taken from.
+
+    Args:
+    index (dict): Index from get_vector_index.
+    queries (np.ndarray): Unit query vectors, one per row.
+    k (int): Number of papers per query.
+    exclude_ids (list): One paper id per query to leave out of its results, or None.
+
+    Returns:
+    list: For every query, a list of (paper id, similarity), best first.
+    """
+    paper_ids, scores = search(index, queries, k + (exclude_ids is not None))
+    results = []
+    for row, (ids, similarities) in enumerate(zip(paper_ids.tolist(), scores.tolist())):
+        excluded = exclude_ids[row] if exclude_ids is not None else None
+        results.append([(paper_id, similarity) for paper_id, similarity in zip(ids, similarities)
+                        if paper_id >= 0 and paper_id != excluded][:k])
+    return results
@@ -0,0 +1,26 @@
+import os
+import numpy as np
+
+# Directory of the memory-mapped arrays written by the data/create_*.py builders (co-occurrence, postings, trend
+# counts and paper vectors), relative to the project root the app is started from
+SNAPSHOT_DIR = 'data/snapshot'
+
+
+def array_version(prefix, directory=SNAPSHOT_DIR):
+    """
+    Return the version stamp of a group of arrays, written by data/snapshot_arrays.py after all of its files.
+
+    The stamp is missing while the files are being replaced, so a page that keys its cache on the stamp and checks
+    it again after mapping the files never keeps a mix of old and new arrays.
+
+    Parameters:
+    prefix (str): Name of the group, e.g. 'trends'.
+    directory (str): Directory of the .npy files.
+
+    Returns:
+    int: The stamp, or None if the arrays haven't been built or are being replaced.
+    """
+    try:
+        return int(np.load(os.path.join(directory, f"{prefix}_version.npy"))[0])
+    except (OSError, ValueError, IndexError):
+        return None
@@ -0,0 +1,51 @@
+import json
+import sqlite3
+import pandas as pd
+import streamlit as st
+from util.database import read_connection
+from util.metadata import database_version
+from util.queries import TABLE_STATS
+
+# TABLE STATISTICS: row counts, column names, distinct counts, distributions and sample rows of the imported tables,
+# precomputed by data/create_table_stats.py whenever the database is built or updated. The Datasets pages render
+# from them with one small query, however large the tables are.
+
+
+@st.cache_data(max_entries=1)
+def load_table_stats(version):
+    """
+    Read the statistics of all tables. Cached per database version, so an updated database is read again.
+
+    Args:
+    version (tuple): Stamp from database_version (part of the cache key).
+
+    Returns:
+    dict: The statistics of each table by name (see data/create_table_stats.py), or None if they haven't been built.
+    """
+    try:
+        with read_connection() as conn:
+            rows = conn.execute(TABLE_STATS).fetchall()
+    except sqlite3.OperationalError as e:
+        print(e)
+        return None
+    stats = {}
+    for table_name, name, value in rows:
+        stats.setdefault(table_name, {})[name] = json.loads(value)
+    return stats
+
+
+def get_table_stats(table_name):
+    """Return the statistics of a table, or None if they haven't been built."""
+    stats = load_table_stats(database_version())
+    return stats.get(table_name) if stats else None
+
+
+def sample_frame(stats):
+    """Return the sample rows of a table as a DataFrame with its column names."""
+    return pd.DataFrame(stats['sample'], columns=stats['columns'])
+
+
+def show_missing_stats(table_name):
+    """Tell the user the statistics of a table haven't been built yet."""
+    st.warning(f"The statistics of the {table_name} table haven't been built yet. Run "
+               "`python db_manager.py --migrate` in the data folder to build them.")
@@ -0,0 +1,28 @@
+import pandas as pd
+from util.encodings import PERIOD_FREQUENCIES
+
+
+def series_frame(data, topics, period):
+    """
+    Turn the rows of TOPIC_SERIES_COUNTS into one column per topic over a shared index of periods.
+
+    Periods without papers are filled with 0 for all topics at once, with a single reindex over every
+    period from the first to the last one in the data.
+
+    Args:
+    data (list): (topic, bucket, count) rows, buckets being day numbers.
+    topics (list): The selected topics, in the order of the columns.
+    period (str): 'week', 'month', 'quarter' or 'year'.
+
+    Returns:
+    pd.DataFrame: Counts indexed by the first day of each period, with a column for each topic that has data.
+    """
+    df = pd.DataFrame(data, columns=['topic', 'period', 'count'])
+    if df.empty:
+        return pd.DataFrame()
+    df['period'] = pd.to_datetime(df['period'], unit='D')
+    wide = df.pivot(index='period', columns='topic', values='count')
+    all_periods = pd.date_range(start=wide.index.min(), end=wide.index.max(), freq=PERIOD_FREQUENCIES[period],
+                                name='period')
+    wide = wide.reindex(index=all_periods, columns=[topic for topic in topics if topic in wide.columns])
+    return wide.fillna(0).astype(int)
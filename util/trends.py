@@ -0,0 +1,203 @@
+import os
+import numpy as np
+import streamlit as st
+from util.database import read_connection
+from util.metadata import database_version
+from util.queries import TOPIC_LABELS_BY_ID
+from util.snapshot import SNAPSHOT_DIR, array_version
+
+# TREND COUNTS: the cumulative number of tags of every topic per day, written by data/create_trend_counts.py as
+# memory-mapped arrays (see there for the layout). The tags of all topics in any range of days are the difference
+# of two rows, so Top Trends costs the same for a week and for the whole date range.
+TREND_ARRAYS = ['cumulative', 'topic_ids', 'first_day']
+
+# The same counts rolled up to the topics of each level, a paper counted once per topic however many of its
+# descendants it is tagged with (see data/create_trend_counts.py)
+ROLLUP_ARRAYS = ['cumulative', 'topic_ids', 'levels']
+
+
+@st.cache_resource(max_entries=1)
+def open_trend_counts(directory, version):
+    """
+    Memory-map the cumulative counts and load the label of every column.
+
+    Args:
+    directory (str): Directory of the .npy files.
+    version (tuple): Version stamps of the trend and rolled-up arrays and the database (part of the cache key).
+
+    Returns:
+    dict: The TREND_ARRAYS, 'first_day' as an int, 'labels' (np.ndarray of the label of each column) and
+          'rollup' (the ROLLUP_ARRAYS with their 'labels', or None if they haven't been built).
+    """
+    trends = {name: np.load(os.path.join(directory, f"trends_{name}.npy"), mmap_mode='r') for name in TREND_ARRAYS}
+    trends['first_day'] = int(trends['first_day'][0])
+    with read_connection() as conn:
+        labels_by_id = dict(conn.execute(TOPIC_LABELS_BY_ID).fetchall())
+    trends['labels'] = np.array([labels_by_id.get(int(topic_id), str(topic_id)) for topic_id in trends['topic_ids']],
+                                dtype=object)
+    trends['rollup'] = None
+    if array_version('rollup', directory) is not None:
+        rollup = {name: np.load(os.path.join(directory, f"rollup_{name}.npy"), mmap_mode='r') for name in ROLLUP_ARRAYS}
+        rollup['labels'] = np.array([labels_by_id.get(int(topic_id), str(topic_id))
+                                     for topic_id in rollup['topic_ids']], dtype=object)
+        trends['rollup'] = rollup
+    return trends
+
+
+def get_trend_counts():
+    """Return the cumulative trend counts, or None if they haven't been built."""
+    version = (array_version('trends'), array_version('rollup'))
+    if version[0] is None:
+        return None
+    trends = open_trend_counts(SNAPSHOT_DIR, version + database_version())
+    # Not if the arrays were replaced while they were being mapped
+    return trends if (array_version('trends'), array_version('rollup')) == version else None
+
+
+def level_counts(trends, level):
+    """
+    Return the counts rolled up to the topics of a level, in the form of the trend counts so that top_topics and
+    emerging_scores work on them unchanged.
+
+    Args:
+    trends (dict): Counts from get_trend_counts.
+    level (int): topics.level to roll up to.
+
+    Returns:
+    dict: 'cumulative', 'topic_ids', 'first_day' and 'labels' of the topics of the level (views of the arrays), or
+          None if the rolled-up counts haven't been built.
+    """
+    rollup = trends['rollup']
+    if rollup is None:
+        return None
+    # The columns are ordered by level
+    start, end = np.searchsorted(rollup['levels'], [level, level + 1])
+    return {'cumulative': rollup['cumulative'][:, start:end], 'topic_ids': rollup['topic_ids'][start:end],
+            'first_day': trends['first_day'], 'labels': rollup['labels'][start:end]}
+
+
+def range_counts(trends, first_day, last_day):
+    """
+    Return the number of tags of every topic in a range of days.
+
+    Args:
+    trends (dict): Counts from get_trend_counts.
+    first_day (int): Day number of the first day of the range.
+    last_day (int): Day number of the last day of the range.
+
+    Returns:
+    np.ndarray: The count of each column (0 for a range outside the days of the counts).
+    """
+    cumulative = trends['cumulative']
+    # Row i holds the counts before day first_day + i, so the range is rows [first_day, last_day + 1)
+    start = min(max(first_day - trends['first_day'], 0), len(cumulative) - 1)
+    end = min(max(last_day + 1 - trends['first_day'], 0), len(cumulative) - 1)
+    if end <= start:
+        return np.zeros(cumulative.shape[1], dtype=np.int64)
+    return cumulative[end].astype(np.int64) - cumulative[start]
+
+
+def top_topics(trends, first_day, last_day, number_topics):
+    """
+    Return the most tagged topics in a range of days, like the TOP_TOPICS query.
+
+    Args:
+    trends (dict): Counts from get_trend_counts.
+    first_day (int): Day number of the first day of the range.
+    last_day (int): Day number of the last day of the range.
+    number_topics (int): Number of topics.
+
+    Returns:
+    list: (topic, count) of up to number_topics topics with tags in the range, most tagged first.
+    """
+    counts = range_counts(trends, first_day, last_day)
+    number_topics = min(number_topics, len(counts))
+    if number_topics <= 0:
+        return []
+    # The top columns in any order, then only those sorted (by count, then label for ties)
+    top = np.argpartition(-counts, number_topics - 1)[:number_topics]
+    top = top[counts[top] > 0]
+    top = sorted(top.tolist(), key=lambda column: (-counts[column], trends['labels'][column]))
+    return [(trends['labels'][column], int(counts[column])) for column in top]
+
+
+# EMERGING TOPICS: topics ranked by momentum instead of by count. The window of the user is compared with the
+# previous windows of the same length for every topic at once: growth is the relative change from the previous
+# window, acceleration the change of the growth, and momentum the z-score of the window against the topic's own
+# history of up to EMERGING_HISTORY windows, so a small topic that suddenly doubles ranks above a large one that
+# grows as usual.
+EMERGING_HISTORY = 12
+
+# Tags a topic needs in the window to be ranked, so that 1 -> 3 tags isn't an emerging topic
+EMERGING_MIN_TAGS = 5
+
+
+def window_counts(trends, last_day, window_days, windows):
+    """
+    Return the tags of every topic in consecutive windows of days ending on a day, newest first.
+
+    Args:
+    trends (dict): Counts from get_trend_counts.
+    last_day (int): Day number of the last day of the newest window.
+    window_days (int): Number of days of each window.
+    windows (int): Number of windows.
+
+    Returns:
+    np.ndarray: Counts of shape (windows, columns); windows outside the days of the counts have none.
+    """
+    cumulative = trends['cumulative']
+    # The boundaries of the windows are windows + 1 rows of the cumulative counts, read with one fancy index
+    boundaries = last_day + 1 - trends['first_day'] - window_days * np.arange(windows + 1)
+    rows = cumulative[np.clip(boundaries, 0, len(cumulative) - 1)].astype(np.int64)
+    return rows[:-1] - rows[1:]
+
+
+def emerging_scores(trends, first_day, last_day, history=EMERGING_HISTORY):
+    """
+    Compute the growth, acceleration and momentum of every topic in a range of days.
+
+    Args:
+    trends (dict): Counts from get_trend_counts.
+    first_day (int): Day number of the first day of the range.
+    last_day (int): Day number of the last day of the range.
+    history (int): Maximum number of previous windows the momentum compares the range with.
+
+    Returns:
+    dict: 'count', 'growth', 'acceleration' and 'momentum' arrays (one value per column), or None if there are
+          fewer than two complete windows of the same length before the range.
+    """
+    window_days = last_day - first_day + 1
+    history = min(history, (first_day - trends['first_day']) // window_days)
+    if window_days <= 0 or history < 2:
+        return None
+    counts = window_counts(trends, last_day, window_days, history + 1)
+    current, previous, before = counts[0], counts[1], counts[2]
+    growth = (current + 1) / (previous + 1) - 1
+    acceleration = growth - ((previous + 1) / (before + 1) - 1)
+    past = counts[1:]
+    # A floor of one tag on the deviation keeps topics with a flat history from dominating
+    momentum = (current - past.mean(axis=0)) / np.maximum(past.std(axis=0), 1.0)
+    return {'count': current, 'growth': growth, 'acceleration': acceleration, 'momentum': momentum}
+
+
+def top_emerging(trends, scores, number_topics):
+    """
+    Return the topics with the highest momentum and at least EMERGING_MIN_TAGS tags in the range.
+
+    Args:
+    trends (dict): Counts from get_trend_counts.
+    scores (dict): Scores from emerging_scores.
+    number_topics (int): Number of topics.
+
+    Returns:
+    list: (topic, count, growth, acceleration, momentum) of up to number_topics topics, highest momentum first.
+    """
+    candidates = np.flatnonzero(scores['count'] >= EMERGING_MIN_TAGS)
+    number_topics = min(number_topics, len(candidates))
+    if number_topics <= 0:
+        return []
+    momentum = scores['momentum'][candidates]
+    top = candidates[np.argpartition(-momentum, number_topics - 1)[:number_topics]]
+    top = sorted(top.tolist(), key=lambda column: (-scores['momentum'][column], trends['labels'][column]))
+    return [(trends['labels'][column], int(scores['count'][column]), float(scores['growth'][column]),
+             float(scores['acceleration'][column]), float(scores['momentum'][column])) for column in top]